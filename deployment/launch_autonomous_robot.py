@@ -7,6 +7,7 @@ Usage: python3 launch_autonomous_robot.py
 """
 
 import asyncio
+import math
 import sys
 import yaml
 import logging
@@ -18,6 +19,9 @@ sys.path.insert(0, str(Path(__file__).parent / 'src'))
 from perception.sensor_manager import SensorManager
 from action.motor_controller import MotorController, MotorDirection
 from action.led_controller import LEDController, LEDExpression
+from action.odometry import DeadReckoningOdometry
+from memory.slam_system import SLAMSystem
+from cognitive.path_planner import PathPlanner
 
 # Setup logging
 logging.basicConfig(
@@ -33,6 +37,13 @@ async def load_config():
         config = yaml.safe_load(f)
     return config
 
+def heading_error_to_path(slam_system, path, lookahead_px: int) -> float:
+    """Angle (rad, + = left) between the robot heading and a waypoint lookahead_px cells along the path"""
+    target_x, target_y = path[min(len(path) - 1, lookahead_px)]
+    x, y = slam_system.robot_position
+    desired = math.atan2(target_y - y, target_x - x)
+    return (desired - slam_system.robot_orientation + math.pi) % (2 * math.pi) - math.pi
+
 async def autonomous_robot_life():
     """Ciclo di vita autonomo del robot"""
     logger.info("🤖 ROBOT AI - AUTONOMOUS LIFE BEGINS!")
@@ -47,6 +58,24 @@ async def autonomous_robot_life():
     led_controller = LEDController(config)
     sensor_manager = SensorManager(config, simulation_mode=False)
 
+    # Spatial memory
+    slam_system = SLAMSystem(config, simulation_mode=False)
+
+    # Odometry: dead reckoning from every motor command → SLAM pose deltas
+    odometry = DeadReckoningOdometry(config)
+    motor_controller.add_command_callback(odometry.on_motor_command)
+    odometry.attach_slam(slam_system)
+
+    # Navigation: D* Lite toward the nearest frontier, repaired as the map changes
+    planner = PathPlanner(config)
+    planner.attach_slam(slam_system)
+    navigation_config = config.get('ai', {}).get('navigation', {})
+    lookahead_px = max(1, int(navigation_config.get('lookahead', 0.3) / slam_system.map_resolution))
+    goal_tolerance_px = navigation_config.get('goal_tolerance', 0.2) / slam_system.map_resolution
+    heading_tolerance = math.radians(navigation_config.get('heading_tolerance_deg', 20.0))
+    frontier_candidates = navigation_config.get('frontier_candidates', 5)
+    goal = None
+
     try:
         # Initialize all systems
         logger.info("🔧 Initializing robot consciousness...")
@@ -68,6 +97,7 @@ async def autonomous_robot_life():
 
         sensor_manager.set_arduino_serial(motor_controller)
         await sensor_manager.initialize()
+        await odometry.start()
 
         # Clear any emergency stops
         await motor_controller.resume_from_emergency()
@@ -92,6 +122,9 @@ async def autonomous_robot_life():
 
             logger.info(f"👁️ Perception: Distance={distance:.1f}cm, Light={[int(l) for l in light_levels]}")
 
+            # Update map + light memory with the current reading
+            await slam_system.update_position(distance, light_levels)
+
             # 2. Decide behavior based on environment
             if distance < 15.0:
                 # EMERGENCY - Too close to obstacle!
@@ -117,42 +150,85 @@ async def autonomous_robot_life():
                 logger.info("⚠️ Obstacle detected - intelligent navigation")
                 await led_controller.set_expression(LEDExpression.ALERT)
 
-                # Decide turn direction based on light levels (basic intelligence)
-                left_light = sum(light_levels[:2]) / 2
-                right_light = sum(light_levels[2:]) / 2
+                # Decide turn direction based on remembered light around the robot
+                remembered = slam_system.get_light_around()
+                if remembered['left'] is not None and remembered['right'] is not None:
+                    left_light, right_light = remembered['left'], remembered['right']
+                    light_source = "light map"
+                else:
+                    # Area not seen yet - fall back to the current photoresistor reading
+                    left_light = sum(light_levels[:2]) / 2
+                    right_light = sum(light_levels[2:]) / 2
+                    light_source = "sensors"
 
                 if left_light > right_light:
-                    logger.info("💡 Brighter on left - turning left toward light")
+                    logger.info(f"💡 Brighter on left ({light_source}) - turning left toward light")
                     await motor_controller.turn_left(speed=25)
                 else:
-                    logger.info("💡 Brighter on right - turning right toward light")
+                    logger.info(f"💡 Brighter on right ({light_source}) - turning right toward light")
                     await motor_controller.turn_right(speed=25)
 
                 await asyncio.sleep(1.2)
                 await motor_controller.stop()
 
             else:
-                # Path clear - explore forward!
-                logger.info("✅ Path clear - curious exploration forward")
-                await led_controller.set_expression(LEDExpression.CURIOUS)
-
-                # Vary speed based on confidence (distance)
-                if distance > 200:
-                    speed = 35  # Confident speed
-                    duration = 2.0
-                    logger.info("🚀 High confidence - fast exploration")
+                # Path clear - follow the plan toward the nearest frontier
+                position = tuple(slam_system.robot_position)
+                path = []
+                if goal is not None and math.hypot(goal[0] - position[0], goal[1] - position[1]) <= goal_tolerance_px:
+                    logger.info(f"🏁 Frontier reached at {goal}")
+                    goal = None
+                if goal is None:
+                    # Nearest reachable frontier not already under the robot
+                    for frontier in slam_system.nearest_frontiers(frontier_candidates):
+                        candidate = frontier['goal']
+                        if math.hypot(candidate[0] - position[0], candidate[1] - position[1]) <= goal_tolerance_px:
+                            continue
+                        path = planner.plan(position, candidate)
+                        if path:
+                            goal = candidate
+                            logger.info(f"🗺️ New goal: frontier at {goal} ({len(path)} cells)")
+                            break
                 else:
-                    speed = 25  # Cautious speed
-                    duration = 1.5
-                    logger.info("🐾 Moderate confidence - careful advance")
-
-                await motor_controller.move_forward(speed=speed)
-                await asyncio.sleep(duration)
-                await motor_controller.stop()
-
-                # Estimate distance traveled
-                estimated_distance = (speed / 40.0) * duration * 10  # Rough estimate
-                total_distance_traveled += estimated_distance
+                    path = planner.replan(position)
+                    if not path:
+                        logger.info(f"🚧 Frontier at {goal} no longer reachable - choosing another one")
+                        goal = None
+
+                heading_error = heading_error_to_path(slam_system, path, lookahead_px) if path else 0.0
+                if abs(heading_error) > heading_tolerance:
+                    # Turn toward the next waypoint (duration from the odometry calibration)
+                    direction = 'TURN_LEFT' if heading_error > 0 else 'TURN_RIGHT'
+                    turn_rate = math.radians(odometry.calibration.velocity(direction, 25))
+                    duration = min(1.5, abs(heading_error) / max(turn_rate, 1e-3))
+                    logger.info(f"🧭 Turning {math.degrees(heading_error):+.0f}° toward the path")
+                    if heading_error > 0:
+                        await motor_controller.turn_left(speed=25)
+                    else:
+                        await motor_controller.turn_right(speed=25)
+                    await asyncio.sleep(duration)
+                    await motor_controller.stop()
+                else:
+                    logger.info("✅ Path clear - curious exploration forward")
+                    await led_controller.set_expression(LEDExpression.CURIOUS)
+
+                    # Vary speed based on confidence (distance)
+                    if distance > 200:
+                        speed = 35  # Confident speed
+                        duration = 2.0
+                        logger.info("🚀 High confidence - fast exploration")
+                    else:
+                        speed = 25  # Cautious speed
+                        duration = 1.5
+                        logger.info("🐾 Moderate confidence - careful advance")
+
+                    await motor_controller.move_forward(speed=speed)
+                    await asyncio.sleep(duration)
+                    await motor_controller.stop()
+
+                    # Estimate distance traveled
+                    estimated_distance = (speed / 40.0) * duration * 10  # Rough estimate
+                    total_distance_traveled += estimated_distance
 
             # 3. Brief pause for sensor stabilization
             await asyncio.sleep(0.5)
@@ -200,10 +276,16 @@ async def autonomous_robot_life():
         # Safe shutdown
         logger.info("🛑 Stopping autonomous exploration...")
         await motor_controller.stop()
+        await odometry.stop()
         await led_controller.set_expression(LEDExpression.RESTING)
         await asyncio.sleep(2.0)
         await led_controller.set_expression(LEDExpression.OFF)
         await motor_controller.shutdown()
+        # Save the map (incremental flush + final map + library) once the robot is safe
+        try:
+            await slam_system.cleanup()
+        except Exception as e:
+            logger.error(f"❌ SLAM cleanup error: {e}")
         logger.info("😴 Robot AI going to sleep... Goodbye!")
 
 async def main():
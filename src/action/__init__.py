@@ -8,6 +8,7 @@ The action system handles all physical interactions including:
 - Safety monitoring and emergency stops
 - Movement primitives and sequences
 - Hardware interface abstraction
+- Dead reckoning odometry from motor commands
 
 This module controls all robot actuators and physical responses.
 """
@@ -16,6 +17,7 @@ from .motor_controller import MotorController, MotorDirection, MotorState
 from .led_controller import LEDController, LEDExpression
 from .safety_monitor import SafetyMonitor, SafetyLevel, SafetyAlert
 from .hardware_integration import HardwareIntegrationManager
+from .odometry import DeadReckoningOdometry, SpeedCalibration
 
 __all__ = [
     'MotorController',
@@ -26,5 +28,7 @@ __all__ = [
     'SafetyMonitor',
     'SafetyLevel',
     'SafetyAlert',
-    'HardwareIntegrationManager'
+    'HardwareIntegrationManager',
+    'DeadReckoningOdometry',
+    'SpeedCalibration'
 ]
\ No newline at end of file
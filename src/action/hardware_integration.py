@@ -7,6 +7,7 @@ Coordina tutti i componenti hardware del robot:
 - Safety Monitor (sicurezza in tempo reale)
 - Sensor Manager (integrazione sensori)
 - Arduino Serial Communication (protocollo unificato)
+- Odometry (dead reckoning dai comandi motore → SLAM)
 
 Fornisce interfaccia unificata per il sistema AI high-level.
 Design: Async coordination con safety-first approach.
@@ -20,6 +21,7 @@ from typing import Dict, Any, Optional
 from .motor_controller import MotorController, MotorDirection
 from .led_controller import LEDController, LEDExpression
 from .safety_monitor import SafetyMonitor, SafetyLevel
+from .odometry import DeadReckoningOdometry
 
 
 class HardwareIntegrationManager:
@@ -34,6 +36,10 @@ class HardwareIntegrationManager:
         self.led_controller = LEDController(config)
         self.safety_monitor = SafetyMonitor(config)
 
+        # Odometria: ascolta tutti i comandi motore
+        self.odometry = DeadReckoningOdometry(config)
+        self.motor_controller.add_command_callback(self.odometry.on_motor_command)
+
         # Sensor manager (from perception system)
         self.sensor_manager = sensor_manager
 
@@ -60,6 +66,8 @@ class HardwareIntegrationManager:
 
             self.logger.info("🚀 Starting hardware integration initialization...")
 
+            await self.odometry.start()
+
             if self.simulation_mode:
                 self.logger.info("📱 Simulation mode - skipping hardware initialization")
                 self.is_initialized = True
@@ -284,6 +292,9 @@ class HardwareIntegrationManager:
                 # Motor status
                 status['motor'] = await self.motor_controller.get_status()
 
+                # Odometry pose
+                status['odometry'] = self.odometry.get_pose()
+
                 # LED status
                 status['led'] = await self.led_controller.get_status()
 
@@ -306,6 +317,11 @@ class HardwareIntegrationManager:
             self.logger.error(f"Error getting system status: {e}")
             return {'error': str(e)}
 
+    def set_slam_system(self, slam_system):
+        """Collega SLAM per ricevere i delta di posa dell'odometria"""
+        self.odometry.attach_slam(slam_system)
+        self.logger.info("Odometry connected to SLAM system")
+
     def is_ready(self) -> bool:
         """Check se il sistema è pronto per operazioni"""
         return self.is_initialized and self.is_operational
@@ -333,6 +349,9 @@ class HardwareIntegrationManager:
             if self.motor_controller:
                 await self.motor_controller.shutdown()
 
+            if self.odometry:
+                await self.odometry.stop()
+
             if self.sensor_manager:
                 await self.sensor_manager.cleanup()
 
@@ -14,7 +14,7 @@ Commands: MOVE_FORWARD, MOVE_BACKWARD, TURN_LEFT, TURN_RIGHT, STOP, SET_SPEED
 import asyncio
 import json
 import logging
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, Tuple, Callable, List
 from dataclasses import dataclass
 from enum import Enum
 
@@ -69,9 +69,15 @@ class MotorController:
 
         # Connection management
         self._connection_lock = asyncio.Lock()
+        # Una richiesta/risposta alla volta sulla seriale: sweep sonar, letture
+        # sensori e comandi motori girano in task diversi
+        self._serial_lock = asyncio.Lock()
         self._command_queue = asyncio.Queue()
         self._is_emergency_stopped = False
 
+        # Callbacks per ogni comando eseguito (odometria, logging)
+        self._command_callbacks: List[Callable] = []
+
         self.logger.info(f"MotorController initialized - Port: {self.serial_port}")
 
     async def initialize(self) -> bool:
@@ -136,6 +142,8 @@ class MotorController:
                         return "ACTION:STOP"
                     elif "SET_SPEED" in command:
                         return "ACTION:SPEED_SET:50"
+                    elif "SERVO" in command:
+                        return f"ACTION:SERVO_ANGLE:{command.split(':', 1)[1]}"
                     elif "STATUS" in command:
                         return 'STATUS:{"speed":50,"uptime":12345,"free_memory":1500}'
                 return "OK"
@@ -144,28 +152,33 @@ class MotorController:
                 self.logger.error("Serial connection not available")
                 return None
 
-            # Invia comando
-            command_bytes = f"{command}\n".encode('utf-8')
-            self.serial_connection.write(command_bytes)
-            self.serial_connection.flush()
+            # Invia comando e leggi la sua risposta senza interleaving con altri task
+            async with self._serial_lock:
+                # Risposte rimaste di comandi senza expect_response: non sono di questo comando
+                if expect_response and self.serial_connection.in_waiting > 0:
+                    self.serial_connection.reset_input_buffer()
+
+                command_bytes = f"{command}\n".encode('utf-8')
+                self.serial_connection.write(command_bytes)
+                self.serial_connection.flush()
 
-            self.logger.debug(f"→ Sent: {command}")
+                self.logger.debug(f"→ Sent: {command}")
 
-            if expect_response:
-                # Leggi risposta con timeout - loop più veloce per Arduino
-                start_time = asyncio.get_event_loop().time()
-                response = ""
+                if expect_response:
+                    # Leggi risposta con timeout - loop più veloce per Arduino
+                    start_time = asyncio.get_event_loop().time()
+                    response = ""
 
-                while (asyncio.get_event_loop().time() - start_time) < timeout:
-                    if self.serial_connection.in_waiting > 0:
-                        line = self.serial_connection.readline().decode('utf-8').strip()
-                        if line:
-                            response = line
-                            self.logger.debug(f"← Received: {response}")
-                            break
-                    await asyncio.sleep(0.001)  # 1ms invece di 10ms per responsività
+                    while (asyncio.get_event_loop().time() - start_time) < timeout:
+                        if self.serial_connection.in_waiting > 0:
+                            line = self.serial_connection.readline().decode('utf-8').strip()
+                            if line:
+                                response = line
+                                self.logger.debug(f"← Received: {response}")
+                                break
+                        await asyncio.sleep(0.001)  # 1ms invece di 10ms per responsività
 
-                return response if response else None
+                    return response if response else None
 
             return None
 
@@ -193,6 +206,7 @@ class MotorController:
             self.motor_state.direction = MotorDirection.FORWARD
             self.motor_state.is_moving = True
             self.motor_state.last_command_time = asyncio.get_event_loop().time()
+            await self._notify_command()
 
             self.logger.info(f"✅ Moving forward at speed {effective_speed}")
             return True
@@ -218,6 +232,7 @@ class MotorController:
             self.motor_state.direction = MotorDirection.BACKWARD
             self.motor_state.is_moving = True
             self.motor_state.last_command_time = asyncio.get_event_loop().time()
+            await self._notify_command()
 
             self.logger.info(f"✅ Moving backward at speed {effective_speed}")
             return True
@@ -242,6 +257,7 @@ class MotorController:
             self.motor_state.direction = MotorDirection.TURN_LEFT
             self.motor_state.is_moving = True
             self.motor_state.last_command_time = asyncio.get_event_loop().time()
+            await self._notify_command()
 
             self.logger.info(f"✅ Turning left at speed {effective_speed}")
             return True
@@ -266,6 +282,7 @@ class MotorController:
             self.motor_state.direction = MotorDirection.TURN_RIGHT
             self.motor_state.is_moving = True
             self.motor_state.last_command_time = asyncio.get_event_loop().time()
+            await self._notify_command()
 
             self.logger.info(f"✅ Turning right at speed {effective_speed}")
             return True
@@ -281,6 +298,7 @@ class MotorController:
             self.motor_state.direction = MotorDirection.STOP
             self.motor_state.is_moving = False
             self.motor_state.last_command_time = asyncio.get_event_loop().time()
+            await self._notify_command()
 
             self.logger.info("✅ Motors stopped")
             return True
@@ -297,12 +315,28 @@ class MotorController:
 
         if response and "ACTION:SPEED_SET" in response:
             self.motor_state.speed = clamped_speed
+            if self.motor_state.is_moving:
+                self.motor_state.last_command_time = asyncio.get_event_loop().time()
+                await self._notify_command()
             self.logger.info(f"✅ Speed set to {clamped_speed}")
             return True
         else:
             self.logger.error(f"❌ Set speed command failed")
             return False
 
+    async def set_servo_angle(self, angle: int, timeout: float = 2.0) -> bool:
+        """Ruota il servo del sensore ultrasonico (0-180°, 90 = frontale)"""
+        clamped_angle = max(0, min(int(angle), 180))
+
+        response = await self._send_command(f"SERVO:{clamped_angle}", expect_response=True, timeout=timeout)
+
+        if response and "ACTION:SERVO_ANGLE" in response:
+            self.logger.debug(f"✅ Servo at {clamped_angle}°")
+            return True
+        else:
+            self.logger.warning(f"❌ Servo command failed: {response}")
+            return False
+
     async def emergency_stop(self) -> bool:
         """Emergency stop - priorità massima"""
         self.logger.warning("🚨 EMERGENCY STOP ACTIVATED")
@@ -357,6 +391,22 @@ class MotorController:
         else:
             return False
 
+    def add_command_callback(self, callback: Callable):
+        """Aggiungi callback(direction, speed, timestamp) chiamata dopo ogni comando eseguito"""
+        self._command_callbacks.append(callback)
+
+    async def _notify_command(self):
+        """Notifica callbacks con direzione, velocità e timestamp del comando corrente"""
+        for callback in self._command_callbacks:
+            try:
+                args = (self.motor_state.direction, self.motor_state.speed, self.motor_state.last_command_time)
+                if asyncio.iscoroutinefunction(callback):
+                    await callback(*args)
+                else:
+                    callback(*args)
+            except Exception as e:
+                self.logger.error(f"Error in command callback: {e}")
+
     def get_motor_state(self) -> MotorState:
         """Ritorna stato corrente motori"""
         return self.motor_state
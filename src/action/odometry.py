@@ -0,0 +1,370 @@
+"""
+Odometry - Dead reckoning dai comandi motore per Robot AI
+
+Stima la posa del robot integrando i comandi inviati al MotorController:
+- Ascolta ogni MOVE/TURN/STOP/SET_SPEED con timestamp e velocità
+- Converte speed PWM → velocità reale tramite tabella di calibrazione
+- Integra la posa (x, y, theta) e fa crescere la covarianza col movimento
+- Invia i delta di posa allo SLAM ad alta frequenza (default 50Hz)
+
+La calibrazione si stima offline da corse registrate:
+  python3 src/action/odometry.py fit runs.json [--output data/models/odometry_calibration.json]
+
+Formato runs.json: lista di {"direction": "MOVE_FORWARD", "speed": 40,
+"duration": 2.0, "measured_distance_cm": 41.5} (oppure "measured_rotation_deg"
+per TURN_LEFT/TURN_RIGHT).
+"""
+
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+LINEAR_DIRECTIONS = ('MOVE_FORWARD', 'MOVE_BACKWARD')
+ANGULAR_DIRECTIONS = ('TURN_LEFT', 'TURN_RIGHT')
+
+# Segno del movimento per direzione: (avanti, rotazione). TURN_LEFT = antiorario
+_DIRECTION_SIGNS = {
+    'MOVE_FORWARD': (1.0, 0.0),
+    'MOVE_BACKWARD': (-1.0, 0.0),
+    'TURN_LEFT': (0.0, 1.0),
+    'TURN_RIGHT': (0.0, -1.0),
+    'STOP': (0.0, 0.0),
+}
+
+
+class SpeedCalibration:
+    """Tabella speed PWM → velocità (cm/s per movimenti lineari, gradi/s per rotazioni)"""
+
+    def __init__(self, tables: Dict[str, Tuple[List[float], List[float]]]):
+        # direction → (speeds crescenti, velocità)
+        self.tables = {
+            direction: (np.asarray(speeds, dtype=np.float64), np.asarray(values, dtype=np.float64))
+            for direction, (speeds, values) in tables.items()
+        }
+
+    @classmethod
+    def from_motion_model(cls, motion_config: Dict[str, Any]) -> 'SpeedCalibration':
+        """Tabella lineare dai coefficienti ai.slam.motion_model (default non calibrato)"""
+        linear = motion_config.get('linear_cm_s_per_speed', 0.5)
+        angular = motion_config.get('angular_deg_s_per_speed', 2.25)
+
+        tables = {}
+        for direction in LINEAR_DIRECTIONS:
+            tables[direction] = ([0.0, 255.0], [0.0, linear * 255.0])
+        for direction in ANGULAR_DIRECTIONS:
+            tables[direction] = ([0.0, 255.0], [0.0, angular * 255.0])
+        return cls(tables)
+
+    @classmethod
+    def fit_from_runs(cls, runs: List[Dict[str, Any]],
+                      fallback: Optional['SpeedCalibration'] = None) -> 'SpeedCalibration':
+        """
+        Stima la tabella da corse registrate con misura reale.
+
+        Per ogni (direzione, speed) la velocità è il rapporto dei minimi quadrati
+        sum(misura * durata) / sum(durata²), robusto a corse di durata diversa.
+        """
+        samples: Dict[str, Dict[float, List[Tuple[float, float]]]] = {}
+
+        for run in runs:
+            direction = run['direction']
+            duration = float(run['duration'])
+            if duration <= 0:
+                continue
+
+            if direction in LINEAR_DIRECTIONS:
+                measured = abs(float(run['measured_distance_cm']))
+            elif direction in ANGULAR_DIRECTIONS:
+                measured = abs(float(run['measured_rotation_deg']))
+            else:
+                continue
+
+            samples.setdefault(direction, {}).setdefault(float(run['speed']), []).append((duration, measured))
+
+        tables = dict(fallback.tables) if fallback else {}
+        for direction, by_speed in samples.items():
+            speeds = [0.0]
+            values = [0.0]
+            for speed in sorted(by_speed):
+                durations, measures = np.array(by_speed[speed]).T
+                speeds.append(speed)
+                values.append(float(np.dot(measures, durations) / np.dot(durations, durations)))
+            tables[direction] = (speeds, values)
+
+        return cls(tables)
+
+    def velocity(self, direction: str, speed: float) -> float:
+        """Velocità (senza segno) per direzione e speed, interpolata linearmente"""
+        if direction not in self.tables:
+            return 0.0
+        speeds, values = self.tables[direction]
+        if speed > speeds[-1] and len(speeds) >= 2:
+            # Estrapolazione lineare oltre l'ultimo punto misurato
+            slope = (values[-1] - values[-2]) / max(speeds[-1] - speeds[-2], 1e-9)
+            return float(values[-1] + slope * (speed - speeds[-1]))
+        return float(np.interp(speed, speeds, values))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            direction: {'speeds': speeds.tolist(), 'values': values.tolist()}
+            for direction, (speeds, values) in self.tables.items()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SpeedCalibration':
+        return cls({direction: (entry['speeds'], entry['values']) for direction, entry in data.items()})
+
+    def save(self, path: str):
+        filepath = Path(path)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> 'SpeedCalibration':
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+class DeadReckoningOdometry:
+    """Odometria dead reckoning alimentata dai comandi del MotorController"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+
+        odometry_config = config.get('hardware', {}).get('odometry', {})
+        motion_config = config.get('ai', {}).get('slam', {}).get('motion_model', {})
+
+        self.update_rate = odometry_config.get('update_rate', 50)  # Hz
+        self.calibration_file = odometry_config.get('calibration_file', 'data/models/odometry_calibration.json')
+
+        # Rumore: deviazione standard proporzionale al movimento
+        self.translation_noise = motion_config.get('translation_noise', 0.1)  # frazione di ds
+        self.rotation_noise = motion_config.get('rotation_noise', 0.15)       # frazione di dθ
+
+        # Calibrazione (file se presente, altrimenti modello lineare da config)
+        self.calibration = SpeedCalibration.from_motion_model(motion_config)
+        if Path(self.calibration_file).exists():
+            try:
+                self.calibration = SpeedCalibration.load(self.calibration_file)
+                self.logger.info(f"✅ Odometry calibration loaded: {self.calibration_file}")
+            except Exception as e:
+                self.logger.error(f"Failed to load odometry calibration: {e}")
+
+        # Posa nel frame odometria: cm, cm, radianti
+        self.pose = np.zeros(3)
+        self.covariance = np.zeros((3, 3))
+
+        # Comando corrente (timestamp su clock monotonic, come asyncio loop.time())
+        self.current_direction = 'STOP'
+        self.current_speed = 0
+        self.last_integration_time = time.monotonic()
+
+        # Delta accumulato dall'ultimo push allo SLAM (frame robot) e secondi di moto
+        self._pending_translation = 0.0
+        self._pending_rotation = 0.0
+        self._pending_time = 0.0
+
+        # Log comandi per registrare corse di calibrazione
+        self.command_log = deque(maxlen=10000)
+
+        self.slam_system = None
+        self._update_task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            'commands_received': 0,
+            'integration_steps': 0,
+            'slam_pushes': 0,
+            'total_distance_cm': 0.0,
+            'total_rotation_deg': 0.0
+        }
+
+        self.logger.info(f"DeadReckoningOdometry initialized - {self.update_rate}Hz")
+
+    def attach_slam(self, slam_system):
+        """Collega SLAMSystem a cui inviare i delta di posa"""
+        self.slam_system = slam_system
+
+    def on_motor_command(self, direction: str, speed: int, timestamp: Optional[float] = None):
+        """
+        Callback per MotorController: registra un nuovo comando.
+
+        Integra il movimento del comando precedente fino a timestamp,
+        poi passa al nuovo comando.
+        """
+        direction = getattr(direction, 'value', direction)
+        timestamp = time.monotonic() if timestamp is None else timestamp
+
+        self.integrate(timestamp)
+
+        self.current_direction = direction
+        self.current_speed = speed
+        self.command_log.append((timestamp, direction, speed))
+        self.stats['commands_received'] += 1
+
+    def integrate(self, until: Optional[float] = None):
+        """Integra la posa con il comando corrente fino all'istante until"""
+        until = time.monotonic() if until is None else until
+        dt = until - self.last_integration_time
+        if dt <= 0:
+            return
+        self.last_integration_time = until
+
+        forward_sign, turn_sign = _DIRECTION_SIGNS.get(self.current_direction, (0.0, 0.0))
+        if forward_sign == 0.0 and turn_sign == 0.0:
+            return
+
+        velocity = self.calibration.velocity(self.current_direction, self.current_speed)
+        ds = forward_sign * velocity * dt
+        dtheta = turn_sign * math.radians(velocity) * dt
+
+        self._apply_motion(ds, dtheta)
+        self._pending_time += dt
+
+    def _apply_motion(self, ds: float, dtheta: float):
+        """Aggiorna posa e covarianza con un movimento (ds cm, dtheta rad)"""
+        x, y, theta = self.pose
+        heading = theta + 0.5 * dtheta
+        cos_h = math.cos(heading)
+        sin_h = math.sin(heading)
+
+        self.pose = np.array([x + ds * cos_h, y + ds * sin_h, theta + dtheta])
+
+        # Propagazione covarianza: Σ' = Jx Σ Jxᵀ + Ju Q Juᵀ
+        jx = np.array([[1.0, 0.0, -ds * sin_h],
+                       [0.0, 1.0, ds * cos_h],
+                       [0.0, 0.0, 1.0]])
+        ju = np.array([[cos_h, 0.0],
+                       [sin_h, 0.0],
+                       [0.0, 1.0]])
+        q = np.diag([(self.translation_noise * ds) ** 2,
+                     (self.rotation_noise * dtheta) ** 2])
+        self.covariance = jx @ self.covariance @ jx.T + ju @ q @ ju.T
+
+        self._pending_translation += ds
+        self._pending_rotation += dtheta
+
+        self.stats['integration_steps'] += 1
+        self.stats['total_distance_cm'] += abs(ds)
+        self.stats['total_rotation_deg'] += abs(math.degrees(dtheta))
+
+    def push_to_slam(self):
+        """Invia allo SLAM il delta accumulato dall'ultimo push"""
+        if self.slam_system is None:
+            return
+        if self._pending_translation == 0.0 and self._pending_rotation == 0.0:
+            return
+
+        self.slam_system.apply_odometry(self._pending_translation, self._pending_rotation, self._pending_time)
+        self._pending_translation = 0.0
+        self._pending_rotation = 0.0
+        self._pending_time = 0.0
+        self.stats['slam_pushes'] += 1
+
+    async def start(self):
+        """Avvia loop di integrazione ad alta frequenza"""
+        if self._update_task and not self._update_task.done():
+            return
+        self.last_integration_time = time.monotonic()
+        self._update_task = asyncio.create_task(self._update_loop())
+        self.logger.info("✅ Odometry update loop started")
+
+    async def _update_loop(self):
+        period = 1.0 / self.update_rate
+        while True:
+            try:
+                self.integrate()
+                self.push_to_slam()
+            except Exception as e:
+                self.logger.error(f"Error in odometry loop: {e}")
+            await asyncio.sleep(period)
+
+    async def stop(self):
+        """Ferma loop di integrazione"""
+        if self._update_task:
+            self._update_task.cancel()
+            try:
+                await self._update_task
+            except asyncio.CancelledError:
+                pass
+            self._update_task = None
+
+    def reset(self, pose: Tuple[float, float, float] = (0.0, 0.0, 0.0)):
+        """Reset posa odometria e covarianza"""
+        self.pose = np.array(pose, dtype=np.float64)
+        self.covariance = np.zeros((3, 3))
+        self._pending_translation = 0.0
+        self._pending_rotation = 0.0
+        self._pending_time = 0.0
+
+    def get_pose(self) -> Dict[str, Any]:
+        """Posa corrente con incertezza"""
+        return {
+            'x_cm': float(self.pose[0]),
+            'y_cm': float(self.pose[1]),
+            'theta_degrees': math.degrees(float(self.pose[2])),
+            'position_std_cm': math.sqrt(max(0.0, self.covariance[0, 0] + self.covariance[1, 1])),
+            'theta_std_degrees': math.degrees(math.sqrt(max(0.0, self.covariance[2, 2]))),
+            'current_command': self.current_direction,
+            'current_speed': self.current_speed
+        }
+
+    def save_command_log(self, path: str):
+        """Salva log comandi (per associare misure reali e calibrare offline)"""
+        filepath = Path(path)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, 'w') as f:
+            json.dump([
+                {'timestamp': t, 'direction': direction, 'speed': speed}
+                for t, direction, speed in self.command_log
+            ], f, indent=2)
+
+
+def main():
+    """CLI calibrazione offline"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Odometry calibration from recorded runs")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fit_parser = subparsers.add_parser('fit', help='Fit speed→velocity table from runs JSON')
+    fit_parser.add_argument('runs', help='JSON file with recorded runs')
+    fit_parser.add_argument('--output', default='data/models/odometry_calibration.json')
+    fit_parser.add_argument('--config', default='config/robot_config.yaml',
+                            help='Config with ai.slam.motion_model (fallback for directions without runs)')
+
+    args = parser.parse_args()
+
+    with open(args.runs, 'r') as f:
+        runs = json.load(f)
+
+    # Stesso modello di DeadReckoningOdometry per le direzioni senza corse registrate
+    motion_config = {}
+    if Path(args.config).exists():
+        import yaml
+        with open(args.config, 'r') as f:
+            config = yaml.safe_load(f) or {}
+        motion_config = config.get('ai', {}).get('slam', {}).get('motion_model', {})
+    else:
+        print(f"Config {args.config} not found - default motion model")
+
+    calibration = SpeedCalibration.fit_from_runs(runs, fallback=SpeedCalibration.from_motion_model(motion_config))
+    calibration.save(args.output)
+
+    print(f"Calibration saved to {args.output}")
+    for direction, (speeds, values) in calibration.tables.items():
+        unit = 'cm/s' if direction in LINEAR_DIRECTIONS else 'deg/s'
+        points = ', '.join(f"{s:.0f}→{v:.1f}" for s, v in zip(speeds, values))
+        print(f"  {direction} ({unit}): {points}")
+
+
+if __name__ == "__main__":
+    main()
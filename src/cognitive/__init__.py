@@ -13,13 +13,13 @@ This module represents the "brain" of the robot.
 """
 
 from .learning_agent import LearningAgent
+from .path_planner import PathPlanner
 # from .decision_engine import DecisionEngine     # TODO: Implementare
 # from .behavior_tree import BehaviorTree         # TODO: Implementare
-# from .path_planner import PathPlanner           # TODO: Implementare
 
 __all__ = [
-    'LearningAgent'
+    'LearningAgent',
+    'PathPlanner'
     # 'DecisionEngine',    # TODO: Aggiungere quando implementato
     # 'BehaviorTree',      # TODO: Aggiungere quando implementato  
-    # 'PathPlanner'        # TODO: Aggiungere quando implementato
 ]
\ No newline at end of file
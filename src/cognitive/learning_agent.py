@@ -49,6 +49,15 @@ class LearningAgent:
         self.epsilon_end = self.config.get('epsilon_end', 0.01)       # Esplorazione finale bassa
         self.epsilon_decay = self.config.get('epsilon_decay', 0.995)  # Riduzione graduale
         self.gamma = 0.95  # Discount factor per reward futuri
+        self.curiosity_weight = self.config.get('curiosity_weight', 0.2)  # Reward intrinseco per zone nuove
+        self.change_weight = self.config.get('change_weight', 0.1)        # Reward intrinseco per zone cambiate
+        
+        # Soglie novità/cambiamento condivise con l'emotion engine (sezione behavior)
+        behavior_config = config.get('behavior', {})
+        novelty_config = behavior_config.get('novelty', {})
+        self.new_area_threshold = novelty_config.get('new_area_threshold', 0.7)
+        self.familiar_area_threshold = novelty_config.get('familiar_area_threshold', 0.3)
+        self.map_change_threshold = behavior_config.get('map_change', {}).get('changed_threshold', 0.5)
         
         # Stato corrente
         self.current_epsilon = self.epsilon_start
@@ -124,6 +133,19 @@ class LearningAgent:
                     else:
                         discretized[key] = 'bright'
                         
+                elif key == 'novelty':
+                    # Discretizza novità zona: new, seen, familiar
+                    if value >= self.new_area_threshold:
+                        discretized[key] = 'new'
+                    elif value > self.familiar_area_threshold:
+                        discretized[key] = 'seen'
+                    else:
+                        discretized[key] = 'familiar'
+                        
+                elif key == 'map_change':
+                    # Discretizza cambiamento mappa: changed, stable
+                    discretized[key] = 'changed' if value >= self.map_change_threshold else 'stable'
+                        
                 elif key == 'battery_level':
                     # Discretizza batteria: low, medium, high
                     if value < 30:
@@ -143,6 +165,20 @@ class LearningAgent:
         sorted_items = sorted(discretized.items())
         return json.dumps(sorted_items, sort_keys=True)
     
+    def intrinsic_reward(self, situation: Dict[str, Any]) -> float:
+        """
+        Reward di curiosità: premia trovarsi in zone poco visitate
+        o dove la mappa è appena cambiata.
+        
+        Args:
+            situation: Situazione con chiavi 'novelty' e 'map_change' (0-1, da SLAM)
+            
+        Returns:
+            float: Bonus da sommare al reward esterno
+        """
+        return (self.curiosity_weight * situation.get('novelty', 0.0)
+                + self.change_weight * situation.get('map_change', 0.0))
+    
     async def choose_action(self, situation: Dict[str, Any], 
                           available_actions: List[str] = None) -> Tuple[str, bool]:
         """
@@ -197,7 +233,8 @@ class LearningAgent:
                                   action: str,
                                   reward: float,
                                   next_situation: Dict[str, Any] = None,
-                                  done: bool = False) -> bool:
+                                  done: bool = False,
+                                  intrinsic_reward: float = 0.0) -> bool:
         """
         Impara da un'esperienza (aggiorna Q-values).
         
@@ -207,12 +244,15 @@ class LearningAgent:
             reward: Reward ricevuto (-1.0 to +1.0)
             next_situation: Situazione risultante (opzionale)
             done: True se episodio terminato
+            intrinsic_reward: Bonus curiosità (vedi intrinsic_reward()):
+                              entra nel Q-value ma non nell'esito del task
             
         Returns:
             bool: True se learning riuscito
         """
         try:
             situation_hash = self._hash_situation(situation)
+            reward = reward + intrinsic_reward
             
             # Assicura che situazione sia nella Q-table
             if situation_hash not in self.q_table:
@@ -323,6 +363,18 @@ class LearningAgent:
         except Exception as e:
             self.logger.error(f"Errore experience replay: {e}")
     
+    def predict_outcome(self, situation: Dict[str, Any], action: str) -> Optional[Dict[str, Any]]:
+        """
+        Esito previsto di un'azione dai pattern di sequenza del database
+        (ricerca in memoria, niente query sulla storia).
+        
+        Returns:
+            Dict: predicted_outcome, success_rate, avg_reward, ... o None
+        """
+        if self.experience_db is None:
+            return None
+        return self.experience_db.predict_outcome(situation, action)
+    
     async def get_action_recommendations(self, situation: Dict[str, Any], 
                                        top_k: int = 3) -> List[Dict[str, Any]]:
         """
@@ -340,12 +392,12 @@ class LearningAgent:
         if situation_hash not in self.q_table:
             # Situazione mai vista: raccomandazioni neutre
             return [
-                {
+                self._with_prediction(situation, {
                     'action': action,
                     'q_value': 0.0,
                     'confidence': 0.0,
                     'recommendation_reason': 'unexplored_situation'
-                }
+                })
                 for action in self.actions[:top_k]
             ]
         
@@ -371,15 +423,23 @@ class LearningAgent:
             else:
                 reason = 'negative_experience'
             
-            recommendations.append({
+            recommendations.append(self._with_prediction(situation, {
                 'action': action,
                 'q_value': q_value,
                 'confidence': confidence,
                 'recommendation_reason': reason
-            })
+            }))
         
         return recommendations
     
+    def _with_prediction(self, situation: Dict[str, Any], recommendation: Dict[str, Any]) -> Dict[str, Any]:
+        """Aggiunge alla raccomandazione l'esito previsto dai pattern (se noto)."""
+        pattern = self.predict_outcome(situation, recommendation['action'])
+        if pattern is not None:
+            recommendation['predicted_outcome'] = pattern['predicted_outcome']
+            recommendation['pattern_success_rate'] = pattern['success_rate']
+        return recommendation
+    
     async def get_learning_statistics(self) -> Dict[str, Any]:
         """Ottieni statistiche complete di apprendimento."""
         # Calcola diverse metriche
@@ -517,6 +577,10 @@ async def test_learning_agent():
     
     agent = LearningAgent(config)
     
+    # Soglie novità dalla sezione behavior (come l'emotion engine)
+    tuned = LearningAgent({**config, 'behavior': {'novelty': {'new_area_threshold': 0.9}}})
+    assert '"seen"' in tuned._hash_situation({'novelty': 0.8}) and '"new"' in agent._hash_situation({'novelty': 0.8})
+    
     print("Simulando 200 episodi di apprendimento...")
     
     # Simula episodi di apprendimento
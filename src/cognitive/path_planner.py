@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Path Planner - Robot AI Cognitive System
+========================================
+
+Pianificatore di percorsi sulla griglia dello SLAM (D* Lite).
+Il robot può finalmente "andare in un punto" invece di reagire solo
+alla distanza davanti a sé.
+
+In parole semplici:
+- La mappa viene trasformata in una "costmap": gli ostacoli vengono
+  gonfiati della dimensione del robot, e vicino ai muri costa di più passare
+- D* Lite cerca il percorso dal goal verso il robot e si ricorda i costi
+- Quando il sensore scopre un nuovo ostacolo, si ripara solo la parte di
+  percorso interessata invece di ricominciare da zero
+- Se il robot si muove, il piano esistente resta valido (niente ricerca completa)
+
+Author: Andrea Vavassori
+"""
+
+import heapq
+import logging
+import math
+import time
+from typing import Dict, List, Tuple, Optional, Any
+import numpy as np
+from scipy import ndimage
+
+INF = float('inf')
+SQRT2 = math.sqrt(2.0)
+
+# 8-connessione: (dx, dy, lunghezza passo)
+_MOVES = [(1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+          (1, 1, SQRT2), (1, -1, SQRT2), (-1, 1, SQRT2), (-1, -1, SQRT2)]
+
+
+class PathPlanner:
+    """
+    Planner D* Lite su costmap con ostacoli gonfiati.
+
+    Costo cella:
+    - inf: ostacolo o troppo vicino per il raggio del robot
+    - 1.0: spazio libero lontano dagli ostacoli
+    - >1.0: zona di inflazione (decresce con la distanza) o sconosciuto
+    """
+
+    def __init__(self, config: dict):
+        self.config = config.get('ai', {}).get('navigation', {})
+        self.logger = logging.getLogger(__name__)
+
+        map_resolution = config.get('ai', {}).get('slam', {}).get('map_resolution', 0.05)
+
+        # Parametri costmap (metri → pixel)
+        self.robot_radius_px = self.config.get('robot_radius', 0.12) / map_resolution
+        self.inflation_radius_px = self.config.get('inflation_radius', 0.35) / map_resolution
+        self.inflation_weight = self.config.get('inflation_weight', 4.0)
+        self.unknown_cost = self.config.get('unknown_cost', 2.0)
+        self.max_path_length = self.config.get('max_path_length', 20000)
+
+        # Costmap (impostata da set_map)
+        self.map_size: Optional[Tuple[int, int]] = None
+        self.costmap: Optional[np.ndarray] = None
+        self._cost_flat: Optional[np.ndarray] = None
+        self._grid_ref: Optional[np.ndarray] = None
+        self._width = 0
+
+        # Stato D* Lite (nodi = indici piatti x * width + y)
+        self.start: Optional[int] = None
+        self.goal: Optional[int] = None
+        self._last_start: Optional[int] = None
+        self.km = 0.0
+        self.g: Dict[int, float] = {}
+        self.rhs: Dict[int, float] = {}
+        self._open: List[Tuple[float, float, int]] = []
+        self._open_keys: Dict[int, Tuple[float, float]] = {}
+
+        # Celle cambiate in attesa (accumulate dallo SLAM, applicate al replan)
+        self._pending_x: List[np.ndarray] = []
+        self._pending_y: List[np.ndarray] = []
+
+        self.stats = {
+            'plans': 0,
+            'replans': 0,
+            'expansions': 0,
+            'last_plan_ms': 0.0,
+            'last_replan_ms': 0.0,
+            'cost_changes': 0
+        }
+
+        self.logger.info(f"PathPlanner inizializzato - Robot radius: {self.robot_radius_px:.1f}px, "
+                         f"inflation: {self.inflation_radius_px:.1f}px")
+
+    # ------------------------------------------------------------------
+    # Costmap
+    # ------------------------------------------------------------------
+
+    def set_map(self, grid_map: np.ndarray):
+        """Costruisce la costmap completa da una griglia di occupazione."""
+        self.map_size = grid_map.shape
+        self._width = grid_map.shape[1]
+        self._grid_ref = grid_map
+        self.costmap = self._compute_costs(grid_map)
+        self._cost_flat = self.costmap.ravel()
+        self._pending_x.clear()
+        self._pending_y.clear()
+
+    def attach_slam(self, slam_system):
+        """Usa la mappa dello SLAM e ricevi le celle che cambiano."""
+        self.set_map(slam_system.grid_map)
+        slam_system.add_map_listener(self.on_cells_changed)
+
+    def on_cells_changed(self, grid_map: np.ndarray, xs: np.ndarray, ys: np.ndarray):
+        """Callback SLAM: accumula le celle cambiate (applicate al prossimo replan)."""
+        self._pending_x.append(np.asarray(xs))
+        self._pending_y.append(np.asarray(ys))
+        self._grid_ref = grid_map
+
+    def _compute_costs(self, grid_map: np.ndarray) -> np.ndarray:
+        """Costi per una griglia (o una finestra della griglia)."""
+        occupied = grid_map == 1
+
+        # Distanza euclidea dall'ostacolo più vicino (pixel)
+        if np.any(occupied):
+            distance = ndimage.distance_transform_edt(~occupied)
+        else:
+            distance = np.full(grid_map.shape, INF)
+
+        costs = np.ones(grid_map.shape, dtype=np.float64)
+        costs[grid_map == -1] = self.unknown_cost
+
+        # Inflazione: costo decrescente tra raggio robot e raggio inflazione
+        band = (distance > self.robot_radius_px) & (distance < self.inflation_radius_px)
+        span = max(self.inflation_radius_px - self.robot_radius_px, 1e-6)
+        costs[band] += self.inflation_weight * (1.0 - (distance[band] - self.robot_radius_px) / span)
+
+        costs[distance <= self.robot_radius_px] = np.inf
+        return costs
+
+    def _apply_pending_changes(self) -> int:
+        """Applica le modifiche accumulate, una finestra locale per ogni batch."""
+        total_changed = 0
+        pending = list(zip(self._pending_x, self._pending_y))
+        self._pending_x.clear()
+        self._pending_y.clear()
+
+        for xs, ys in pending:
+            if xs.size:
+                total_changed += self._update_costs_around(xs, ys)
+        return total_changed
+
+    def _update_costs_around(self, xs: np.ndarray, ys: np.ndarray) -> int:
+        """Aggiorna la costmap solo attorno alle celle cambiate e ripara D* Lite."""
+        grid_map = self._grid_ref
+
+        # Finestra interna: celle il cui costo può cambiare
+        margin = int(math.ceil(self.inflation_radius_px)) + 1
+        x0 = max(0, int(xs.min()) - margin)
+        x1 = min(self.map_size[0], int(xs.max()) + margin + 1)
+        y0 = max(0, int(ys.min()) - margin)
+        y1 = min(self.map_size[1], int(ys.max()) + margin + 1)
+
+        # Finestra esterna: include tutti gli ostacoli che influenzano la finestra interna
+        ox0 = max(0, x0 - margin)
+        ox1 = min(self.map_size[0], x1 + margin)
+        oy0 = max(0, y0 - margin)
+        oy1 = min(self.map_size[1], y1 + margin)
+
+        window_costs = self._compute_costs(grid_map[ox0:ox1, oy0:oy1])
+        new_costs = window_costs[x0 - ox0:x1 - ox0, y0 - oy0:y1 - oy0]
+        old_costs = self.costmap[x0:x1, y0:y1]
+
+        changed_x, changed_y = np.nonzero(new_costs != old_costs)
+        if changed_x.size == 0:
+            return 0
+
+        self.costmap[x0:x1, y0:y1] = new_costs
+        changed_x += x0
+        changed_y += y0
+        self.stats['cost_changes'] += int(changed_x.size)
+
+        # Ripara D* Lite: rhs delle celle cambiate e dei loro vicini
+        if self.goal is not None:
+            affected = set()
+            width = self._width
+            for cx, cy in zip(changed_x.tolist(), changed_y.tolist()):
+                affected.add(cx * width + cy)
+                for dx, dy, _ in _MOVES:
+                    nx = cx + dx
+                    ny = cy + dy
+                    if 0 <= nx < self.map_size[0] and 0 <= ny < self.map_size[1]:
+                        affected.add(nx * width + ny)
+
+            for node in affected:
+                if node != self.goal:
+                    self.rhs[node] = self._min_successor(node)
+                self._update_vertex(node)
+
+        return int(changed_x.size)
+
+    # ------------------------------------------------------------------
+    # D* Lite
+    # ------------------------------------------------------------------
+
+    def _heuristic(self, a: int, b: int) -> float:
+        """Distanza octile (ammissibile: costo minimo cella = 1)."""
+        ax, ay = divmod(a, self._width)
+        bx, by = divmod(b, self._width)
+        dx = abs(ax - bx)
+        dy = abs(ay - by)
+        return (dx + dy) + (SQRT2 - 2.0) * min(dx, dy)
+
+    def _neighbors(self, node: int):
+        """Vicini con costo arco c(node, vicino)."""
+        x, y = divmod(node, self._width)
+        cost_here = self._cost_flat[node]
+        max_x, max_y = self.map_size
+        for dx, dy, length in _MOVES:
+            nx = x + dx
+            ny = y + dy
+            if 0 <= nx < max_x and 0 <= ny < max_y:
+                neighbor = nx * self._width + ny
+                yield neighbor, length * 0.5 * (cost_here + self._cost_flat[neighbor])
+
+    def _min_successor(self, node: int) -> float:
+        g = self.g
+        best = INF
+        for neighbor, cost in self._neighbors(node):
+            value = cost + g.get(neighbor, INF)
+            if value < best:
+                best = value
+        return best
+
+    def _calculate_key(self, node: int) -> Tuple[float, float]:
+        m = min(self.g.get(node, INF), self.rhs.get(node, INF))
+        return (m + self._heuristic(self.start, node) + self.km, m)
+
+    def _update_vertex(self, node: int):
+        if self.g.get(node, INF) != self.rhs.get(node, INF):
+            key = self._calculate_key(node)
+            self._open_keys[node] = key
+            heapq.heappush(self._open, (key[0], key[1], node))
+        else:
+            self._open_keys.pop(node, None)
+
+    def _top_key(self) -> Tuple[float, float]:
+        """Chiave minima valida (scarta entry obsolete della heap)."""
+        while self._open:
+            k1, k2, node = self._open[0]
+            if self._open_keys.get(node) == (k1, k2):
+                return (k1, k2)
+            heapq.heappop(self._open)
+        return (INF, INF)
+
+    def _compute_shortest_path(self):
+        g = self.g
+        rhs = self.rhs
+        start = self.start
+        expansions = 0
+
+        while True:
+            top = self._top_key()
+            start_key = self._calculate_key(start)
+            if not (top < start_key or rhs.get(start, INF) != g.get(start, INF)):
+                break
+            if top[0] == INF:
+                break  # Goal irraggiungibile
+
+            _, _, u = heapq.heappop(self._open)
+            del self._open_keys[u]
+            expansions += 1
+
+            new_key = self._calculate_key(u)
+            if top < new_key:
+                self._open_keys[u] = new_key
+                heapq.heappush(self._open, (new_key[0], new_key[1], u))
+                continue
+
+            g_u = g.get(u, INF)
+            rhs_u = rhs.get(u, INF)
+            if g_u > rhs_u:
+                # Nodo sovra-consistente: fissa g e propaga ai predecessori
+                g[u] = rhs_u
+                for s, cost in self._neighbors(u):
+                    if s != self.goal:
+                        candidate = cost + rhs_u
+                        if candidate < rhs.get(s, INF):
+                            rhs[s] = candidate
+                    self._update_vertex(s)
+            else:
+                # Nodo sotto-consistente: invalida e ricalcola
+                g[u] = INF
+                if u != self.goal:
+                    rhs[u] = self._min_successor(u)
+                self._update_vertex(u)
+                for s, cost in self._neighbors(u):
+                    if s != self.goal and rhs.get(s, INF) == cost + g_u:
+                        rhs[s] = self._min_successor(s)
+                    self._update_vertex(s)
+
+        self.stats['expansions'] += expansions
+
+    def _extract_path(self) -> List[Tuple[int, int]]:
+        """Discesa greedy su c + g dal robot al goal."""
+        if self.g.get(self.start, INF) == INF:
+            return []
+
+        path = [divmod(self.start, self._width)]
+        node = self.start
+        visited = {node}
+
+        while node != self.goal and len(path) < self.max_path_length:
+            best = None
+            best_value = INF
+            for neighbor, cost in self._neighbors(node):
+                value = cost + self.g.get(neighbor, INF)
+                if value < best_value:
+                    best_value = value
+                    best = neighbor
+            if best is None or best in visited:
+                return []  # Nessun percorso valido
+            visited.add(best)
+            node = best
+            path.append(divmod(node, self._width))
+
+        return path
+
+    # ------------------------------------------------------------------
+    # API pubblica
+    # ------------------------------------------------------------------
+
+    def plan(self, start: Tuple[int, int], goal: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """
+        Nuovo piano completo da start a goal.
+
+        Args:
+            start: (x, y) posizione robot in pixel
+            goal: (x, y) destinazione in pixel
+
+        Returns:
+            List[Tuple[int, int]]: Celle del percorso (vuota se irraggiungibile)
+        """
+        t0 = time.perf_counter()
+        self._apply_pending_changes()
+
+        self.start = int(start[0]) * self._width + int(start[1])
+        self.goal = int(goal[0]) * self._width + int(goal[1])
+        self._last_start = self.start
+        self.km = 0.0
+        self.g = {}
+        self.rhs = {self.goal: 0.0}
+        self._open = []
+        self._open_keys = {}
+        self._update_vertex(self.goal)
+
+        self._compute_shortest_path()
+        path = self._extract_path()
+
+        self.stats['plans'] += 1
+        self.stats['last_plan_ms'] = (time.perf_counter() - t0) * 1000
+        return path
+
+    def replan(self, start: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """
+        Riparazione incrementale del piano dalla nuova posizione robot.
+
+        Applica le modifiche di mappa accumulate e riespande solo i nodi interessati.
+        """
+        if self.goal is None:
+            return []
+
+        t0 = time.perf_counter()
+        new_start = int(start[0]) * self._width + int(start[1])
+        self.km += self._heuristic(self._last_start, new_start)
+        self._last_start = new_start
+        self.start = new_start
+
+        self._apply_pending_changes()
+        self._compute_shortest_path()
+        path = self._extract_path()
+
+        self.stats['replans'] += 1
+        self.stats['last_replan_ms'] = (time.perf_counter() - t0) * 1000
+        return path
+
+    def path_cost(self, path: List[Tuple[int, int]]) -> float:
+        """Costo totale di un percorso sulla costmap corrente."""
+        total = 0.0
+        for (ax, ay), (bx, by) in zip(path, path[1:]):
+            length = SQRT2 if ax != bx and ay != by else 1.0
+            total += length * 0.5 * (float(self.costmap[ax, ay]) + float(self.costmap[bx, by]))
+        return total
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'has_goal': self.goal is not None,
+            'goal': divmod(self.goal, self._width) if self.goal is not None else None,
+            'explored_nodes': len(self.g),
+            'stats': self.stats.copy()
+        }
+
+
+# Testing functions
+def benchmark_path_planner(map_size: int = 2000, distance: int = 600, seed: int = 0):
+    """
+    Benchmark plan/replan su mappa map_size x map_size con ostacoli casuali.
+
+    Misura: plan iniziale, replan dopo un ostacolo sul percorso,
+    replan dopo solo movimento del robot.
+    """
+    rng = np.random.default_rng(seed)
+    grid = np.zeros((map_size, map_size), dtype=np.int8)
+    grid[0, :] = grid[-1, :] = grid[:, 0] = grid[:, -1] = 1
+
+    # Ostacoli rettangolari casuali (mobili)
+    for _ in range(map_size // 4):
+        x, y = rng.integers(10, map_size - 40, 2)
+        w, h = rng.integers(3, 30, 2)
+        grid[x:x + w, y:y + h] = 1
+
+    config = {'ai': {'slam': {'map_resolution': 0.05}, 'navigation': {}}}
+    planner = PathPlanner(config)
+
+    t0 = time.perf_counter()
+    planner.set_map(grid)
+    costmap_ms = (time.perf_counter() - t0) * 1000
+
+    center = map_size // 2
+    start = (center - distance // 2, center)
+    goal = (center + distance // 2, center)
+    grid[start[0] - 10:start[0] + 10, start[1] - 10:start[1] + 10] = 0
+    grid[goal[0] - 10:goal[0] + 10, goal[1] - 10:goal[1] + 10] = 0
+    planner.set_map(grid)
+
+    print(f"=== BENCHMARK PATH PLANNER {map_size}x{map_size} ===")
+    print(f"Costmap completa: {costmap_ms:.0f}ms")
+
+    path = planner.plan(start, goal)
+    print(f"Plan iniziale ({distance}px): {planner.stats['last_plan_ms']:.0f}ms, "
+          f"{len(path)} celle, {planner.stats['expansions']} espansioni")
+    if not path:
+        print("Nessun percorso trovato")
+        return
+
+    # Il robot avanza di 1/4 del percorso, poi il sonar scopre un muro 2m più avanti
+    robot_index = len(path) // 4
+    robot = path[robot_index]
+    bx, by = path[min(robot_index + 40, len(path) - 1)]
+    wall_x = np.full(21, bx)
+    wall_y = np.arange(by - 10, by + 11)
+    grid[wall_x, wall_y] = 1
+    planner.on_cells_changed(grid, wall_x, wall_y)
+
+    expansions_before = planner.stats['expansions']
+    new_path = planner.replan(robot)
+    print(f"Replan con nuovo ostacolo: {planner.stats['last_replan_ms']:.0f}ms, "
+          f"{len(new_path)} celle, {planner.stats['expansions'] - expansions_before} espansioni")
+
+    # Confronto: ricerca completa dalla stessa posizione
+    reference = PathPlanner(config)
+    reference.set_map(grid)
+    reference_path = reference.plan(robot, goal)
+    print(f"Plan completo equivalente: {reference.stats['last_plan_ms']:.0f}ms "
+          f"(costo {reference.path_cost(reference_path):.1f} vs incrementale {planner.path_cost(new_path):.1f})")
+
+    # Solo movimento robot (nessuna modifica mappa)
+    robot = new_path[len(new_path) // 3]
+    expansions_before = planner.stats['expansions']
+    planner.replan(robot)
+    print(f"Replan solo movimento: {planner.stats['last_replan_ms']:.1f}ms, "
+          f"{planner.stats['expansions'] - expansions_before} espansioni")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Path planner benchmark")
+    parser.add_argument('--map-size', type=int, default=2000)
+    parser.add_argument('--distance', type=int, default=600)
+    args = parser.parse_args()
+
+    benchmark_path_planner(args.map_size, args.distance)
@@ -90,9 +90,18 @@ class EmotionEngine:
             'dark_environment': {'target': EmotionState.CAUTIOUS, 'strength': 0.5},
             'bright_environment': {'target': EmotionState.CURIOUS, 'strength': 0.3},
             'new_area': {'target': EmotionState.CURIOUS, 'strength': 0.6},
-            'familiar_area': {'target': EmotionState.RESTING, 'strength': 0.2}
+            'familiar_area': {'target': EmotionState.RESTING, 'strength': 0.2},
+            'map_changed': {'target': EmotionState.CURIOUS, 'strength': 0.5}
         }
         
+        # Soglie novità zona per trigger new_area / familiar_area
+        novelty_config = self.config.get('novelty', {})
+        self.new_area_threshold = novelty_config.get('new_area_threshold', 0.7)
+        self.familiar_area_threshold = novelty_config.get('familiar_area_threshold', 0.3)
+        
+        # Soglia cambiamento mappa (ChangeMap SLAM) per trigger map_changed
+        self.map_change_threshold = self.config.get('map_change', {}).get('changed_threshold', 0.5)
+        
         # Parametri comportamentali per ogni emozione
         self.behavior_modifiers = self._load_behavior_modifiers()
         
@@ -262,6 +271,22 @@ class EmotionEngine:
         if motion_detected:
             triggered_emotions[EmotionState.ALERT] += 0.5
             
+        # Analizza novità della zona (da mappa visite SLAM)
+        novelty = context.get('novelty')
+        if novelty is not None:
+            if novelty >= self.new_area_threshold:
+                trigger = self.emotion_triggers['new_area']
+                triggered_emotions[trigger['target']] += trigger['strength'] * self.personality['exploration_drive']
+            elif novelty <= self.familiar_area_threshold:
+                trigger = self.emotion_triggers['familiar_area']
+                triggered_emotions[trigger['target']] += trigger['strength']
+        
+        # Qualcosa è cambiato qui intorno (mobile spostato, porta aperta)
+        map_change = context.get('map_change')
+        if map_change is not None and map_change >= self.map_change_threshold:
+            trigger = self.emotion_triggers['map_changed']
+            triggered_emotions[trigger['target']] += trigger['strength'] * map_change
+            
         # Influence della personalità
         triggered_emotions[EmotionState.CURIOUS] += self.personality['curiosity_base'] * 0.2
         
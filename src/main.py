@@ -100,12 +100,40 @@ class RobotAI:
             self.experience_db = ExperienceDatabase(self.config)
             await self.experience_db.initialize()
             
+            # Mappa semantica: oggetti riconosciuti in coordinate mappa
+            from memory import SemanticObjectMap
+            self.object_map = SemanticObjectMap(self.config, self.slam_system.map_resolution, self.experience_db)
+            await self.object_map.load()
+            # Mappa salvata riconosciuta: oggetti di questa sessione nel suo frame
+            self.slam_system.add_relocalization_listener(self.object_map.reproject)
+            
             # Initialize Perception System (camera, sensors, CV)
             from perception import CameraHandler, SensorManager  
             self.camera_handler = CameraHandler(self.config, self.no_hardware)
             await self.camera_handler.initialize()
             self.sensor_manager = SensorManager(self.config, self.no_hardware)
-            await self.sensor_manager.initialize()
+            if self.no_hardware:
+                # Letture distanza coerenti con il mondo simulato dello SLAM
+                self.sensor_manager.set_simulated_world(
+                    self.slam_system.world_map,
+                    self.slam_system.map_resolution,
+                    self.slam_system.get_simulated_pose
+                )
+                await self.sensor_manager.initialize()
+            else:
+                # Motori, LED, safety e odometria: il manager collega i sensori
+                # alla seriale Arduino e li inizializza; i delta dell'odometria
+                # propagano la posa dello SLAM
+                from action import HardwareIntegrationManager
+                self.action_system = HardwareIntegrationManager(self.config, self.sensor_manager)
+                self.action_system.set_slam_system(self.slam_system)
+                if not await self.action_system.initialize():
+                    raise RuntimeError("Hardware integration failed")
+            
+            # Sweep servo del sonar: ventagli di letture → update SLAM batch
+            from perception import SonarSweep
+            self.sonar_sweep = SonarSweep(self.config, self.sensor_manager, self.slam_system)
+            await self.sonar_sweep.start()
             
             # Initialize Emotion System (behavioral states)
             from emotion import BehavioralStates
@@ -116,9 +144,8 @@ class RobotAI:
             from cognitive import LearningAgent
             self.learning_agent = LearningAgent(self.config, self.experience_db)
             
-            # Initialize Action System (motors, LED, expressions)
-            # TODO: from action import ActionSystem
-            # self.action_system = ActionSystem(self.config)
+            # Action System (motors, LED, expressions): HardwareIntegrationManager
+            # created above with the sensors in hardware mode
             
             self.logger.info(f"{Fore.GREEN}✓ All systems initialized successfully{Style.RESET_ALL}")
             
@@ -152,23 +179,39 @@ class RobotAI:
                 }
                 
                 # Phase 2: Memory - Update spatial and experience memory
-                slam_task = asyncio.create_task(self.slam_system.update_position(
+                # distance_cm è sempre frontale: con lo sweep attivo arriva dalla
+                # sua ultima lettura all'angolo centrale (SonarSweep.read_front).
+                # Completato prima del context: novità e cambiamenti sono di questo tick
+                await self.slam_system.update_position(
                     perception_data['distance_cm'], 
                     perception_data['light_levels']
-                ))
+                )
                 
-                # Phase 3: Emotion - Update emotional state (parallelizzato con SLAM)
+                # Phase 3: Emotion - Update emotional state (in parallelo con la mappa semantica e il DB)
                 context = {
                     'battery_level': 80,  # TODO: Get real battery level
-                    'simulation_mode': self.no_hardware
+                    'simulation_mode': self.no_hardware,
+                    'novelty': self.slam_system.novelty_at(),
+                    'map_change': self.slam_system.change_signal()
                 }
                 
                 emotion_task = asyncio.create_task(self.emotion_system.update_from_sensors(
                     perception_data, context
                 ))
                 
-                # Attendi completamento parallelo
-                await slam_task
+                # Oggetti visti → mappa semantica (sync SQLite a blocchi)
+                if perception_data['objects_detected']:
+                    self.object_map.observe(
+                        perception_data['objects_detected'],
+                        (*self.slam_system.robot_position, self.slam_system.robot_orientation),
+                        perception_data['distance_cm']
+                    )
+                await self.object_map.maybe_sync()
+                
+                # Retention storia esperienze: un passo a budget ogni tanto (thread writer)
+                self.experience_db.maybe_compact()
+                self.experience_db.maybe_backup()  # Backup orario: db principale + shard attivo
+                
                 behavioral_state = await emotion_task
                 
                 # Phase 4: Cognition - Make decisions
@@ -183,16 +226,20 @@ class RobotAI:
                 
                 action, was_exploration = await self.learning_agent.choose_action(situation)
                 
-                # Calculate reward based on safety and exploration
+                # Calculate task reward based on safety and exploration
                 reward = 0.0
                 if perception_data['distance_cm'] < 30 and action == 'stop':
                     reward = 1.0  # Good safety decision
                 elif perception_data['distance_cm'] > 100 and action == 'move_forward':
                     reward = 0.8  # Good exploration
+
+                # Curiosità: bonus per zone poco visitate (solo per il Q-learning,
+                # l'esito registrato dipende dal reward del task)
+                curiosity = self.learning_agent.intrinsic_reward(situation)
                 
                 # Learn from experience
                 await self.learning_agent.learn_from_experience(
-                    situation, action, reward, done=False
+                    situation, action, reward, done=False, intrinsic_reward=curiosity
                 )
                 
                 # Record experience in database
@@ -255,8 +302,8 @@ class RobotAI:
         self.running = False
         
         # Shutdown systems in reverse order
-        # if self.action_system:
-        #     await self.action_system.shutdown()
+        if self.action_system:
+            await self.action_system.shutdown()
         
         if hasattr(self, 'learning_agent'):
             # Learning agent doesn't have shutdown method
@@ -265,6 +312,9 @@ class RobotAI:
         if hasattr(self, 'emotion_system'):
             await self.emotion_system.cleanup()
             
+        if hasattr(self, 'sonar_sweep'):
+            await self.sonar_sweep.stop()
+            
         if hasattr(self, 'sensor_manager'):
             await self.sensor_manager.cleanup()
             
@@ -274,6 +324,9 @@ class RobotAI:
         if hasattr(self, 'slam_system'):
             await self.slam_system.cleanup()
             
+        if hasattr(self, 'object_map'):
+            await self.object_map.sync()
+            
         if hasattr(self, 'experience_db'):
             await self.experience_db.cleanup()
             
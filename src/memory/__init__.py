@@ -14,12 +14,44 @@ This module provides the robot's memory capabilities.
 
 from .slam_system import SLAMSystem
 from .experience_db import ExperienceDatabase
+from .db_writer import DatabaseWriter
+from .db_pool import ReadConnectionPool
+from .experience_index import ExperienceIndex
+from .experience_shards import ShardRouter
+from .pattern_miner import PatternMiner
+from .particle_filter import ParticleFilter
+from .frontier_detector import FrontierDetector
+from .distance_field import DistanceField
+from .light_map import LightMap
+from .visitation_map import VisitationMap
+from .change_map import ChangeMap
+from .position_history import PositionHistory
+from .map_store import MapStore
+from .scan_matcher import CorrelativeScanMatcher
+from .map_library import MapLibrary
+from .object_map import SemanticObjectMap
 # from .spatial_memory import SpatialMemory          # TODO: Implementare  
 # from .memory_manager import MemoryManager          # TODO: Implementare
 
 __all__ = [
     'SLAMSystem',
-    'ExperienceDatabase'
+    'ExperienceDatabase',
+    'DatabaseWriter',
+    'ReadConnectionPool',
+    'ExperienceIndex',
+    'ShardRouter',
+    'PatternMiner',
+    'ParticleFilter',
+    'FrontierDetector',
+    'DistanceField',
+    'LightMap',
+    'VisitationMap',
+    'ChangeMap',
+    'PositionHistory',
+    'MapStore',
+    'CorrelativeScanMatcher',
+    'MapLibrary',
+    'SemanticObjectMap'
     # 'SpatialMemory',         # TODO: Aggiungere quando implementato
     # 'MemoryManager'          # TODO: Aggiungere quando implementato
 ]
\ No newline at end of file
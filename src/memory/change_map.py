@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Change Map - Robot AI Memory System
+===================================
+
+Layer "cambiamenti": dove le osservazioni attuali contraddicono la mappa
+(mobile spostato, porta aperta, scatola nuova in corridoio).
+
+In parole semplici:
+- Una cella che passa da libera a ostacolo (o viceversa) è un cambiamento;
+  una cella sconosciuta che diventa nota è solo esplorazione, non conta
+- SLAM passa qui solo le celle cambiate di ogni raggio: niente confronti
+  su tutta la griglia
+- Ogni cambiamento scalda una cella grossolana (es. 25cm); il calore si
+  raffredda nel tempo (decadimento esponenziale calcolato "pigro" solo
+  quando si legge o si scrive la cella)
+- top_changes(k) restituisce le zone più "calde": si guarda solo l'elenco
+  delle celle attive, non tutta la griglia
+
+Author: Andrea Vavassori
+"""
+
+import logging
+import math
+import time
+from typing import Dict, List, Tuple, Optional, Any
+import numpy as np
+
+
+class ChangeMap:
+    """
+    Calore dei cambiamenti per cella grossolana, con decadimento nel tempo.
+
+    Coordinate di input in pixel della mappa SLAM.
+    """
+
+    def __init__(self, config: dict, map_size: Tuple[int, int], map_resolution: float):
+        self.logger = logging.getLogger(__name__)
+
+        change_config = config.get('change_detection', {})
+
+        self.map_resolution = map_resolution
+        self.resolution = change_config.get('resolution', 0.25)        # metri per cella
+        self.cell_size = max(1, int(round(self.resolution / map_resolution)))
+        self.decay_time = change_config.get('decay_time', 300.0)       # secondi
+        self.saturation = change_config.get('saturation', 10.0)        # celle cambiate per segnale = 1.0
+        self.min_heat = change_config.get('min_heat', 0.05)            # sotto: cella non più attiva
+
+        self.shape = (
+            int(math.ceil(map_size[0] / self.cell_size)),
+            int(math.ceil(map_size[1] / self.cell_size))
+        )
+
+        self.heat = np.zeros(self.shape, dtype=np.float32)
+        self.last_update = np.zeros(self.shape, dtype=np.float64)
+        self._active: set = set()  # indici piatti delle celle con calore
+
+        self.stats = {
+            'appeared': 0,      # libero → ostacolo
+            'disappeared': 0,   # ostacolo → libero
+            'active_cells': 0
+        }
+
+    def _decayed(self, flat: np.ndarray, now: float) -> np.ndarray:
+        heat = self.heat.ravel()[flat]
+        age = np.maximum(now - self.last_update.ravel()[flat], 0.0)
+        return heat * np.exp(-age / self.decay_time)
+
+    def record(self, xs: np.ndarray, ys: np.ndarray, old_values: np.ndarray, new_value: int,
+               timestamp: Optional[float] = None) -> int:
+        """
+        Registra celle appena scritte da SLAM.
+
+        Args:
+            xs, ys: Celle cambiate (pixel)
+            old_values: Valori precedenti delle celle
+            new_value: Nuovo valore (0=libero, 1=ostacolo)
+            timestamp: Tempo osservazione (default: ora)
+
+        Returns:
+            int: Celle che contraddicono la mappa
+        """
+        contradiction = np.asarray(old_values) != -1
+        if not np.any(contradiction):
+            return 0
+
+        now = time.time() if timestamp is None else timestamp
+        cx = np.asarray(xs)[contradiction] // self.cell_size
+        cy = np.asarray(ys)[contradiction] // self.cell_size
+        flat, counts = np.unique(np.ravel_multi_index((cx, cy), self.shape), return_counts=True)
+
+        heat_flat = self.heat.ravel()
+        last_flat = self.last_update.ravel()
+        heat_flat[flat] = self._decayed(flat, now) + counts
+        last_flat[flat] = now
+        self._active.update(flat.tolist())
+
+        n = int(counts.sum())
+        self.stats['appeared' if new_value == 1 else 'disappeared'] += n
+        self.stats['active_cells'] = len(self._active)
+        return n
+
+    def heat_at(self, position: Tuple[float, float], timestamp: Optional[float] = None) -> float:
+        """Calore corrente (decaduto) nella cella della posizione."""
+        now = time.time() if timestamp is None else timestamp
+        cx = min(max(int(position[0]) // self.cell_size, 0), self.shape[0] - 1)
+        cy = min(max(int(position[1]) // self.cell_size, 0), self.shape[1] - 1)
+        return float(self._decayed(np.array([cx * self.shape[1] + cy]), now)[0])
+
+    def change_signal(self, position: Tuple[float, float], radius_m: float = 1.0,
+                      timestamp: Optional[float] = None) -> float:
+        """
+        Segnale "qualcosa è cambiato qui intorno" (0-1) per emozioni e apprendimento.
+
+        Massimo calore nella finestra attorno alla posizione, saturato.
+        """
+        if not self._active:
+            return 0.0
+        now = time.time() if timestamp is None else timestamp
+        r = max(1, int(math.ceil(radius_m / self.resolution)))
+        cx = int(position[0]) // self.cell_size
+        cy = int(position[1]) // self.cell_size
+        x0, x1 = max(0, cx - r), min(self.shape[0], cx + r + 1)
+        y0, y1 = max(0, cy - r), min(self.shape[1], cy + r + 1)
+
+        heat = self.heat[x0:x1, y0:y1]
+        if not heat.any():
+            return 0.0
+        age = np.maximum(now - self.last_update[x0:x1, y0:y1], 0.0)
+        peak = float((heat * np.exp(-age / self.decay_time)).max())
+        return min(1.0, peak / self.saturation)
+
+    def top_changes(self, k: int = 5, timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Le k zone cambiate di più (calore decaduto), dalla più calda.
+
+        Le celle raffreddate sotto min_heat escono dall'elenco attivo.
+        """
+        if not self._active:
+            return []
+        now = time.time() if timestamp is None else timestamp
+
+        flat = np.fromiter(self._active, dtype=np.int64, count=len(self._active))
+        heat = self._decayed(flat, now)
+
+        cold = heat < self.min_heat
+        if np.any(cold):
+            self._active.difference_update(flat[cold].tolist())
+            self.heat.ravel()[flat[cold]] = 0.0
+            flat, heat = flat[~cold], heat[~cold]
+            self.stats['active_cells'] = len(self._active)
+
+        if flat.size > k:
+            top = np.argpartition(heat, -k)[-k:]
+            flat, heat = flat[top], heat[top]
+        order = np.argsort(heat)[::-1]
+
+        results = []
+        for index in order:
+            cx, cy = np.unravel_index(flat[index], self.shape)
+            center = (float((cx + 0.5) * self.cell_size), float((cy + 0.5) * self.cell_size))
+            results.append({
+                'position_pixels': [center[0], center[1]],
+                'position_meters': [center[0] * self.map_resolution, center[1] * self.map_resolution],
+                'heat': float(heat[index]),
+                'last_change': float(self.last_update.ravel()[flat[index]])
+            })
+        return results
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Array per salvataggio insieme alla mappa."""
+        return {
+            'change_heat': self.heat,
+            'change_last': self.last_update
+        }
+
+    def load_arrays(self, data) -> bool:
+        """Ripristina il layer da array salvati (se compatibili)."""
+        if 'change_heat' not in data or data['change_heat'].shape != self.shape:
+            return False
+        self.heat[...] = data['change_heat']
+        self.last_update[...] = data['change_last']
+        self._active = set(np.flatnonzero(self.heat).tolist())
+        self.stats['active_cells'] = len(self._active)
+        return True
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'shape': self.shape,
+            'resolution': self.resolution,
+            'stats': self.stats.copy()
+        }
+
+
+# Testing functions
+def test_change_map():
+    """Test: porta aperta in una mappa nota, calore che decade."""
+    changes = ChangeMap({}, (2000, 2000), 0.05)
+
+    grid = np.full((2000, 2000), -1, dtype=np.int8)
+    grid[1000:1100, 1000:1100] = 0
+    grid[1050, 1000:1100] = 1                      # muro con porta chiusa
+
+    # Esplorazione: sconosciuto → noto, nessun cambiamento
+    xs, ys = np.arange(900, 1000), np.full(100, 1000)
+    assert changes.record(xs, ys, grid[xs, ys], 0, timestamp=0.0) == 0
+
+    # Porta aperta: 10 celle del muro diventano libere
+    xs, ys = np.full(10, 1050), np.arange(1040, 1050)
+    n = changes.record(xs, ys, grid[xs, ys], 0, timestamp=10.0)
+    # Rumore: una cella isolata altrove
+    changes.record(np.array([1010]), np.array([1090]), np.array([0]), 1, timestamp=10.0)
+
+    print("Testing ChangeMap...")
+    top = changes.top_changes(3, timestamp=10.0)
+    print(f"  Celle contraddette: {n}, zone calde: {[(t['position_meters'], round(t['heat'], 1)) for t in top]}")
+    print(f"  Segnale alla porta: {changes.change_signal((1050, 1045), timestamp=10.0):.2f}, "
+          f"lontano: {changes.change_signal((1500, 1500), timestamp=10.0):.2f}")
+    print(f"  Segnale dopo 10 minuti: {changes.change_signal((1050, 1045), timestamp=610.0):.2f}")
+    assert top[0]['heat'] > top[-1]['heat']
+    assert abs(top[0]['position_meters'][0] - 52.5) < 0.5
+
+    start = time.perf_counter()
+    rng = np.random.default_rng(0)
+    for _ in range(1000):
+        xs = rng.integers(0, 2000, 20)
+        ys = rng.integers(0, 2000, 20)
+        changes.record(xs, ys, np.zeros(20, dtype=np.int8), 1, timestamp=20.0)
+    print(f"  record (20 celle): {(time.perf_counter() - start) / 1000 * 1e6:.1f}µs")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        changes.top_changes(5, timestamp=20.0)
+    print(f"  top_changes k=5 su {len(changes._active)} celle attive: "
+          f"{(time.perf_counter() - start) / 100 * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    test_change_map()
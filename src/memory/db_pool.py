@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Database Read Pool - Robot AI Memory System
+===========================================
+
+Pool di connessioni SQLite in sola lettura su thread worker, più le
+PRAGMA condivise da writer e lettori.
+
+In parole semplici:
+- In modalità WAL chi legge non blocca chi scrive (e viceversa): le query
+  di insights e similarità possono girare mentre il writer committa
+- Ogni thread del pool ha la SUA connessione read-only (aperta al primo
+  uso), quindi niente lock: N query possono girare in parallelo
+- apply_pragmas imposta journal WAL, synchronous, cache, mmap e temp_store
+  in un punto solo
+
+Author: Andrea Vavassori
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Any, List
+
+DEFAULT_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',  # Spazio liberato restituito a passi (solo DB nuovi)
+    'journal_mode': 'WAL',      # Lettori e writer concorrenti
+    'synchronous': 'NORMAL',    # In WAL: fsync solo al checkpoint, niente corruzione
+    'cache_size': -8000,        # KiB (negativo) → 8MB di page cache per connessione
+    'mmap_size': 67108864,      # 64MB letti via mmap (meno copie su Raspberry Pi)
+    'temp_store': 'MEMORY',     # Ordinamenti/GROUP BY temporanei in RAM
+    'busy_timeout': 5000        # ms di attesa su lock invece di errore immediato
+}
+
+# PRAGMA che valgono per il file e vanno impostate solo dal writer
+_WRITER_ONLY = ('auto_vacuum', 'journal_mode', 'synchronous')
+
+
+def apply_pragmas(connection: sqlite3.Connection, pragmas: Dict[str, Any], read_only: bool = False):
+    """Applica le PRAGMA alla connessione (quelle del file solo se writer)."""
+    for name, value in pragmas.items():
+        if read_only and name in _WRITER_ONLY:
+            continue
+        connection.execute(f"PRAGMA {name} = {value}")
+    if read_only:
+        connection.execute("PRAGMA query_only = 1")
+
+
+class ReadConnectionPool:
+    """
+    Thread worker con una connessione read-only ciascuno.
+
+    run(fn, *args) esegue fn(connection, *args) su un worker libero.
+    """
+
+    def __init__(self, db_path: str, size: int = 2, pragmas: Dict[str, Any] = None):
+        self.logger = logging.getLogger(__name__)
+
+        self.db_path = Path(db_path)
+        self.size = max(1, int(size))
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='sqlite-reader')
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        self.stats = {
+            'queries': 0,
+            'connections': 0
+        }
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # mode=ro: il file non può essere modificato da questa connessione
+            connection = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True,
+                                         check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            apply_pragmas(connection, self.pragmas, read_only=True)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+                self.stats['connections'] = len(self._connections)
+        return connection
+
+    def _call(self, fn: Callable[..., Any], args: tuple) -> Any:
+        self.stats['queries'] += 1
+        return fn(self._connection(), *args)
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Esegue fn(connection, *args) su un worker del pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    async def close(self):
+        """Attende le query in corso e chiude tutte le connessioni."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown, True)
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'size': self.size,
+            'stats': self.stats.copy()
+        }
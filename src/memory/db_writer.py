@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Database Writer - Robot AI Memory System
+========================================
+
+Thread dedicato alle scritture SQLite: l'event loop non aspetta mai
+execute/commit (un fsync lento sulla SD può durare centinaia di ms).
+
+In parole semplici:
+- Il thread writer possiede l'unica connessione in scrittura
+- Chi scrive mette un "lavoro" in coda e riceve subito un asyncio.Future
+- Il writer raccoglie i lavori in una transazione e fa UN commit per
+  blocco (group commit): quando il blocco è pieno (batch_size) o quando
+  è passato flush_interval dal primo lavoro
+- Il Future si completa solo DOPO il commit: chi lo attende sa che il
+  dato è su disco
+- Ogni lavoro gira in un SAVEPOINT: se uno fallisce, si annulla solo
+  quello e gli altri del blocco vengono salvati
+- I lavori con transaction=False (ATTACH/DETACH di file, migrazioni che
+  committano da sole) girano dopo il commit del blocco, fuori transazione
+- Se SQLite annulla da solo la transazione (disco pieno, errore di I/O)
+  falliscono i Future di tutto il blocco, ma il writer continua a girare
+
+Author: Andrea Vavassori
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Any, Optional, Sequence
+
+_STOP = object()
+
+
+class DatabaseWriter:
+    """
+    Writer SQLite su thread separato con group commit.
+
+    I lavori sono funzioni fn(connection, *args) eseguite nel thread writer;
+    il loro valore di ritorno diventa il risultato del Future.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 50, flush_interval: float = 1.0,
+                 on_connect: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.logger = logging.getLogger(__name__)
+
+        self.db_path = str(db_path)
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval  # secondi max tra primo lavoro e commit
+        self.on_connect = on_connect          # es. PRAGMA sulla connessione writer
+
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        self.stats = {
+            'operations': 0,
+            'failed_operations': 0,
+            'commits': 0,
+            'max_batch': 0,
+            'last_commit_ms': 0.0,
+            'queue_size': 0
+        }
+
+    def start(self):
+        """Avvia il thread writer (la connessione viene aperta nel thread)."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # API (thread dell'event loop)
+    # ------------------------------------------------------------------
+
+    def submit(self, fn: Callable[..., Any], *args, commit: bool = False,
+               transaction: bool = True) -> asyncio.Future:
+        """
+        Accoda un lavoro di scrittura. Non blocca.
+
+        Args:
+            fn: Funzione fn(connection, *args) eseguita nel thread writer
+            commit: Forza il commit subito dopo questo lavoro
+            transaction: False = committa il blocco in corso ed esegue fn
+                         fuori transazione (fn gestisce BEGIN/COMMIT)
+
+        Returns:
+            asyncio.Future: Risultato di fn, completato dopo il commit
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self._closed:
+            future.set_exception(RuntimeError("DatabaseWriter chiuso"))
+            return future
+        if self._thread is None or not self._thread.is_alive():
+            future.set_exception(RuntimeError("Thread DatabaseWriter non attivo"))
+            return future
+        self._queue.put((fn, args, future, loop, commit, transaction))
+        return future
+
+    def execute(self, sql: str, parameters: Sequence = (), commit: bool = False) -> asyncio.Future:
+        """Accoda una singola istruzione. Risultato: lastrowid."""
+        return self.submit(lambda conn: conn.execute(sql, parameters).lastrowid, commit=commit)
+
+    def executemany(self, sql: str, rows: Sequence[Sequence], commit: bool = False) -> asyncio.Future:
+        """Accoda un'istruzione su molte righe. Risultato: rowcount."""
+        return self.submit(lambda conn: conn.executemany(sql, rows).rowcount, commit=commit)
+
+    async def flush(self):
+        """Attende che tutto quanto accodato finora sia committato."""
+        await self.submit(lambda conn: None, commit=True)
+
+    async def close(self):
+        """Svuota la coda, committa e ferma il thread (senza bloccare il loop)."""
+        if self._thread is None or self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    # Thread writer
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, loop: asyncio.AbstractEventLoop,
+                 result: Any = None, error: Optional[BaseException] = None):
+        def apply():
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        try:
+            loop.call_soon_threadsafe(apply)
+        except RuntimeError:
+            pass  # Loop già chiuso: nessuno attende più il risultato
+
+    def _run(self):
+        try:
+            # isolation_level=None: transazioni gestite a mano (BEGIN/COMMIT espliciti)
+            connection = sqlite3.connect(self.db_path, isolation_level=None)
+        except Exception as e:
+            self.logger.error(f"Errore apertura database writer: {e}")
+            self._fail_queued(e)
+            return
+        connection.row_factory = sqlite3.Row
+        if self.on_connect is not None:
+            try:
+                self.on_connect(connection)
+            except Exception as e:
+                self.logger.error(f"Errore configurazione connessione writer: {e}")
+
+        try:
+            self._serve(connection)
+        finally:
+            connection.close()
+            self._fail_queued(RuntimeError("DatabaseWriter fermato"))
+
+    def _serve(self, connection: sqlite3.Connection):
+        pending = []            # (future, loop, result, error) in attesa del commit
+        batch_start = 0.0
+        stopping = False
+
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0.0, batch_start + self.flush_interval - time.monotonic())
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # Scaduto flush_interval: commit del blocco
+
+            current = []        # Lavoro in corso, da far fallire se il blocco salta
+            try:
+                force_commit = item is None
+                if item is _STOP:
+                    stopping = True
+                    force_commit = True
+                elif item is not None and not item[5]:
+                    # Fuori transazione: prima il blocco in corso, poi il lavoro
+                    fn, args, future, loop, _, _ = item
+                    current = [(future, loop, None, None)]
+                    if pending:
+                        self._commit(connection, pending)
+                        pending = []
+                    try:
+                        self._resolve(future, loop, fn(connection, *args))
+                    except Exception as e:
+                        if connection.in_transaction:
+                            connection.execute("ROLLBACK")
+                        self._resolve(future, loop, error=e)
+                        self.stats['failed_operations'] += 1
+                    self.stats['operations'] += 1
+                elif item is not None:
+                    fn, args, future, loop, commit, _ = item
+                    current = [(future, loop, None, None)]
+                    if not pending:
+                        connection.execute("BEGIN")
+                        batch_start = time.monotonic()
+                    try:
+                        connection.execute("SAVEPOINT op")
+                        result = fn(connection, *args)
+                        if not connection.in_transaction:
+                            raise sqlite3.OperationalError("transazione annullata durante il lavoro")
+                        connection.execute("RELEASE op")
+                        pending.append((future, loop, result, None))
+                    except Exception as e:
+                        if not connection.in_transaction:
+                            raise  # Annullata da SQLite: niente savepoint, salta il blocco
+                        connection.execute("ROLLBACK TO op")
+                        connection.execute("RELEASE op")
+                        pending.append((future, loop, None, e))
+                        self.stats['failed_operations'] += 1
+                    current = []
+                    self.stats['operations'] += 1
+                    force_commit = (commit or len(pending) >= self.batch_size
+                                    or time.monotonic() - batch_start >= self.flush_interval)
+
+                if pending and force_commit:
+                    self._commit(connection, pending)
+                    pending = []
+            except Exception as e:
+                self.logger.error(f"Errore writer, blocco annullato: {e}")
+                self._abort(connection, pending + current, e)
+                pending = []
+
+            if stopping and self._queue.empty():
+                break
+
+    def _abort(self, connection: sqlite3.Connection, pending: list, error: BaseException):
+        """Blocco perso: rollback (se serve) e Future falliti, il thread continua."""
+        if connection.in_transaction:
+            try:
+                connection.execute("ROLLBACK")
+            except Exception:
+                pass
+        for future, loop, _, _ in pending:
+            self._resolve(future, loop, error=error)
+        self.stats['failed_operations'] += len(pending)
+
+    def _fail_queued(self, error: BaseException):
+        """Thread in uscita: nessun lavoro rimasto in coda resta senza risposta."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP:
+                self._resolve(item[2], item[3], error=error)
+
+    def _commit(self, connection: sqlite3.Connection, pending: list):
+        start = time.perf_counter()
+        try:
+            connection.execute("COMMIT")
+            commit_error = None
+        except Exception as e:
+            self.logger.error(f"Errore commit batch: {e}")
+            try:
+                connection.execute("ROLLBACK")
+            except Exception:
+                pass
+            commit_error = e
+
+        for future, loop, result, error in pending:
+            self._resolve(future, loop, result, commit_error or error)
+
+        self.stats['commits'] += 1
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(pending))
+        self.stats['last_commit_ms'] = (time.perf_counter() - start) * 1000
+
+    def get_state(self) -> Dict[str, Any]:
+        stats = self.stats.copy()
+        stats['queue_size'] = self._queue.qsize()
+        return stats
+
+
+# Testing functions
+async def test_db_writer():
+    """Test: il loop resta reattivo mentre il writer committa su disco."""
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'writer.db'
+        writer = DatabaseWriter(path, batch_size=100, flush_interval=0.2)
+        writer.start()
+        await writer.submit(lambda conn: conn.execute(
+            "CREATE TABLE t (id INTEGER PRIMARY KEY, value REAL)"), commit=True)
+
+        # Ticker a 100Hz: misura il ritardo massimo del loop durante le scritture
+        lags = []
+
+        async def ticker():
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - start - 0.01)
+
+        tick_task = asyncio.create_task(ticker())
+
+        start = time.perf_counter()
+        futures = [writer.execute("INSERT INTO t (value) VALUES (?)", (i * 0.5,)) for i in range(2000)]
+        enqueue_ms = (time.perf_counter() - start) * 1000
+        ids = await asyncio.gather(*futures)
+
+        # Un lavoro che fallisce non annulla gli altri del blocco
+        bad = writer.execute("INSERT INTO missing_table VALUES (1)")
+        good = writer.execute("INSERT INTO t (value) VALUES (-1)")
+        results = await asyncio.gather(bad, good, return_exceptions=True)
+
+        # Transazione annullata sotto al lavoro (come SQLite su disco pieno):
+        # falliscono il lavoro e il blocco, il writer resta vivo
+        def rolled_back(conn):
+            conn.execute("ROLLBACK")
+            raise sqlite3.OperationalError("database or disk is full")
+
+        lost = writer.execute("INSERT INTO t (value) VALUES (-2)")
+        aborted = writer.submit(rolled_back)
+        after = writer.execute("INSERT INTO t (value) VALUES (-3)")
+        results += await asyncio.gather(lost, aborted, after, return_exceptions=True)
+        assert isinstance(results[2], sqlite3.OperationalError) and isinstance(results[3], sqlite3.OperationalError)
+        assert writer._thread.is_alive() and results[4] > 0
+
+        await writer.flush()
+        tick_task.cancel()
+        await writer.close()
+        closed = writer.submit(lambda conn: None)
+        assert isinstance(closed.exception(), RuntimeError)
+
+        count = sqlite3.connect(path).execute("SELECT COUNT(*) FROM t").fetchone()[0]
+        print("Testing DatabaseWriter...")
+        print(f"  2000 insert accodati in {enqueue_ms:.1f}ms, commit: {writer.stats['commits']}, "
+              f"blocco max: {writer.stats['max_batch']}")
+        print(f"  Ritardo max event loop: {max(lags) * 1000:.1f}ms")
+        print(f"  Lavoro fallito: {type(results[0]).__name__}, lavoro valido: id {results[1]}")
+        assert count == 2002 and ids[-1] == 2000
+
+
+if __name__ == "__main__":
+    asyncio.run(test_db_writer())
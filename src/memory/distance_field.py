@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Distance Field - Robot AI Memory System
+=======================================
+
+Campo di distanza euclidea dall'ostacolo più vicino, aggiornato
+incrementalmente quando le celle della mappa cambiano.
+
+In parole semplici:
+- Per ogni cella sappiamo "quanto è lontano il muro più vicino"
+- Quando compare o sparisce un ostacolo, si aggiorna solo la zona
+  intorno (onde "raise"/"lower" come in Lau et al., Dynamic EDT)
+- clearance_at(x, y) è una lettura di array: O(1)
+- gradient_at(xs, ys) indica la direzione per allontanarsi dagli ostacoli,
+  calcolato per molti punti insieme con NumPy
+
+Le distanze oltre max_distance non vengono propagate (restano "lontano"),
+così ogni update tocca solo un intorno limitato.
+
+Author: Andrea Vavassori
+"""
+
+import heapq
+import logging
+import math
+from typing import Dict, Tuple, Any, Union
+import numpy as np
+from scipy import ndimage
+
+INF = float('inf')
+NO_OBSTACLE = -1
+
+_NEIGHBORS_8 = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+class DistanceField:
+    """
+    Distance map dinamica (brushfire incrementale).
+
+    Per ogni cella:
+    - distance: distanza in pixel dall'ostacolo più vicino (inf oltre max_distance)
+    - nearest: indice piatto dell'ostacolo più vicino (-1 se nessuno entro max_distance)
+    """
+
+    def __init__(self, map_size: Tuple[int, int], max_distance_px: float = 20.0):
+        self.logger = logging.getLogger(__name__)
+
+        self.map_size = tuple(map_size)
+        self._width = self.map_size[1]
+        self.max_distance_px = float(max_distance_px)
+
+        self.distance = np.full(self.map_size, INF, dtype=np.float64)
+        self.nearest = np.full(self.map_size, NO_OBSTACLE, dtype=np.int64)
+        self.occupied = np.zeros(self.map_size, dtype=bool)
+
+        # Viste piatte per accesso per-cella nelle onde di update
+        self._distance_flat = self.distance.ravel()
+        self._nearest_flat = self.nearest.ravel()
+        self._occupied_flat = self.occupied.ravel()
+        self._to_raise = set()
+        self._open = []
+
+        self.stats = {
+            'obstacles_set': 0,
+            'obstacles_removed': 0,
+            'cells_processed': 0,
+            'rebuilds': 0
+        }
+
+    def rebuild(self, grid_map: np.ndarray):
+        """Calcolo completo (vettorizzato) - solo all'avvio o dopo load_map."""
+        occupied = grid_map == 1
+        self.occupied[...] = occupied
+        self._to_raise.clear()
+        self._open = []
+
+        if not np.any(occupied):
+            self.distance.fill(INF)
+            self.nearest.fill(NO_OBSTACLE)
+        else:
+            distance, indices = ndimage.distance_transform_edt(~occupied, return_indices=True)
+            nearest = np.ravel_multi_index((indices[0], indices[1]), self.map_size)
+
+            far = distance > self.max_distance_px
+            distance[far] = INF
+            nearest[far] = NO_OBSTACLE
+
+            self.distance[...] = distance
+            self.nearest[...] = nearest
+
+        self.stats['rebuilds'] += 1
+
+    def update_cells(self, xs: np.ndarray, ys: np.ndarray, occupied: Union[bool, np.ndarray]):
+        """
+        Aggiorna il campo per celle diventate occupate o libere.
+
+        Args:
+            xs, ys: Coordinate celle cambiate
+            occupied: Nuovo stato di occupazione (scalare o per cella)
+        """
+        occupied = np.broadcast_to(np.asarray(occupied, dtype=bool), np.shape(xs))
+        flat = np.ravel_multi_index((np.asarray(xs), np.asarray(ys)), self.map_size)
+
+        for cell, is_occupied in zip(flat.tolist(), occupied.tolist()):
+            if is_occupied and not self._occupied_flat[cell]:
+                self._set_obstacle(cell)
+            elif not is_occupied and self._occupied_flat[cell]:
+                self._remove_obstacle(cell)
+
+        self._process_queue()
+
+    def _set_obstacle(self, cell: int):
+        self._occupied_flat[cell] = True
+        self._nearest_flat[cell] = cell
+        self._distance_flat[cell] = 0.0
+        heapq.heappush(self._open, (0.0, cell))
+        self.stats['obstacles_set'] += 1
+
+    def _remove_obstacle(self, cell: int):
+        self._occupied_flat[cell] = False
+        self._clear_cell(cell)
+        self._to_raise.add(cell)
+        heapq.heappush(self._open, (0.0, cell))
+        self.stats['obstacles_removed'] += 1
+
+    def _clear_cell(self, cell: int):
+        self._distance_flat[cell] = INF
+        self._nearest_flat[cell] = NO_OBSTACLE
+
+    def _process_queue(self):
+        """Propaga onde raise (ostacolo rimosso) e lower (ostacolo aggiunto)."""
+        width = self._width
+        max_x, max_y = self.map_size
+        distance = self._distance_flat
+        nearest = self._nearest_flat
+        occupied = self._occupied_flat
+        to_raise = self._to_raise
+        max_distance = self.max_distance_px
+        processed = 0
+
+        while self._open:
+            key, cell = heapq.heappop(self._open)
+            processed += 1
+            x, y = divmod(cell, width)
+
+            if cell in to_raise:
+                # RAISE: invalida le celle che puntavano a ostacoli rimossi
+                for dx, dy in _NEIGHBORS_8:
+                    nx = x + dx
+                    ny = y + dy
+                    if not (0 <= nx < max_x and 0 <= ny < max_y):
+                        continue
+                    neighbor = nx * width + ny
+                    source = nearest[neighbor]
+                    if source == NO_OBSTACLE or neighbor in to_raise:
+                        continue
+                    old_distance = distance[neighbor]
+                    if not occupied[source]:
+                        self._clear_cell(neighbor)
+                        to_raise.add(neighbor)
+                    heapq.heappush(self._open, (old_distance, neighbor))
+                to_raise.discard(cell)
+
+            else:
+                source = nearest[cell]
+                if source == NO_OBSTACLE or not occupied[source]:
+                    continue
+                if key > distance[cell]:
+                    continue  # Entry obsoleta
+
+                # LOWER: propaga l'ostacolo più vicino ai vicini
+                sx, sy = divmod(int(source), width)
+                for dx, dy in _NEIGHBORS_8:
+                    nx = x + dx
+                    ny = y + dy
+                    if not (0 <= nx < max_x and 0 <= ny < max_y):
+                        continue
+                    neighbor = nx * width + ny
+                    if neighbor in to_raise:
+                        continue
+                    d = math.hypot(nx - sx, ny - sy)
+                    if d < distance[neighbor] and d <= max_distance:
+                        distance[neighbor] = d
+                        nearest[neighbor] = source
+                        heapq.heappush(self._open, (d, neighbor))
+
+        self.stats['cells_processed'] += processed
+
+    def clearance_at(self, x: int, y: int) -> float:
+        """Distanza (pixel) dall'ostacolo più vicino, saturata a max_distance. O(1)."""
+        return min(float(self.distance[x, y]), self.max_distance_px)
+
+    def clearance_many(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Clearance vettorizzata per molte celle."""
+        return np.minimum(self.distance[xs, ys], self.max_distance_px)
+
+    def gradient_at(self, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Gradiente della clearance (differenze centrali), vettorizzato.
+
+        Punta nella direzione in cui ci si allontana dagli ostacoli;
+        è zero dove tutti i vicini sono oltre max_distance.
+
+        Returns:
+            Tuple[ndarray, ndarray]: Componenti (gx, gy) per ogni cella
+        """
+        xs = np.asarray(xs, dtype=np.intp)
+        ys = np.asarray(ys, dtype=np.intp)
+        max_x = self.map_size[0] - 1
+        max_y = self.map_size[1] - 1
+
+        xp = np.minimum(xs + 1, max_x)
+        xm = np.maximum(xs - 1, 0)
+        yp = np.minimum(ys + 1, max_y)
+        ym = np.maximum(ys - 1, 0)
+
+        # Si satura solo i quattro vicini letti, non tutta la mappa
+        limit = self.max_distance_px
+        distance = self.distance
+        gx = (np.minimum(distance[xp, ys], limit) - np.minimum(distance[xm, ys], limit)) / np.maximum(xp - xm, 1)
+        gy = (np.minimum(distance[xs, yp], limit) - np.minimum(distance[xs, ym], limit)) / np.maximum(yp - ym, 1)
+        return gx, gy
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'max_distance_px': self.max_distance_px,
+            'stats': self.stats.copy()
+        }
+
+
+# Testing functions
+def test_distance_field(map_size: int = 2000, updates: int = 200):
+    """Test: campo incrementale vs ricalcolo completo dopo update casuali."""
+    import time
+
+    rng = np.random.default_rng(1)
+    grid = np.zeros((map_size, map_size), dtype=np.int8)
+    grid[0, :] = grid[-1, :] = grid[:, 0] = grid[:, -1] = 1
+    for _ in range(200):
+        x, y = rng.integers(10, map_size - 40, 2)
+        grid[x:x + rng.integers(2, 20), y:y + rng.integers(2, 20)] = 1
+
+    field = DistanceField(grid.shape, max_distance_px=20.0)
+    t0 = time.perf_counter()
+    field.rebuild(grid)
+    rebuild_ms = (time.perf_counter() - t0) * 1000
+
+    print(f"Testing DistanceField {map_size}x{map_size}...")
+    print(f"  Rebuild completo: {rebuild_ms:.0f}ms")
+
+    update_time = 0.0
+    for i in range(updates):
+        x, y = rng.integers(20, map_size - 20, 2)
+        value = 1 if i % 2 == 0 else 0
+        xs = np.arange(x, x + 5)
+        ys = np.full(5, y)
+        grid[xs, ys] = value
+
+        t0 = time.perf_counter()
+        field.update_cells(xs, ys, value == 1)
+        update_time += time.perf_counter() - t0
+
+    reference = DistanceField(grid.shape, max_distance_px=20.0)
+    reference.rebuild(grid)
+    diff = np.abs(np.minimum(field.distance, 20.0) - np.minimum(reference.distance, 20.0))
+    assert diff.max() < 1e-9, "Campo incrementale non coerente!"
+    print(f"  Update incrementale medio: {update_time / updates * 1000:.2f}ms")
+    print(f"  Errore max vs ricalcolo: {diff.max():.3f}px")
+
+    t0 = time.perf_counter()
+    for _ in range(10000):
+        field.clearance_at(1000, 1000)
+    print(f"  clearance_at: {(time.perf_counter() - t0) / 10000 * 1e6:.2f}µs")
+
+    xs = rng.integers(0, map_size, 10000)
+    ys = rng.integers(0, map_size, 10000)
+    t0 = time.perf_counter()
+    gx, gy = field.gradient_at(xs, ys)
+    print(f"  gradient_at (10000 punti): {(time.perf_counter() - t0) * 1000:.2f}ms")
+    clipped = np.minimum(field.distance, 20.0)
+    xp, xm = np.minimum(xs + 1, map_size - 1), np.maximum(xs - 1, 0)
+    assert np.allclose(gx, (clipped[xp, ys] - clipped[xm, ys]) / np.maximum(xp - xm, 1))
+
+
+if __name__ == "__main__":
+    test_distance_field()
@@ -17,22 +17,107 @@ Author: Andrea Vavassori
 
 import asyncio
 import logging
+import os
 import sqlite3
+import stat
 import json
 import time
 from pathlib import Path
 from typing import Dict, List, Optional, Any, Tuple
 import statistics
+import random
+from collections import OrderedDict
+import numpy as np
+
+from .db_writer import DatabaseWriter
+from .db_pool import ReadConnectionPool, DEFAULT_PRAGMAS, apply_pragmas
+from .experience_index import (ExperienceIndex, encode_situation, extract_features, canonical_situation,
+                               discretize_state, FEATURE_DIM, FEATURE_COLUMNS)
+from .experience_shards import SHARD_PREFIX, ShardRouter, ShardInfo, attach_shard, default_shard_dir, shard_files
+from .pattern_miner import PatternMiner
+
+# Versione schema (PRAGMA user_version): 1 = feature tipizzate in experiences,
+# 2 = aggregati experience_stats, 3 = situazioni internate (tabella situations),
+# 4 = righe grezze negli shard per periodo (experience_shards)
+SCHEMA_VERSION = 4
+
+# Bucket aggregati: ora (timestamp // 3600); ALL_TIME = totali di sempre
+HOUR_SECONDS = 3600
+ALL_TIME = -1
+
+EXPERIENCES_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp REAL NOT NULL,
+        distance_cm REAL,                  -- Feature tipizzate (indicizzabili)
+        light_level REAL,
+        battery_level REAL,
+        novelty REAL,
+        emotion TEXT,
+        state_id INTEGER,                  -- Stato discreto (discretize_state)
+        situation_id INTEGER,              -- Situazione internata (tabella situations)
+        situation TEXT,                    -- JSON inline (solo righe prima dello schema 3)
+        action TEXT NOT NULL,              -- Azione intrapresa
+        action_parameters TEXT,            -- JSON: parametri azione
+        outcome TEXT NOT NULL,             -- success/failure/partial
+        reward REAL DEFAULT 0.0,           -- Punteggio -1.0 to +1.0
+        duration_ms INTEGER DEFAULT 0,     -- Durata azione in ms
+        context TEXT,                      -- JSON: contesto aggiuntivo
+        learned_from INTEGER DEFAULT 0     -- 1 se usato per training
+    )
+"""
+
+EXPERIENCE_COLUMNS = ('timestamp',) + FEATURE_COLUMNS + (
+    'situation_id', 'action', 'action_parameters', 'outcome', 'reward', 'duration_ms')
+SITUATION_ID_INDEX = EXPERIENCE_COLUMNS.index('situation_id')
+INSERT_EXPERIENCE = (f"INSERT INTO experiences ({', '.join(EXPERIENCE_COLUMNS)}) "
+                     f"VALUES ({', '.join('?' * len(EXPERIENCE_COLUMNS))})")
+
+# Shard attivo collegato alla connessione del writer (ATTACH ... AS active)
+ACTIVE_SHARD = 'active'
+INSERT_ACTIVE_EXPERIENCE = INSERT_EXPERIENCE.replace('INTO experiences', f'INTO {ACTIVE_SHARD}.experiences', 1)
+
+SHARD_INDEXES = (
+    ('idx_timestamp', 'timestamp'),
+    ('idx_outcome', 'outcome'),
+    ('idx_action_distance', 'action, distance_cm'),
+    ('idx_distance', 'distance_cm'),
+    ('idx_state_action', 'state_id, action'),
+    ('idx_situation_id', 'situation_id'),
+)
+
+UPSERT_STATS = """
+    INSERT INTO experience_stats (hour_bucket, action, state_id, total, successes, failures, reward_sum)
+    VALUES (?, ?, ?, 1, ?, ?, ?)
+    ON CONFLICT (hour_bucket, action, state_id) DO UPDATE SET
+        total = total + 1,
+        successes = successes + excluded.successes,
+        failures = failures + excluded.failures,
+        reward_sum = reward_sum + excluded.reward_sum
+"""
+
+
+def create_shard_schema(connection: sqlite3.Connection, schema: str = 'main'):
+    """Tabella experiences e indici in uno shard (schema = nome dell'ATTACH)."""
+    connection.execute(EXPERIENCES_TABLE.format(name=f"{schema}.experiences"))
+    for name, columns in SHARD_INDEXES:
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {schema}.{name} ON experiences({columns})")
+
 
 class ExperienceDatabase:
     """
     Database per memorizzare e analizzare esperienze del robot.
     
     Tabelle principali:
-    - experiences: Situazione → Azione → Risultato
+    - experiences: Situazione → Azione → Risultato (un file shard per
+      periodo, vedi ShardRouter; il resto sta nel database principale)
     - objects: Oggetti riconosciuti nel tempo
     - locations: Luoghi interessanti mappati
-    - patterns: Pattern di comportamento scoperti
+    - patterns: Pattern di comportamento scoperti (sequenze frequenti
+      (stato, azione) → esito, vedi PatternMiner)
+    
+    Scritture: thread DatabaseWriter (group commit), mai sull'event loop.
+    Letture: pool di connessioni read-only (WAL: non aspettano il writer).
     """
     
     def __init__(self, config: dict, db_path: str = None):
@@ -46,21 +131,74 @@ class ExperienceDatabase:
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Connessione database
-        self.connection = None
+        # Connessioni: il writer possiede la scrittura, le letture girano
+        # nel pool read-only (l'event loop non aspetta mai SQLite)
+        self.writer: Optional[DatabaseWriter] = None
+        self.read_pool: Optional[ReadConnectionPool] = None
+        self.read_pool_size = self.config.get('read_pool_size', 2)
+        self.pragmas = {**DEFAULT_PRAGMAS, **self.config.get('pragmas', {})}
         self.is_initialized = False
         
         # Cache per performance (evita query ripetute)
         self.recent_experiences = []  # Ultimi 100 record
-        self.pattern_cache = {}       # Pattern di comportamento
+        self.pattern_cache = {}       # Pattern di comportamento: sequenza → esito previsto
         self.cache_max_size = 100
         
-        # Cache JSON parsing per evitare parsing ripetuto
-        self.situation_cache = {}     # Hash → parsed situation
+        # Indice vettoriale per find_similar_experiences (tutta la storia)
+        self.index = ExperienceIndex(self.config)
+        
+        # Shard per periodo: le righe grezze stanno in un file per giorno
+        # (period_hours), solo quello del periodo corrente è scritto
+        shard_config = self.config.get('shards', {})
+        self.shards = ShardRouter(shard_config.get('directory') or default_shard_dir(self.db_path),
+                                  shard_config.get('period_hours', 24))
+        self._active_start: Optional[float] = None         # Periodo dello shard attivo (event loop)
+        self._writer_shard_start: Optional[float] = None   # Idem visto dal thread writer
         
-        # Batch operations per performance
-        self.pending_experiences = []  # Buffer per batch insert
-        self.batch_size = 10          # Inserisci ogni N esperienze
+        # Backup: database principale + shard attivo (i sigillati una volta sola);
+        # le copie degli shard cancellati dalla retention vengono rimosse
+        self.backup_interval = self.config.get('backup_interval', 3600)
+        self.backup_dir = Path(self.config.get('backup_dir', self.db_path.parent / 'backups'))
+        self._next_backup = 0.0
+        self._backup_future: Optional[asyncio.Future] = None
+        
+        # JSON completo della situazione: opzionale (le feature principali
+        # sono comunque in colonne tipizzate). Le situazioni ripetute sono
+        # salvate una volta sola (tabella situations, chiave = hash canonico)
+        self.store_situation_json = self.config.get('store_situation_json', True)
+        self.situation_digits = self.config.get('situation_digits', 1)        # decimali forma canonica
+        self.situation_cache_size = self.config.get('situation_cache_size', 4096)
+        self._situation_ids: OrderedDict = OrderedDict()  # LRU hash → (id, last_seen) (solo thread writer)
+        self.situation_stats = {
+            'cache_hits': 0,
+            'lookups': 0,
+            'inserted': 0
+        }
+        
+        # Retention: righe grezze per raw_days, poi solo aggregati + campioni
+        retention_config = self.config.get('retention', {})
+        self.raw_retention_days = retention_config.get('raw_days', 14)
+        self.hourly_stats_days = retention_config.get('hourly_stats_days', 90)  # poi bucket giornalieri
+        self.samples_per_state = retention_config.get('samples_per_state', 20)  # reservoir per (stato, azione)
+        self.compaction_interval = retention_config.get('interval', 600.0)      # s tra controlli
+        self.compaction_step_interval = retention_config.get('step_interval', 1.0)  # s tra passi con arretrato
+        self.compaction_step_rows = retention_config.get('step_rows', 2000)     # righe cancellate per passo
+        self.vacuum_pages = retention_config.get('vacuum_pages', 256)           # pagine restituite per passo
+        self._next_compaction = 0.0
+        self._compaction_future: Optional[asyncio.Future] = None
+        self._rng = random.Random()
+        
+        # Pattern: sequenze frequenti contate in memoria fissa, le migliori
+        # salvate ogni persist_interval secondi in patterns e pattern_cache
+        self.pattern_miner = PatternMiner(self.config)
+        pattern_config = self.config.get('pattern_mining', {})
+        self.pattern_persist_interval = pattern_config.get('persist_interval', 300)
+        self.pattern_persist_top = pattern_config.get('persist_top', 200)
+        self._next_pattern_save = 0.0
+        
+        # Group commit nel thread writer: commit ogni N scritture o ogni T secondi
+        self.batch_size = self.config.get('write_batch_size', 50)
+        self.flush_interval = self.config.get('flush_interval', 1.0)
         
         # Statistics
         self.stats = {
@@ -82,15 +220,27 @@ class ExperienceDatabase:
             bool: True se inizializzazione ok
         """
         try:
-            # Connetti a SQLite
-            self.connection = sqlite3.connect(str(self.db_path))
-            self.connection.row_factory = sqlite3.Row  # Accesso per nome colonna
+            # Avvia writer (WAL + PRAGMA) e crea tabelle (nel thread writer)
+            self.writer = DatabaseWriter(self.db_path, self.batch_size, self.flush_interval,
+                                         on_connect=lambda conn: apply_pragmas(conn, self.pragmas))
+            self.writer.start()
+            await self.writer.submit(self._create_tables, commit=True)
+            await self.writer.submit(self._move_legacy_experiences, transaction=False)
+            self.shards.refresh()
             
-            # Crea tabelle
-            await self._create_tables()
+            # Pool letture (il file esiste già: read-only)
+            self.read_pool = ReadConnectionPool(self.db_path, self.read_pool_size, self.pragmas)
             
-            # Carica cache iniziale
+            # Intervalli id degli shard, cache iniziale e indice similarità
+            await self._scan_shards()
             await self._load_initial_cache()
+            await self._load_index()
+            await self._load_patterns()
+            
+            # Shard del periodo corrente collegato al writer
+            await self._rotate_shard(self.shards.period_start(time.time()))
+            self._next_backup = time.time() + self.backup_interval
+            self._next_pattern_save = time.time() + self.pattern_persist_interval
             
             self.is_initialized = True
             self.logger.info("Database esperienze inizializzato con successo")
@@ -100,30 +250,165 @@ class ExperienceDatabase:
             self.logger.error(f"Errore inizializzazione database: {e}")
             return False
     
-    async def _create_tables(self):
-        """Crea struttura tabelle database."""
-        cursor = self.connection.cursor()
+    async def _read(self, fn, *args):
+        """Esegue fn(connection, *args) su una connessione del pool letture."""
+        return await self.read_pool.run(fn, *args)
+    
+    @staticmethod
+    def _fetch_rows(connection: sqlite3.Connection, sql: str, parameters: tuple = ()) -> List[Dict[str, Any]]:
+        return [dict(row) for row in connection.execute(sql, parameters).fetchall()]
+    
+    @staticmethod
+    def _fetch_experiences(connection: sqlite3.Connection, schema: str, clauses: str = "",
+                           parameters: tuple = ()) -> List[Dict[str, Any]]:
+        """Righe experiences di uno shard (alias e) con il JSON della situazione internata in 'situation'."""
+        rows = connection.execute(f"""
+            SELECT e.*, s.situation AS interned_situation
+            FROM {schema}.experiences e LEFT JOIN main.situations s ON s.id = e.situation_id
+            {clauses}
+        """, parameters).fetchall()
+        experiences = []
+        for row in rows:
+            experience = dict(row)
+            interned = experience.pop('interned_situation')
+            if interned is not None:
+                experience['situation'] = interned
+            experiences.append(experience)
+        return experiences
+    
+    @classmethod
+    def _fetch_from_shards(cls, connection: sqlite3.Connection, shards: List[ShardInfo], clauses: str = "",
+                           parameters: tuple = (), limit: int = None) -> List[Dict[str, Any]]:
+        """
+        Stessa query su più shard, dal più recente (pool letture).
+        
+        Gli shard non si sovrappongono nel tempo: con ORDER BY timestamp DESC
+        ci si ferma appena raccolte limit righe.
+        """
+        experiences = []
+        for shard in shards:
+            schema = attach_shard(connection, shard)
+            if schema is None:
+                continue
+            experiences.extend(cls._fetch_experiences(connection, schema, clauses, parameters))
+            if limit is not None and len(experiences) >= limit:
+                return experiences[:limit]
+        return experiences
+    
+    @classmethod
+    def _fetch_by_ids(cls, connection: sqlite3.Connection,
+                      routed: List[Tuple[ShardInfo, List[int]]]) -> List[Dict[str, Any]]:
+        """Esperienze per id, già raggruppati per shard (ShardRouter.for_ids)."""
+        experiences = []
+        for shard, ids in routed:
+            schema = attach_shard(connection, shard)
+            if schema is not None:
+                experiences.extend(cls._fetch_experiences(
+                    connection, schema, f"WHERE e.id IN ({','.join('?' * len(ids))})", tuple(ids)))
+        return experiences
+    
+    @staticmethod
+    def _shard_ranges(connection: sqlite3.Connection, shards: List[ShardInfo]) -> List[Tuple[float, int, int, int]]:
+        ranges = []
+        for shard in shards:
+            schema = attach_shard(connection, shard)
+            if schema is None:
+                continue
+            try:
+                first_id, last_id, rows = connection.execute(
+                    f"SELECT MIN(id), MAX(id), COUNT(*) FROM {schema}.experiences").fetchone()
+            except sqlite3.OperationalError:
+                continue  # File senza tabella (es. creazione interrotta)
+            ranges.append((shard.start, first_id, last_id, rows))
+        return ranges
+    
+    async def _scan_shards(self):
+        """Intervallo id e righe di ogni shard (instradamento delle ricerche per id)."""
+        for start, first_id, last_id, rows in await self._read(self._shard_ranges, self.shards.covering()):
+            shard = self.shards.shards.get(start)
+            if shard is not None:
+                shard.first_id, shard.last_id, shard.rows = first_id, last_id, rows
+    
+    def _create_tables(self, connection: sqlite3.Connection):
+        """Crea struttura tabelle database (thread writer, commit del writer)."""
+        cursor = connection.cursor()
+        
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        
+        # Esperienze nel database principale (schema < 4): prima si portano
+        # allo schema 3 qui, poi _move_legacy_experiences le sposta negli shard
+        legacy = self._has_legacy_experiences(connection)
+        if legacy:
+            self._migrate_experiences(connection)
         
-        # Tabella principale esperienze
+        # Dizionario situazioni: ogni situazione canonica salvata una volta
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS experiences (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp REAL NOT NULL,
-                situation TEXT NOT NULL,           -- JSON: sensori, posizione, contesto
-                action TEXT NOT NULL,              -- Azione intrapresa
-                action_parameters TEXT,            -- JSON: parametri azione
-                outcome TEXT NOT NULL,             -- success/failure/partial
-                reward REAL DEFAULT 0.0,           -- Punteggio -1.0 to +1.0
-                duration_ms INTEGER DEFAULT 0,     -- Durata azione in ms
-                context TEXT,                      -- JSON: contesto aggiuntivo
-                learned_from INTEGER DEFAULT 0     -- 1 se usato per training
+            CREATE TABLE IF NOT EXISTS situations (
+                id INTEGER PRIMARY KEY,
+                hash INTEGER NOT NULL UNIQUE,      -- blake2b 64 bit della forma canonica
+                situation TEXT NOT NULL,           -- JSON canonico
+                last_seen REAL                     -- Inizio dell'ultimo shard che la usa
+            )
+        """)
+        situation_columns = {row[1] for row in connection.execute("PRAGMA table_info(situations)")}
+        if 'last_seen' not in situation_columns:
+            cursor.execute("ALTER TABLE situations ADD COLUMN last_seen REAL")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_situations_last_seen ON situations(last_seen)")
+        if legacy:
+            experience_columns = {row[1] for row in connection.execute("PRAGMA table_info(experiences)")}
+            if 'situation_id' not in experience_columns:
+                cursor.execute("ALTER TABLE experiences ADD COLUMN situation_id INTEGER")
+            if version < 3:
+                self._intern_legacy_situations(connection)
+        
+        # Shard scaduti in corso di campionamento (retention a passi)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS shard_retention (
+                shard_start REAL PRIMARY KEY,      -- Inizio periodo dello shard
+                last_id INTEGER NOT NULL           -- Ultimo id già passato dal reservoir
             )
         """)
         
-        # Indici per performance
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON experiences(timestamp)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_situation ON experiences(situation)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_outcome ON experiences(outcome)")
+        # Aggregati per azione / stato discreto / ora, aggiornati nella stessa
+        # transazione degli insert: gli insights non scansionano la storia
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS experience_stats (
+                hour_bucket INTEGER NOT NULL,      -- timestamp // 3600, -1 = totale di sempre
+                action TEXT NOT NULL,
+                state_id INTEGER NOT NULL,
+                total INTEGER DEFAULT 0,           -- Tutti gli esiti
+                successes INTEGER DEFAULT 0,
+                failures INTEGER DEFAULT 0,
+                reward_sum REAL DEFAULT 0.0,
+                PRIMARY KEY (hour_bucket, action, state_id)
+            ) WITHOUT ROWID
+        """)
+        if version < 2 and legacy:
+            self._backfill_stats(connection)
+        
+        # Campioni per replay delle esperienze compattate (reservoir per stato/azione)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS experience_samples (
+                state_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                slot INTEGER NOT NULL,             -- Posizione nel reservoir
+                experience_id INTEGER NOT NULL,
+                {', '.join(column for column in EXPERIENCE_COLUMNS if column not in ('state_id', 'action'))},
+                PRIMARY KEY (state_id, action, slot)
+            ) WITHOUT ROWID
+        """)
+        sample_columns = {row[1] for row in connection.execute("PRAGMA table_info(experience_samples)")}
+        if 'situation_id' not in sample_columns:
+            cursor.execute("ALTER TABLE experience_samples ADD COLUMN situation_id INTEGER")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_samples_situation ON experience_samples(situation_id)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS experience_sample_seen (
+                state_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                seen INTEGER DEFAULT 0,            -- Righe passate dal reservoir
+                PRIMARY KEY (state_id, action)
+            ) WITHOUT ROWID
+        """)
         
         # Tabella oggetti riconosciuti
         cursor.execute("""
@@ -138,6 +423,7 @@ class ExperienceDatabase:
                 interaction_count INTEGER DEFAULT 0
             )
         """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_objects_type_time ON objects(object_type, timestamp)")
         
         # Tabella luoghi di interesse
         cursor.execute("""
@@ -167,32 +453,334 @@ class ExperienceDatabase:
                 created_timestamp REAL NOT NULL
             )
         """)
+        pattern_columns = {row[1] for row in cursor.execute("PRAGMA table_info(patterns)")}
+        if 'outcomes' not in pattern_columns:
+            # Distribuzione esiti (JSON) e reward medio dei pattern di sequenza
+            cursor.execute("ALTER TABLE patterns ADD COLUMN outcomes TEXT")
+            cursor.execute("ALTER TABLE patterns ADD COLUMN avg_reward REAL DEFAULT 0.0")
         
-        self.connection.commit()
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         self.logger.debug("Tabelle database create/verificate")
     
-    async def _load_initial_cache(self):
-        """Carica cache iniziale dal database."""
-        cursor = self.connection.cursor()
+    @staticmethod
+    def _has_legacy_experiences(connection: sqlite3.Connection) -> bool:
+        return connection.execute(
+            "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'experiences'"
+        ).fetchone() is not None
+    
+    @staticmethod
+    def _backfill_stats(connection: sqlite3.Connection):
+        """Schema 1 → 2: ricalcola gli aggregati dalla storia esistente."""
+        connection.execute("DELETE FROM experience_stats")
+        for bucket in (f"CAST(timestamp / {HOUR_SECONDS} AS INTEGER)", str(ALL_TIME)):
+            connection.execute(f"""
+                INSERT INTO experience_stats (hour_bucket, action, state_id, total, successes, failures, reward_sum)
+                SELECT {bucket}, action, COALESCE(state_id, 0), COUNT(*),
+                       SUM(outcome = 'success'), SUM(outcome = 'failure'), COALESCE(SUM(reward), 0.0)
+                FROM experiences
+                GROUP BY 1, 2, 3
+            """)
+    
+    def _intern_situation(self, connection: sqlite3.Connection, situation_hash: int, text: str) -> int:
+        """
+        Id della situazione canonica (LRU → indice UNIQUE → INSERT). Thread writer.
         
-        # Carica ultimi N esperienze in cache
-        cursor.execute("""
-            SELECT * FROM experiences 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        """, (self.cache_max_size,))
+        last_seen = inizio dello shard attivo: aggiornato al più una volta
+        per situazione e periodo, serve a togliere le situazioni orfane
+        quando la retention cancella uno shard.
+        """
+        shard_start = self._writer_shard_start
+        cached = self._situation_ids.get(situation_hash)
+        if cached is not None:
+            self._situation_ids.move_to_end(situation_hash)
+            self.situation_stats['cache_hits'] += 1
+            situation_id, last_seen = cached
+        else:
+            self.situation_stats['lookups'] += 1
+            row = connection.execute("SELECT id, last_seen FROM situations WHERE hash = ?",
+                                     (situation_hash,)).fetchone()
+            if row is not None:
+                situation_id, last_seen = row[0], row[1]
+            else:
+                situation_id = connection.execute(
+                    "INSERT INTO situations (hash, situation, last_seen) VALUES (?, ?, ?)",
+                    (situation_hash, text, shard_start)
+                ).lastrowid
+                last_seen = shard_start
+                self.situation_stats['inserted'] += 1
         
-        self.recent_experiences = [dict(row) for row in cursor.fetchall()]
+        if shard_start is not None and (last_seen is None or last_seen < shard_start):
+            connection.execute("UPDATE situations SET last_seen = ? WHERE id = ?", (shard_start, situation_id))
+            last_seen = shard_start
         
-        # Carica statistiche base
-        cursor.execute("SELECT COUNT(*) as total FROM experiences")
-        self.stats['total_experiences'] = cursor.fetchone()['total']
+        self._situation_ids[situation_hash] = (situation_id, last_seen)
+        if len(self._situation_ids) > self.situation_cache_size:
+            self._situation_ids.popitem(last=False)
+        return situation_id
+    
+    def _intern_legacy_situations(self, connection: sqlite3.Connection, chunk_size: int = 5000):
+        """Schema 2 → 3: JSON inline delle righe esistenti → situations."""
+        interned = 0
+        while True:
+            rows = connection.execute("""
+                SELECT id, situation FROM experiences WHERE situation IS NOT NULL LIMIT ?
+            """, (chunk_size,)).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                try:
+                    situation = json.loads(row['situation'])
+                except ValueError:
+                    situation = None
+                situation_id = (self._intern_situation(connection, *canonical_situation(situation, self.situation_digits))
+                                if isinstance(situation, dict) else None)
+                updates.append((situation_id, row['id']))
+            connection.executemany("UPDATE experiences SET situation_id = ?, situation = NULL WHERE id = ?", updates)
+            interned += len(updates)
+        if interned:
+            self.logger.info(f"Situazioni internate: {interned} esperienze")
+    
+    def _insert_experience(self, connection: sqlite3.Connection, values: tuple,
+                           situation_key: Optional[Tuple[int, str]] = None) -> int:
+        """Insert nello shard attivo + situazione internata + aggregati (thread writer, stessa transazione)."""
+        if situation_key is not None:
+            values = list(values)
+            values[SITUATION_ID_INDEX] = self._intern_situation(connection, *situation_key)
+        experience_id = connection.execute(INSERT_ACTIVE_EXPERIENCE, values).lastrowid
+        row = dict(zip(EXPERIENCE_COLUMNS, values))
+        success = int(row['outcome'] == 'success')
+        failure = int(row['outcome'] == 'failure')
+        for bucket in (int(row['timestamp'] // HOUR_SECONDS), ALL_TIME):
+            connection.execute(UPSERT_STATS, (bucket, row['action'], row['state_id'],
+                                              success, failure, row['reward']))
+        return experience_id
+    
+    def _attach_writable_shard(self, connection: sqlite3.Connection, schema: str, path: Path):
+        """ATTACH in scrittura (crea file e tabella se mancano). Thread writer, fuori transazione."""
+        if path.exists() and not path.stat().st_mode & stat.S_IWUSR:
+            # Riga arrivata per un periodo già sigillato (es. orologio tornato indietro)
+            os.chmod(path, 0o644)
+            self.logger.warning(f"Shard sigillato riaperto in scrittura: {path.name}")
+        connection.execute(f"ATTACH DATABASE ? AS {schema}", (str(path),))
+        for name in ('journal_mode', 'synchronous'):
+            if name in self.pragmas:
+                connection.execute(f"PRAGMA {schema}.{name} = {self.pragmas[name]}").fetchall()
+        connection.execute("BEGIN")
+        create_shard_schema(connection, schema)
+        connection.execute("COMMIT")
+    
+    def _detach_shard(self, connection: sqlite3.Connection, schema: str, path: Path, seal: bool) -> bool:
+        """
+        DETACH dello shard; se seal, lo sigilla (periodo finito).
         
-        cursor.execute("SELECT COUNT(*) as success FROM experiences WHERE outcome = 'success'")
-        self.stats['successful_actions'] = cursor.fetchone()['success']
+        Sigillare: checkpoint del WAL nel file principale, journal DELETE se
+        nessun lettore lo tiene aperto (così resta un file solo), permessi di
+        sola lettura. Dopo il checkpoint il .db da solo è completo.
+        """
+        connection.execute(f"PRAGMA {schema}.wal_checkpoint(TRUNCATE)").fetchall()
+        if seal:
+            try:
+                connection.execute(f"PRAGMA {schema}.journal_mode = DELETE").fetchall()
+            except sqlite3.OperationalError:
+                pass  # Lettori collegati: resta in WAL (con -wal vuoto)
+        connection.execute(f"DETACH DATABASE {schema}")
+        if seal:
+            os.chmod(path, 0o444)
+            self.logger.info(f"Shard sigillato: {path.name}")
+        return seal
+    
+    def _activate_shard(self, connection: sqlite3.Connection, start: float, seed_id: int,
+                        seal_previous: bool) -> Dict[str, Any]:
+        """
+        Cambia lo shard attivo del writer (lavoro fuori transazione).
         
-        cursor.execute("SELECT COUNT(*) as failed FROM experiences WHERE outcome = 'failure'")
-        self.stats['failed_actions'] = cursor.fetchone()['failed']
+        Il nuovo shard riparte dall'ultimo id usato (sqlite_sequence), così
+        gli id restano unici su tutta la storia.
+        """
+        attached = {row[1]: row[2] for row in connection.execute("PRAGMA database_list")}
+        sealed = None
+        if ACTIVE_SHARD in attached:
+            row = connection.execute(
+                f"SELECT seq FROM {ACTIVE_SHARD}.sqlite_sequence WHERE name = 'experiences'").fetchone()
+            seed_id = max(seed_id, row[0] if row else 0)
+            previous = Path(attached[ACTIVE_SHARD])
+            if self._detach_shard(connection, ACTIVE_SHARD, previous, seal_previous):
+                sealed = previous.name
+        
+        path = self.shards.path_for(start)
+        self._attach_writable_shard(connection, ACTIVE_SHARD, path)
+        connection.execute("BEGIN")
+        connection.execute(f"""
+            INSERT INTO {ACTIVE_SHARD}.sqlite_sequence (name, seq)
+            SELECT 'experiences', 0
+            WHERE NOT EXISTS (SELECT 1 FROM {ACTIVE_SHARD}.sqlite_sequence WHERE name = 'experiences')
+        """)
+        connection.execute(f"UPDATE {ACTIVE_SHARD}.sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'experiences'",
+                           (seed_id,))
+        connection.execute("COMMIT")
+        self._writer_shard_start = start
+        return {'path': str(path), 'seed_id': seed_id, 'sealed': sealed}
+    
+    def _rotate_shard(self, start: float) -> asyncio.Future:
+        """Rende attivo lo shard del periodo start (le scritture accodate dopo vanno lì)."""
+        previous, self._active_start = self._active_start, start
+        # Sigilla il precedente solo se il suo periodo è finito
+        seal = previous is not None and previous < self.shards.period_start(time.time())
+        future = self.writer.submit(self._activate_shard, start, self.shards.max_id(), seal, transaction=False)
+        future.add_done_callback(lambda f: self._on_shard_activated(f, start))
+        return future
+    
+    def _on_shard_activated(self, future: asyncio.Future, start: float):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.logger.error(f"Errore cambio shard: {future.exception()}")
+            if self._active_start == start:
+                self._active_start = None  # Si riprova alla prossima scrittura
+            return
+        self.shards.add(start)
+        self.logger.debug(f"Shard attivo: {future.result()['path']}")
+    
+    def _submit_experience(self, values: tuple, situation_key: Optional[Tuple[int, str]] = None) -> asyncio.Future:
+        """Accoda l'insert nello shard del periodo di values[0] (rotazione se serve)."""
+        start = self.shards.period_start(values[0])
+        if start != self._active_start:
+            self._rotate_shard(start)
+        future = self.writer.submit(self._insert_experience, values, situation_key)
+        future.add_done_callback(lambda f: self._on_shard_insert(f, start))
+        return future
+    
+    def _on_shard_insert(self, future: asyncio.Future, start: float):
+        if not future.cancelled() and future.exception() is None:
+            self.shards.record_id(start, future.result())
+    
+    def _move_legacy_experiences(self, connection: sqlite3.Connection) -> int:
+        """
+        Schema 3 → 4: righe di experiences del database principale → shard.
+        
+        Un periodo alla volta (lavoro fuori transazione: serve ATTACH). Gli
+        id restano quelli originali; INSERT OR IGNORE rende ripetibile una
+        migrazione interrotta.
+        """
+        if not self._has_legacy_experiences(connection):
+            return 0
+        
+        self.logger.info("Migrazione esperienze negli shard per periodo...")
+        period = self.shards.period
+        current = self.shards.period_start(time.time())
+        columns = ', '.join(('id', 'timestamp') + FEATURE_COLUMNS + (
+            'situation_id', 'situation', 'action', 'action_parameters', 'outcome', 'reward', 'duration_ms',
+            'context', 'learned_from'))
+        keys = [row[0] for row in connection.execute(
+            f"SELECT DISTINCT CAST(timestamp / {period} AS INTEGER) FROM main.experiences")]
+        
+        moved = 0
+        for key in sorted(keys):
+            start = key * period
+            path = self.shards.path_for(start)
+            self._attach_writable_shard(connection, 'migration', path)
+            connection.execute("BEGIN")
+            moved += connection.execute(f"""
+                INSERT OR IGNORE INTO migration.experiences ({columns})
+                SELECT {columns} FROM main.experiences WHERE CAST(timestamp / {period} AS INTEGER) = ?
+            """, (key,)).rowcount
+            connection.execute("""
+                UPDATE main.situations SET last_seen = MAX(COALESCE(last_seen, 0), ?)
+                WHERE id IN (SELECT situation_id FROM migration.experiences)
+            """, (start,))
+            connection.execute(f"DELETE FROM main.experiences WHERE CAST(timestamp / {period} AS INTEGER) = ?",
+                               (key,))
+            connection.execute("COMMIT")
+            self._detach_shard(connection, 'migration', path, seal=start < current)
+        
+        connection.execute("DROP TABLE main.experiences")
+        self.logger.info(f"Migrazione shard completata: {moved} esperienze in {len(keys)} shard")
+        self._enable_incremental_vacuum(connection)
+        return moved
+    
+    def _enable_incremental_vacuum(self, connection: sqlite3.Connection):
+        """
+        auto_vacuum=INCREMENTAL su un database creato senza (una volta sola).
+        
+        Il PRAGMA su un file che ha già tabelle vale solo dopo un VACUUM
+        completo: qui costa poco perché le righe grezze sono appena uscite
+        verso gli shard. Senza, incremental_vacuum della compattazione non
+        restituirebbe mai pagine al filesystem.
+        """
+        if str(self.pragmas.get('auto_vacuum', '')).upper() not in ('INCREMENTAL', '2'):
+            return
+        if connection.execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2:
+            return
+        try:
+            connection.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+            connection.execute("VACUUM main")
+            self.logger.info("Database principale convertito ad auto_vacuum INCREMENTAL")
+        except sqlite3.OperationalError as e:
+            self.logger.warning(f"auto_vacuum INCREMENTAL non attivato ({e}): "
+                                f"serve un VACUUM manuale di {self.db_path.name}")
+    
+    def _migrate_experiences(self, connection: sqlite3.Connection, chunk_size: int = 5000):
+        """
+        Schema 0 → 1: situation JSON NOT NULL → feature tipizzate.
+        
+        SQLite non può togliere NOT NULL con ALTER: si ricrea la tabella
+        copiando a blocchi (stessa transazione del writer).
+        """
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(experiences)")}
+        if 'state_id' in columns:
+            return
+        
+        self.logger.info("Migrazione tabella experiences a colonne tipizzate...")
+        connection.execute("DROP INDEX IF EXISTS idx_situation")
+        connection.execute(EXPERIENCES_TABLE.format(name='experiences_migration'))
+        
+        migrated = 0
+        columns = ('id', 'timestamp') + FEATURE_COLUMNS + (
+            'situation', 'action', 'action_parameters', 'outcome', 'reward', 'duration_ms', 'context', 'learned_from')
+        insert = (f"INSERT INTO experiences_migration ({', '.join(columns)}) "
+                  f"VALUES ({', '.join('?' * len(columns))})")
+        rows = connection.execute("SELECT * FROM experiences ORDER BY id")
+        while True:
+            chunk = rows.fetchmany(chunk_size)
+            if not chunk:
+                break
+            values = []
+            for row in chunk:
+                try:
+                    situation = json.loads(row['situation'])
+                except (ValueError, TypeError):
+                    situation = {}
+                features = extract_features(situation if isinstance(situation, dict) else {})
+                values.append((row['id'], row['timestamp'],
+                               *(features[column] for column in FEATURE_COLUMNS),
+                               row['situation'], row['action'], row['action_parameters'], row['outcome'],
+                               row['reward'], row['duration_ms'], row['context'], row['learned_from']))
+            connection.executemany(insert, values)
+            migrated += len(values)
+        
+        connection.execute("DROP TABLE experiences")
+        connection.execute("ALTER TABLE experiences_migration RENAME TO experiences")
+        self.logger.info(f"Migrazione completata: {migrated} esperienze")
+    
+    async def _load_initial_cache(self):
+        """Carica cache iniziale dal database."""
+        # Carica ultimi N esperienze in cache
+        self.recent_experiences = await self._read(self._fetch_from_shards, self.shards.covering(), """
+            ORDER BY e.timestamp DESC 
+            LIMIT ?
+        """, (self.cache_max_size,), self.cache_max_size)
+        
+        # Carica statistiche base (dagli aggregati)
+        counts = (await self._read(self._fetch_rows, """
+            SELECT COALESCE(SUM(total), 0) as total,
+                   COALESCE(SUM(successes), 0) as success,
+                   COALESCE(SUM(failures), 0) as failed
+            FROM experience_stats WHERE hour_bucket = ?
+        """, (ALL_TIME,)))[0]
+        self.stats['total_experiences'] = counts['total']
+        self.stats['successful_actions'] = counts['success']
+        self.stats['failed_actions'] = counts['failed']
         
         # Calcola learning rate (miglioramento nel tempo)
         if self.stats['total_experiences'] > 0:
@@ -221,30 +809,30 @@ class ExperienceDatabase:
             duration_ms: Quanto tempo ha preso l'azione
             
         Returns:
-            int: ID dell'esperienza registrata
+            int: ID dell'esperienza registrata (provvisorio: il valore reale
+                 arriva nella cache dopo il commit del writer)
         """
         try:
-            cursor = self.connection.cursor()
             timestamp = time.time()
             
-            # Converti dict in JSON per storage
-            situation_json = json.dumps(situation)
+            # Feature tipizzate + JSON (opzionale) per storage
+            features = extract_features(situation)
+            situation_key = (canonical_situation(situation, self.situation_digits)
+                             if self.store_situation_json else None)
             parameters_json = json.dumps(action_parameters) if action_parameters else None
             
-            # Aggiungi al buffer per batch insert
-            experience_data = (timestamp, situation_json, action, parameters_json, outcome, reward, duration_ms)
-            self.pending_experiences.append(experience_data)
-            experience_id = len(self.recent_experiences) + len(self.pending_experiences)  # ID temporaneo
-            
-            # Batch insert quando buffer è pieno
-            if len(self.pending_experiences) >= self.batch_size:
-                await self._flush_pending_experiences()
+            # Accoda al writer (non blocca: il commit avviene a gruppi)
+            experience_data = (timestamp, *(features[column] for column in FEATURE_COLUMNS),
+                               None, action, parameters_json, outcome, reward, duration_ms)
+            future = self._submit_experience(experience_data, situation_key)
+            experience_id = self.stats['total_experiences'] + 1  # ID temporaneo
             
             # Aggiorna cache
             new_experience = {
                 'id': experience_id,
                 'timestamp': timestamp,
-                'situation': situation_json,
+                **features,
+                'situation': situation_key[1] if situation_key else None,
                 'action': action,
                 'outcome': outcome,
                 'reward': reward,
@@ -254,6 +842,13 @@ class ExperienceDatabase:
             self.recent_experiences.insert(0, new_experience)
             if len(self.recent_experiences) > self.cache_max_size:
                 self.recent_experiences.pop()
+            vector = encode_situation(situation)
+            future.add_done_callback(lambda f: self._on_experience_written(f, new_experience, vector))
+            
+            # Sequenze (stato, azione) → esito: conteggio in memoria, salvataggio periodico
+            self.pattern_miner.observe(features['state_id'], action, outcome, reward, timestamp)
+            if timestamp >= self._next_pattern_save:
+                self.save_patterns(timestamp)
             
             # Aggiorna statistics
             self.stats['total_experiences'] += 1
@@ -271,27 +866,72 @@ class ExperienceDatabase:
             self.logger.error(f"Errore registrazione esperienza: {e}")
             return -1
     
-    async def _flush_pending_experiences(self):
-        """Esegue batch insert delle esperienze in buffer."""
-        if not self.pending_experiences:
+    def _on_experience_written(self, future: asyncio.Future, experience: Dict[str, Any], vector: np.ndarray):
+        """Dopo il commit: ID reale in cache e indice, oppure log dell'errore."""
+        if future.cancelled():
             return
-            
-        try:
-            cursor = self.connection.cursor()
-            cursor.executemany("""
-                INSERT INTO experiences 
-                (timestamp, situation, action, action_parameters, outcome, reward, duration_ms)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, self.pending_experiences)
-            
-            self.connection.commit()
-            self.logger.debug(f"Batch insert completato: {len(self.pending_experiences)} esperienze")
-            self.pending_experiences.clear()
-            
-        except Exception as e:
-            self.logger.error(f"Errore batch insert: {e}")
-            # Ripristina buffer se errore
-            pass
+        if future.exception() is not None:
+            self.logger.error(f"Errore batch insert: {future.exception()}")
+            # Il rollback può aver tolto situazioni appena internate: LRU da rifare
+            if self.writer is not None:
+                self.writer.submit(lambda connection: self._situation_ids.clear())
+            return
+        experience['id'] = future.result()
+        self.index.add(experience['id'], vector)
+    
+    async def _load_index(self):
+        """Codifica la storia esistente nell'indice (nel pool letture)."""
+        ids, vectors = await self._read(self._encode_history, self.shards.covering())
+        self.index.add_batch(ids, vectors)
+        self.logger.debug(f"Indice similarità: {self.index.size} esperienze")
+    
+    @staticmethod
+    def _encode_history(connection: sqlite3.Connection, shards: List[ShardInfo],
+                        chunk_size: int = 10000) -> Tuple[np.ndarray, np.ndarray]:
+        ids, vectors = [], []
+        decoded = {}  # situation_id → vettore: situazioni internate decodificate una volta
+        for shard in shards:
+            schema = attach_shard(connection, shard)
+            if schema is None:
+                continue
+            cursor = connection.execute(f"""
+                SELECT e.id, e.situation_id, COALESCE(s.situation, e.situation) AS situation,
+                       {', '.join('e.' + column for column in FEATURE_COLUMNS)}
+                FROM {schema}.experiences e LEFT JOIN main.situations s ON s.id = e.situation_id
+                ORDER BY e.id
+            """)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    if row['situation_id'] in decoded:
+                        vectors.append(decoded[row['situation_id']])
+                        ids.append(row['id'])
+                        continue
+                    if row['situation'] is not None:
+                        try:
+                            situation = json.loads(row['situation'])
+                        except ValueError:
+                            continue  # Situazione non decodificabile: fuori dall'indice
+                    else:
+                        # Senza JSON: solo le feature tipizzate
+                        situation = {column: row[column] for column in FEATURE_COLUMNS if row[column] is not None}
+                        situation['current_emotion'] = situation.pop('emotion', None)
+                    if isinstance(situation, dict):
+                        vector = encode_situation(situation)
+                        if row['situation_id'] is not None:
+                            decoded[row['situation_id']] = vector
+                        vectors.append(vector)
+                        ids.append(row['id'])
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty((0, FEATURE_DIM), dtype=np.float32)
+        return np.asarray(ids, dtype=np.int64), np.stack(vectors)
+    
+    async def flush(self):
+        """Attende il commit di tutte le scritture accodate."""
+        if self.writer is not None:
+            await self.writer.flush()
     
     async def find_similar_experiences(self, 
                                      current_situation: Dict[str, Any],
@@ -299,6 +939,9 @@ class ExperienceDatabase:
         """
         Trova esperienze simili alla situazione corrente per imparare.
         
+        k-NN sui vettori di tutta la storia (ExperienceIndex), poi lettura
+        delle sole righe trovate per chiave primaria.
+        
         Args:
             current_situation: Situazione attuale sensori/contesto
             limit: Max numero esperienze da restituire
@@ -307,110 +950,70 @@ class ExperienceDatabase:
             List[Dict]: Lista esperienze simili ordinate per rilevanza
         """
         try:
-            # Per ora usa un matching semplice basato su chiavi comuni
-            # In futuro si può implementare similarity più sofisticata
-            
-            similar_experiences = []
+            if self.index.size == 0:
+                return []
             
-            # Prima cerca nella cache (più veloce)
-            for exp in self.recent_experiences:
-                similarity = self._calculate_similarity(current_situation, exp)
-                if similarity > 0.3:  # Soglia minima similarità
-                    exp['similarity_score'] = similarity
-                    similar_experiences.append(exp)
+            # Ricerca in executor: con storie grandi può (ri)costruire il KD-tree
+            loop = asyncio.get_running_loop()
+            matches = await loop.run_in_executor(
+                None, self.index.search, encode_situation(current_situation), limit
+            )
+            if not matches:
+                return []
             
-            # Se non abbastanza nella cache, cerca nel database
-            if len(similar_experiences) < limit:
-                cursor = self.connection.cursor()
-                cursor.execute("""
-                    SELECT * FROM experiences 
-                    WHERE outcome IN ('success', 'failure')
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                """, (limit * 2,))  # Prendi più records per fare filtering
-                
-                db_experiences = [dict(row) for row in cursor.fetchall()]
-                
-                for exp in db_experiences:
-                    if exp not in self.recent_experiences:  # Evita duplicati
-                        similarity = self._calculate_similarity(current_situation, exp)
-                        if similarity > 0.3:
-                            exp['similarity_score'] = similarity
-                            similar_experiences.append(exp)
+            ids = [experience_id for experience_id, _ in matches]
+            rows = await self._read(self._fetch_by_ids, self.shards.for_ids(ids))
+            by_id = {row['id']: row for row in rows}
             
-            # Ordina per similarity score e limita risultati
-            similar_experiences.sort(key=lambda x: x['similarity_score'], reverse=True)
-            return similar_experiences[:limit]
+            similar_experiences = []
+            for experience_id, similarity in matches:
+                experience = by_id.get(experience_id)
+                if experience is not None:
+                    experience['similarity_score'] = similarity
+                    similar_experiences.append(experience)
+            return similar_experiences
             
         except Exception as e:
             self.logger.error(f"Errore ricerca esperienze simili: {e}")
             return []
     
-    def _calculate_similarity(self, situation1: Dict[str, Any], experience: Dict[str, Any]) -> float:
+    async def query_experiences(self,
+                                action: str = None,
+                                min_distance: float = None,
+                                max_distance: float = None,
+                                state_id: int = None,
+                                outcome: str = None,
+                                since: float = None,
+                                limit: int = 100) -> List[Dict[str, Any]]:
         """
-        Calcola similarità tra situazione corrente e esperienza passata.
+        Filtra esperienze sulle colonne tipizzate (query indicizzata).
+        
+        Esempio: query_experiences(action='stop', max_distance=30)
         
         Returns:
-            float: Score similarità 0.0-1.0
+            List[Dict]: Esperienze più recenti che rispettano i filtri
         """
+        filters = (
+            ('e.action = ?', action),
+            ('e.distance_cm >= ?', min_distance),
+            ('e.distance_cm < ?', max_distance),
+            ('e.state_id = ?', state_id),
+            ('e.outcome = ?', outcome),
+            ('e.timestamp >= ?', since),
+        )
+        clauses = [clause for clause, value in filters if value is not None]
+        parameters = tuple(value for _, value in filters if value is not None)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
         try:
-            # Parse JSON della situazione dell'esperienza con caching
-            situation_str = experience.get('situation')
-            if isinstance(situation_str, str):
-                # Usa cache per evitare parsing ripetuto
-                if situation_str in self.situation_cache:
-                    exp_situation = self.situation_cache[situation_str]
-                else:
-                    exp_situation = json.loads(situation_str)
-                    # Mantieni cache limitata
-                    if len(self.situation_cache) < 1000:
-                        self.situation_cache[situation_str] = exp_situation
-            else:
-                exp_situation = experience.get('situation', {})
-            
-            # Cerca chiavi comuni e calcola differenze
-            common_keys = set(situation1.keys()) & set(exp_situation.keys())
-            
-            if not common_keys:
-                return 0.0
-            
-            total_similarity = 0.0
-            weight_sum = 0.0
-            
-            for key in common_keys:
-                weight = 1.0  # Peso uguale per ora, in futuro si può raffinare
-                
-                val1 = situation1[key]
-                val2 = exp_situation[key]
-                
-                # Calcola similarità based su tipo di dato
-                if isinstance(val1, (int, float)) and isinstance(val2, (int, float)):
-                    # Per numeri, usa differenza normalizzata
-                    max_val = max(abs(val1), abs(val2), 1)  # Evita divisione per 0
-                    diff = abs(val1 - val2) / max_val
-                    similarity = max(0, 1.0 - diff)
-                    
-                elif isinstance(val1, str) and isinstance(val2, str):
-                    # Per stringhe, match esatto o parziale
-                    if val1 == val2:
-                        similarity = 1.0
-                    elif val1 in val2 or val2 in val1:
-                        similarity = 0.7
-                    else:
-                        similarity = 0.0
-                        
-                else:
-                    # Altri tipi, match esatto
-                    similarity = 1.0 if val1 == val2 else 0.0
-                
-                total_similarity += similarity * weight
-                weight_sum += weight
-            
-            return total_similarity / weight_sum if weight_sum > 0 else 0.0
-            
+            # Solo gli shard dei periodi richiesti (since), dal più recente
+            return await self._read(self._fetch_from_shards, self.shards.covering(since=since), f"""
+                {where}
+                ORDER BY e.timestamp DESC
+                LIMIT ?
+            """, parameters + (limit,), limit)
         except Exception as e:
-            self.logger.debug(f"Errore calcolo similarità: {e}")
-            return 0.0
+            self.logger.error(f"Errore query esperienze: {e}")
+            return []
     
     async def get_success_rate_for_action(self, action: str, 
                                         situation_context: Dict[str, Any] = None) -> float:
@@ -425,21 +1028,22 @@ class ExperienceDatabase:
             float: Tasso successo 0.0-1.0
         """
         try:
-            cursor = self.connection.cursor()
-            
             if situation_context:
                 # Cerca esperienze simili con quest'azione
                 similar_experiences = await self.find_similar_experiences(situation_context)
                 action_experiences = [exp for exp in similar_experiences if exp['action'] == action]
             else:
                 # Tutte le esperienze con quest'azione
-                cursor.execute("""
-                    SELECT outcome FROM experiences 
-                    WHERE action = ? AND outcome IN ('success', 'failure')
-                """, (action,))
-                
-                results = cursor.fetchall()
-                action_experiences = [{'outcome': row['outcome']} for row in results]
+                # Totali di sempre dagli aggregati (nessuna scansione)
+                totals = (await self._read(self._fetch_rows, """
+                    SELECT COALESCE(SUM(successes), 0) as successes,
+                           COALESCE(SUM(successes + failures), 0) as attempts
+                    FROM experience_stats
+                    WHERE hour_bucket = ? AND action = ?
+                """, (ALL_TIME, action)))[0]
+                if totals['attempts'] == 0:
+                    return 0.5
+                return totals['successes'] / totals['attempts']
             
             if not action_experiences:
                 return 0.5  # Nessun dato = probabilità neutra
@@ -459,8 +1063,6 @@ class ExperienceDatabase:
             dict: Insights e statistiche di apprendimento
         """
         try:
-            cursor = self.connection.cursor()
-            
             insights = {
                 'timestamp': time.time(),
                 'total_experiences': self.stats['total_experiences'],
@@ -471,19 +1073,19 @@ class ExperienceDatabase:
                 'recent_performance': {}
             }
             
-            # Azioni più riuscite
-            cursor.execute("""
+            # Azioni più riuscite (aggregati di sempre: O(azioni × stati))
+            rows = await self._read(self._fetch_rows, """
                 SELECT action, 
-                       COUNT(*) as total,
-                       SUM(CASE WHEN outcome = 'success' THEN 1 ELSE 0 END) as successes,
-                       CAST(SUM(CASE WHEN outcome = 'success' THEN 1 ELSE 0 END) AS FLOAT) / COUNT(*) as success_rate
-                FROM experiences 
-                WHERE outcome IN ('success', 'failure')
+                       SUM(successes + failures) as total,
+                       SUM(successes) as successes,
+                       CAST(SUM(successes) AS FLOAT) / SUM(successes + failures) as success_rate
+                FROM experience_stats 
+                WHERE hour_bucket = ?
                 GROUP BY action
-                HAVING COUNT(*) >= 5
+                HAVING SUM(successes + failures) >= 5
                 ORDER BY success_rate DESC
                 LIMIT 5
-            """)
+            """, (ALL_TIME,))
             
             insights['most_successful_actions'] = [
                 {
@@ -491,19 +1093,17 @@ class ExperienceDatabase:
                     'success_rate': row['success_rate'],
                     'total_attempts': row['total']
                 }
-                for row in cursor.fetchall()
+                for row in rows
             ]
             
-            # Performance recente (ultima ora)
-            one_hour_ago = time.time() - 3600
-            cursor.execute("""
-                SELECT COUNT(*) as recent_total,
-                       SUM(CASE WHEN outcome = 'success' THEN 1 ELSE 0 END) as recent_successes
-                FROM experiences 
-                WHERE timestamp > ? AND outcome IN ('success', 'failure')
-            """, (one_hour_ago,))
-            
-            recent_data = cursor.fetchone()
+            # Performance recente (bucket dell'ora corrente e precedente)
+            current_hour = int(time.time() // HOUR_SECONDS)
+            recent_data = (await self._read(self._fetch_rows, """
+                SELECT COALESCE(SUM(successes + failures), 0) as recent_total,
+                       COALESCE(SUM(successes), 0) as recent_successes
+                FROM experience_stats 
+                WHERE hour_bucket >= ?
+            """, (current_hour - 1,)))[0]
             if recent_data['recent_total'] > 0:
                 insights['recent_performance'] = {
                     'total_actions': recent_data['recent_total'],
@@ -531,14 +1131,477 @@ class ExperienceDatabase:
         
         return first_success_rate - second_success_rate  # Positivo = miglioramento
     
+    async def upsert_objects(self, records: List[Dict[str, Any]]) -> Optional[List[int]]:
+        """
+        Scrive un blocco di oggetti (mappa semantica) in una sola transazione.
+        
+        Args:
+            records: dict con id (None = nuovo), timestamp, object_type,
+                     confidence, position_x, position_y (metri), properties
+            
+        Returns:
+            List[int]: Id database di ogni record (stesso ordine), None se errore
+        """
+        try:
+            ids = await self.writer.submit(self._upsert_objects, records, commit=True)
+            self.logger.debug(f"Oggetti sincronizzati: {len(records)}")
+            return ids
+            
+        except Exception as e:
+            self.logger.error(f"Errore sync oggetti: {e}")
+            return None
+    
+    @staticmethod
+    def _upsert_objects(connection: sqlite3.Connection, records: List[Dict[str, Any]]) -> List[int]:
+        cursor = connection.cursor()
+        ids = []
+        for record in records:
+            values = (record['timestamp'], record['object_type'], record['confidence'],
+                      record['position_x'], record['position_y'], json.dumps(record.get('properties') or {}))
+            if record.get('id') is None:
+                cursor.execute("""
+                    INSERT INTO objects (timestamp, object_type, confidence, position_x, position_y, properties)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, values)
+                ids.append(cursor.lastrowid)
+            else:
+                cursor.execute("""
+                    UPDATE objects
+                    SET timestamp = ?, object_type = ?, confidence = ?, position_x = ?, position_y = ?, properties = ?
+                    WHERE id = ?
+                """, values + (record['id'],))
+                ids.append(record['id'])
+        return ids
+    
+    async def load_objects(self) -> List[Dict[str, Any]]:
+        """Tutti gli oggetti salvati (properties già decodificate)."""
+        try:
+            rows = await self._read(self._fetch_rows, "SELECT * FROM objects ORDER BY timestamp")
+            for record in rows:
+                record['properties'] = json.loads(record['properties']) if record['properties'] else {}
+            return rows
+            
+        except Exception as e:
+            self.logger.error(f"Errore caricamento oggetti: {e}")
+            return []
+    
+    def maybe_compact(self, now: float = None) -> Optional[asyncio.Future]:
+        """
+        Avvia un passo di compattazione se è il momento (non blocca).
+        
+        Con arretrato i passi si susseguono ogni step_interval, altrimenti
+        si ricontrolla ogni interval. Da chiamare nel loop principale.
+        
+        Returns:
+            asyncio.Future: Risultato del passo, None se non avviato
+        """
+        now = time.time() if now is None else now
+        if self.writer is None or now < self._next_compaction:
+            return None
+        if self._compaction_future is not None and not self._compaction_future.done():
+            return None
+        
+        self._next_compaction = now + self.compaction_interval
+        
+        # Shard archiviati/cancellati a mano escono dall'instradamento
+        self.shards.refresh()
+        expired = [shard for shard in self.shards.expired(now - self.raw_retention_days * 86400)
+                   if shard.start != self._active_start]
+        retiring = (expired[0].start, expired[0].end, expired[0].path) if expired else None
+        self._compaction_future = self.writer.submit(self._compact_step, now, retiring, len(expired) > 1,
+                                                     commit=True)
+        self._compaction_future.add_done_callback(self._on_compaction_step)
+        return self._compaction_future
+    
+    async def compact(self, now: float = None, max_steps: int = 1000) -> Dict[str, int]:
+        """Compatta fino a esaurire l'arretrato (manutenzione/test)."""
+        totals = {'deleted': 0, 'sampled': 0, 'shards_deleted': 0, 'situations_deleted': 0, 'stats_folded': 0,
+                  'vacuumed_pages': 0}
+        for _ in range(max_steps):
+            self._next_compaction = 0.0
+            future = self.maybe_compact(now)
+            if future is None:
+                future = self._compaction_future
+            result = await future
+            for key in totals:
+                totals[key] += result[key]
+            if result['done']:
+                break
+        return totals
+    
+    def _on_compaction_step(self, future: asyncio.Future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.logger.error(f"Errore compattazione: {future.exception()}")
+            return
+        result = future.result()
+        if result['deleted_ids']:
+            self.index.remove(result['deleted_ids'])
+        if result['retired_shard'] is not None:
+            self.shards.remove(result['retired_shard'])
+        if not result['done']:
+            self._next_compaction = time.time() + self.compaction_step_interval
+        if result['deleted'] or result['stats_folded'] or result['vacuumed_pages']:
+            self.logger.debug(f"Compattazione: {result['deleted']} righe, {result['sampled']} campioni, "
+                              f"{result['stats_folded']} aggregati, {result['vacuumed_pages']} pagine")
+    
+    def _compact_step(self, connection: sqlite3.Connection, now: float,
+                      retiring: Optional[Tuple[float, float, Path]] = None, more: bool = False) -> Dict[str, Any]:
+        """
+        Un passo di compattazione a budget (thread writer, una transazione).
+        
+        1. Shard scaduto (righe più vecchie di raw_days): step_rows righe
+           alla volta nel reservoir (gli aggregati le contengono già
+           dall'insert); finito il campionamento si cancella il file intero
+           e le situazioni viste l'ultima volta in quel periodo
+        2. Bucket orari più vecchi di hourly_stats_days → bucket giornalieri
+        3. PRAGMA incremental_vacuum di vacuum_pages pagine
+        
+        Args:
+            retiring: (inizio, fine, path) dello shard scaduto più vecchio
+            more: Altri shard scaduti dopo questo
+        """
+        result = {'deleted': 0, 'sampled': 0, 'shards_deleted': 0, 'situations_deleted': 0, 'stats_folded': 0,
+                  'vacuumed_pages': 0, 'deleted_ids': [], 'retired_shard': None, 'done': True}
+        
+        # 1. Retention a shard interi (avanzamento salvato: riprende dopo un riavvio)
+        if retiring is not None:
+            start, end, path = retiring
+            progress = connection.execute("SELECT last_id FROM shard_retention WHERE shard_start = ?",
+                                          (start,)).fetchone()
+            rows = []
+            if Path(path).exists():
+                shard = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+                shard.row_factory = sqlite3.Row
+                try:
+                    rows = shard.execute(f"""
+                        SELECT id, {', '.join(EXPERIENCE_COLUMNS)} FROM experiences
+                        WHERE id > ? ORDER BY id LIMIT ?
+                    """, (progress[0] if progress else 0, self.compaction_step_rows)).fetchall()
+                finally:
+                    shard.close()
+            
+            if rows:
+                result['sampled'] = self._reservoir_sample(connection, rows)
+                connection.execute("INSERT OR REPLACE INTO shard_retention (shard_start, last_id) VALUES (?, ?)",
+                                   (start, rows[-1]['id']))
+                result['deleted'] = len(rows)
+                result['deleted_ids'] = [row['id'] for row in rows]
+                result['done'] = False
+            else:
+                for file in shard_files(path):
+                    file.unlink(missing_ok=True)
+                connection.execute("DELETE FROM shard_retention WHERE shard_start = ?", (start,))
+                result['shards_deleted'] = 1
+                result['retired_shard'] = start
+                
+                # Situazioni usate solo da shard ormai cancellati (e non dai campioni)
+                orphans = connection.execute("""
+                    DELETE FROM situations WHERE last_seen < ?
+                      AND NOT EXISTS (SELECT 1 FROM experience_samples x WHERE x.situation_id = situations.id)
+                """, (end,)).rowcount
+                if orphans:
+                    self._situation_ids.clear()  # LRU può puntare a id cancellati
+                result['situations_deleted'] = orphans
+                result['done'] = not more
+        
+        # 2. Downsampling aggregati orari → giornalieri (bucket = prima ora del giorno)
+        cutoff_hour = int((now - self.hourly_stats_days * 86400) // HOUR_SECONDS)
+        buckets = [row[0] for row in connection.execute("""
+            SELECT DISTINCT hour_bucket FROM experience_stats
+            WHERE hour_bucket >= 0 AND hour_bucket < ? AND hour_bucket % 24 != 0
+            LIMIT 48
+        """, (cutoff_hour,))]
+        if buckets:
+            placeholders = ','.join('?' * len(buckets))
+            connection.execute(f"""
+                INSERT INTO experience_stats (hour_bucket, action, state_id, total, successes, failures, reward_sum)
+                SELECT hour_bucket - hour_bucket % 24, action, state_id,
+                       SUM(total), SUM(successes), SUM(failures), SUM(reward_sum)
+                FROM experience_stats WHERE hour_bucket IN ({placeholders})
+                GROUP BY 1, 2, 3
+                ON CONFLICT (hour_bucket, action, state_id) DO UPDATE SET
+                    total = total + excluded.total,
+                    successes = successes + excluded.successes,
+                    failures = failures + excluded.failures,
+                    reward_sum = reward_sum + excluded.reward_sum
+            """, buckets)
+            result['stats_folded'] = connection.execute(
+                f"DELETE FROM experience_stats WHERE hour_bucket IN ({placeholders})", buckets
+            ).rowcount
+            result['done'] = result['done'] and len(buckets) < 48
+        
+        # 3. Restituisci pagine libere al filesystem (solo con auto_vacuum=INCREMENTAL)
+        free_before = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        if free_before:
+            # Il modulo sqlite3 fa un solo step per execute: un passo = una pagina
+            for _ in range(min(free_before, int(self.vacuum_pages))):
+                connection.execute("PRAGMA incremental_vacuum(1)")
+            result['vacuumed_pages'] = free_before - connection.execute("PRAGMA freelist_count").fetchone()[0]
+            auto_vacuum = connection.execute("PRAGMA auto_vacuum").fetchone()[0]
+            result['done'] = result['done'] and (auto_vacuum != 2 or result['vacuumed_pages'] < self.vacuum_pages)
+        
+        return result
+    
+    def _reservoir_sample(self, connection: sqlite3.Connection, rows: List[sqlite3.Row]) -> int:
+        """Algorithm R per (state_id, action): max samples_per_state righe uniformi."""
+        if self.samples_per_state <= 0:
+            return 0
+        seen = {}
+        for row in connection.execute("SELECT state_id, action, seen FROM experience_sample_seen"):
+            seen[(row['state_id'], row['action'])] = row['seen']
+        
+        sample_columns = [column for column in EXPERIENCE_COLUMNS if column not in ('state_id', 'action')]
+        samples = []
+        touched = set()
+        for row in rows:
+            key = (row['state_id'] if row['state_id'] is not None else 0, row['action'])
+            touched.add(key)
+            count = seen.get(key, 0)
+            slot = count if count < self.samples_per_state else self._rng.randrange(count + 1)
+            seen[key] = count + 1
+            if slot < self.samples_per_state:
+                samples.append(key + (slot, row['id']) + tuple(row[column] for column in sample_columns))
+        
+        connection.executemany(f"""
+            INSERT OR REPLACE INTO experience_samples
+            (state_id, action, slot, experience_id, {', '.join(sample_columns)})
+            VALUES ({', '.join('?' * (len(sample_columns) + 4))})
+        """, samples)
+        connection.executemany("""
+            INSERT OR REPLACE INTO experience_sample_seen (state_id, action, seen) VALUES (?, ?, ?)
+        """, [key + (seen[key],) for key in touched])
+        return len(samples)
+    
+    def maybe_backup(self, now: float = None) -> Optional[asyncio.Future]:
+        """
+        Backup ogni backup_interval in un executor (non blocca).
+        
+        Si copia solo ciò che è cambiato dall'ultimo backup: database
+        principale e shard attivo; uno shard sigillato una volta sola.
+        Le copie degli shard non più presenti (retention o compattazione)
+        vengono cancellate, così backup_dir non cresce senza limite.
+        
+        Returns:
+            asyncio.Future: Esito del backup, None se non avviato
+        """
+        now = time.time() if now is None else now
+        if not self.is_initialized or now < self._next_backup:
+            return None
+        if self._backup_future is not None and not self._backup_future.done():
+            return None
+        
+        self._next_backup = now + self.backup_interval
+        sources = [self.db_path] + [shard.path for shard in self.shards.covering()]
+        loop = asyncio.get_running_loop()
+        self._backup_future = loop.run_in_executor(None, self._backup_files, sources, self.backup_dir)
+        self._backup_future.add_done_callback(self._on_backup)
+        return self._backup_future
+    
+    @staticmethod
+    def _backup_files(sources: List[Path], backup_dir: Path) -> Dict[str, Any]:
+        """
+        Copia coerente (API backup SQLite) dei file modificati dopo la loro
+        ultima copia; rimuove le copie degli shard che non esistono più.
+        """
+        backup_dir.mkdir(parents=True, exist_ok=True)
+        result = {'copied': [], 'skipped': 0, 'bytes': 0, 'pruned': []}
+        for source in sources:
+            files = [file for file in shard_files(source) if file.exists()]
+            if not source.exists() or not files:
+                continue
+            # In WAL le scritture recenti toccano solo il -wal: conta il più recente
+            modified = max(file.stat().st_mtime for file in files)
+            target = backup_dir / source.name
+            if target.exists() and target.stat().st_mtime >= modified:
+                result['skipped'] += 1
+                continue
+            
+            temporary = target.with_name(target.name + '.tmp')
+            temporary.unlink(missing_ok=True)
+            reader = sqlite3.connect(f"{source.resolve().as_uri()}?mode=ro", uri=True)
+            copy = sqlite3.connect(temporary)
+            try:
+                reader.backup(copy)
+            finally:
+                copy.close()
+                reader.close()
+            os.replace(temporary, target)
+            os.utime(target, (modified, modified))  # Confronto alla prossima copia
+            result['copied'].append(source.name)
+            result['bytes'] += target.stat().st_size
+        
+        # Shard scaduti: la copia resterebbe per sempre (e i .tmp di copie interrotte)
+        current = {source.name for source in sources}
+        for stale in backup_dir.glob(f"{SHARD_PREFIX}*.db*"):
+            if stale.name.endswith('.tmp') or stale.name not in current:
+                stale.unlink(missing_ok=True)
+                result['pruned'].append(stale.name)
+        return result
+    
+    def _on_backup(self, future: asyncio.Future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.logger.error(f"Errore backup database: {future.exception()}")
+            return
+        result = future.result()
+        if result['copied']:
+            self.logger.info(f"Backup database: {', '.join(result['copied'])} "
+                             f"({result['bytes'] // 1024}KB, {result['skipped']} invariati)")
+        if result['pruned']:
+            self.logger.info(f"Backup rimossi (shard cancellati): {', '.join(result['pruned'])}")
+    
+    async def get_situation_stats(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Situazioni più frequenti con esito medio (GROUP BY su id intero).
+        
+        Returns:
+            List[Dict]: situation_id, situation (JSON), count, success_rate, avg_reward
+        """
+        return await self._read(self._situation_counts, self.shards.covering(), limit)
+    
+    @staticmethod
+    def _situation_counts(connection: sqlite3.Connection, shards: List[ShardInfo], limit: int) -> List[Dict[str, Any]]:
+        # GROUP BY in ogni shard, somme parziali unite qui
+        totals: Dict[int, List[float]] = {}
+        for shard in shards:
+            schema = attach_shard(connection, shard)
+            if schema is None:
+                continue
+            for situation_id, count, successes, reward_sum, rewards in connection.execute(f"""
+                SELECT situation_id, COUNT(*), SUM(outcome = 'success'), SUM(reward), COUNT(reward)
+                FROM {schema}.experiences WHERE situation_id IS NOT NULL
+                GROUP BY situation_id
+            """):
+                total = totals.setdefault(situation_id, [0, 0, 0.0, 0])
+                total[0] += count
+                total[1] += successes
+                total[2] += reward_sum or 0.0
+                total[3] += rewards
+        
+        top = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        if not top:
+            return []
+        ids = [situation_id for situation_id, _ in top]
+        situations = dict(connection.execute(
+            f"SELECT id, situation FROM main.situations WHERE id IN ({','.join('?' * len(ids))})", ids).fetchall())
+        return [
+            {
+                'situation_id': situation_id,
+                'situation': situations[situation_id],
+                'count': count,
+                'success_rate': successes / count,
+                'avg_reward': reward_sum / rewards if rewards else None
+            }
+            for situation_id, (count, successes, reward_sum, rewards) in top
+            if situation_id in situations
+        ]
+    
+    def save_patterns(self, now: float = None) -> Optional[asyncio.Future]:
+        """
+        Aggiorna pattern_cache e la tabella patterns con le sequenze più
+        frequenti del miner (sostituisce i pattern di sequenza salvati prima).
+        
+        Returns:
+            asyncio.Future: Scrittura accodata al writer, None se nessun pattern
+        """
+        now = time.time() if now is None else now
+        self._next_pattern_save = now + self.pattern_persist_interval
+        patterns = self.pattern_miner.top_patterns(self.pattern_persist_top)
+        if not patterns or self.writer is None:
+            return None
+        self.pattern_cache = {pattern['sequence']: pattern for pattern in patterns}
+        future = self.writer.submit(self._replace_patterns, patterns)
+        future.add_done_callback(self._on_patterns_saved)
+        return future
+    
+    @staticmethod
+    def _replace_patterns(connection: sqlite3.Connection, patterns: List[Dict[str, Any]]) -> int:
+        connection.execute("DELETE FROM patterns WHERE pattern_type LIKE 'sequence_%'")
+        connection.executemany("""
+            INSERT INTO patterns (pattern_type, trigger_conditions, action_sequence, success_rate,
+                                  usage_count, last_used, created_timestamp, outcomes, avg_reward)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (f"sequence_{len(pattern['sequence'])}",
+             json.dumps({'states': [state_id for state_id, _ in pattern['sequence']]}),
+             json.dumps([action for _, action in pattern['sequence']]),
+             pattern['success_rate'], pattern['count'], pattern['last_seen'], pattern['first_seen'],
+             json.dumps(pattern['outcomes']), pattern['avg_reward'])
+            for pattern in patterns
+        ])
+        return len(patterns)
+    
+    def _on_patterns_saved(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            self.logger.error(f"Errore salvataggio pattern: {future.exception()}")
+    
+    async def _load_patterns(self):
+        """Pattern di sequenza salvati → pattern_cache e miner (ripartenza)."""
+        rows = await self._read(self._fetch_rows, """
+            SELECT * FROM patterns WHERE pattern_type LIKE 'sequence_%' ORDER BY usage_count DESC
+        """)
+        patterns = []
+        for row in rows:
+            sequence = tuple(zip(json.loads(row['trigger_conditions'])['states'],
+                                 json.loads(row['action_sequence'])))
+            outcomes = json.loads(row['outcomes'] or '{}')
+            patterns.append({
+                'sequence': sequence,
+                'count': row['usage_count'],
+                'error': 0,
+                'outcomes': outcomes,
+                'predicted_outcome': max(outcomes, key=outcomes.get) if outcomes else 'unknown',
+                'success_rate': row['success_rate'],
+                'avg_reward': row['avg_reward'] or 0.0,
+                'first_seen': row['created_timestamp'],
+                'last_seen': row['last_used']
+            })
+        self.pattern_cache = {pattern['sequence']: pattern for pattern in patterns}
+        self.pattern_miner.seed(patterns)
+    
+    def predict_outcome(self, situation: Dict[str, Any], action: str) -> Optional[Dict[str, Any]]:
+        """
+        Esito previsto di action nella situazione, dal pattern salvato più
+        specifico che la segue ai passi appena registrati (al massimo
+        max_length - 1 ricerche in pattern_cache, niente query).
+        
+        Returns:
+            Dict: Pattern (sequence, predicted_outcome, success_rate,
+                  avg_reward, count, ...) o None se nessuno corrisponde
+        """
+        for key in self.pattern_miner.context(discretize_state(situation), action):
+            pattern = self.pattern_cache.get(key)
+            if pattern is not None:
+                return pattern
+        return None
+    
+    async def get_replay_samples(self, state_id: int = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Campioni conservati delle esperienze compattate (per experience replay)."""
+        where, parameters = ("WHERE state_id = ?", (state_id,)) if state_id is not None else ("", ())
+        return await self._read(self._fetch_rows, f"""
+            SELECT * FROM experience_samples {where} LIMIT ?
+        """, parameters + (limit,))
+    
     async def cleanup(self):
         """Cleanup database connection."""
         try:
-            # Flush pending experiences prima di chiudere
-            await self._flush_pending_experiences()
+            if self._backup_future is not None and not self._backup_future.done():
+                await self._backup_future
+            
+            # Ultimi pattern prima di chiudere il writer
+            patterns_future = self.save_patterns()
+            if patterns_future is not None:
+                await patterns_future
+            
+            # Il writer committa quanto ancora in coda prima di fermarsi
+            if self.writer is not None:
+                await self.writer.close()
             
-            if self.connection:
-                self.connection.close()
+            if self.read_pool is not None:
+                await self.read_pool.close()
                 self.logger.info("Database connessione chiusa")
         except Exception as e:
             self.logger.error(f"Errore cleanup database: {e}")
@@ -548,21 +1611,25 @@ class ExperienceDatabase:
 async def test_experience_db():
     """Test del database esperienze."""
     import random
+    import shutil
     
     # Setup database di test
     test_db_path = "data/test_experiences.db"
     
-    # Rimuovi database precedente se esiste
+    # Rimuovi database precedente (e i suoi shard) se esiste
     if Path(test_db_path).exists():
         Path(test_db_path).unlink()
+    shutil.rmtree(default_shard_dir(test_db_path), ignore_errors=True)
     
     config = {
         'system': {
             'database': {
-                'path': test_db_path
+                'path': test_db_path,
+                'backup_dir': 'data/test_backups'
             }
         }
     }
+    shutil.rmtree('data/test_backups', ignore_errors=True)
     
     db = ExperienceDatabase(config)
     
@@ -605,6 +1672,10 @@ async def test_experience_db():
         if i % 10 == 0:
             print(f"  Registrate {i+1} esperienze...")
     
+    await db.flush()
+    writer_state = db.writer.get_state()
+    print(f"Writer: {writer_state['operations']} scritture in {writer_state['commits']} commit")
+    
     # Test ricerca esperienze simili
     print("\nTestando ricerca esperienze simili...")
     
@@ -634,9 +1705,214 @@ async def test_experience_db():
     for action in insights['most_successful_actions']:
         print(f"  {action['action']}: {action['success_rate']:.2f} ({action['total_attempts']} tentativi)")
     
+    # Aggregati coerenti con la storia (aggiornati negli stessi commit)
+    aggregated = (await db._read(db._fetch_rows, """
+        SELECT SUM(total) as n FROM experience_stats WHERE hour_bucket = -1
+    """))[0]['n']
+    stored = len(await db.query_experiences(limit=10 ** 6))
+    print(f"Aggregati: {aggregated} esperienze, shard: {stored} ({db.shards.covering()[0].path.name})")
+    assert aggregated == stored
+    
+    # Interning: flusso realistico (sensori quantizzati, stato che cambia piano)
+    situation_totals = "SELECT COUNT(*) as n, COALESCE(SUM(LENGTH(situation)), 0) as bytes FROM situations"
+    before = (await db._read(db._fetch_rows, situation_totals))[0]
+    inline_bytes, distance = 0, 100
+    for i in range(2000):
+        distance = min(300, max(5, distance + random.choice([-1, 0, 0, 1])))
+        situation = {'distance_cm': float(distance), 'light_levels': [520, 515, 530, 525], 'battery_level': 80,
+                     'camera_frame': True, 'current_emotion': 'curious', 'speed_multiplier': 0.7,
+                     'novelty': random.choice([0.0, 0.1, 0.2])}
+        inline_bytes += len(json.dumps(situation))
+        await db.record_experience(situation, random.choice(actions), None, 'success', 0.5, 100)
+    await db.flush()
+    after = (await db._read(db._fetch_rows, situation_totals))[0]
+    interned_bytes = after['bytes'] - before['bytes'] + 2000 * 8  # + id intero per riga
+    top_situation = (await db.get_situation_stats(1))[0]
+    print(f"\nInterning: {after['n'] - before['n']} situazioni uniche su 2000, "
+          f"byte situazione {inline_bytes // 1024}KB → {interned_bytes // 1024}KB, "
+          f"LRU hit {db.situation_stats['cache_hits']}")
+    print(f"  Situazione più frequente: {top_situation['count']} volte")
+    assert inline_bytes > 3 * interned_bytes
+
+    # Pattern: avanti nello spazio libero poi stop vicino al muro → successo
+    free, wall = {'distance_cm': 150.0}, {'distance_cm': 20.0}
+    for i in range(20):
+        await db.record_experience(free, 'move_forward', None, 'success', 0.8, 100)
+        await db.record_experience(wall, 'stop', None, 'success', 1.0, 100)
+    await db.save_patterns()
+    saved = (await db._read(db._fetch_rows, """
+        SELECT COUNT(*) as n FROM patterns WHERE pattern_type LIKE 'sequence_%'
+    """))[0]['n']
+    await db.record_experience(free, 'move_forward', None, 'success', 0.8, 100)
+    prediction = db.predict_outcome(wall, 'stop')
+    print(f"\nPattern salvati: {saved}, miner {db.pattern_miner.get_state()['tracked']} sequenze tracciate")
+    print(f"  Dopo 'move_forward', 'stop' vicino al muro → {prediction['predicted_outcome']} "
+          f"({prediction['success_rate']:.2f}, sequenza di {len(prediction['sequence'])} passi)")
+    assert saved == len(db.pattern_cache) and prediction['predicted_outcome'] == 'success'
+
+    # Retention: 3000 esperienze di 30 giorni fa → aggregati + campioni
+    old_time = db.shards.period_start(time.time() - 30 * 86400) + 3600  # 50 ore → 3 shard giornalieri
+    old_rows = []
+    for i in range(3000):
+        situation = {'distance_cm': random.uniform(10, 200), 'current_emotion': 'curious', 'log': f"{i}" * 500}
+        features = extract_features(situation)
+        old_rows.append(db._submit_experience((
+            old_time + i * 60, *(features[column] for column in FEATURE_COLUMNS),
+            None, random.choice(actions), None, random.choice(outcomes), 0.5, 100
+        ), canonical_situation(situation)))
+    old_ids = await asyncio.gather(*old_rows)
+    db.index.add_batch(np.array(old_ids), np.zeros((3000, FEATURE_DIM), dtype=np.float32))
+    await db.record_experience({'distance_cm': 90.0}, 'explore', None, 'success', 1.0, 100)  # Torna a oggi
+    await db.flush()
+    old_shards = db.shards.expired(time.time() - 14 * 86400)
+    sealed = [not shard.path.stat().st_mode & stat.S_IWUSR for shard in old_shards]
+    print(f"\nShard: {len(db.shards.shards)} (scaduti {len(old_shards)}, sigillati {sum(sealed)}), "
+          f"id unici: {len(set(old_ids))}/3000")
+    assert len(old_shards) == 3 and all(sealed) and len(set(old_ids)) == 3000
+    
+    async def checkpoint_size() -> int:
+        # Senza schema: checkpoint di tutti i database collegati (principale + shard attivo)
+        await db.writer.submit(lambda conn: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall())
+        await db.flush()
+        return sum(file.stat().st_size for file in [db.db_path, *db.shards.directory.iterdir()])
+    
+    size_before = await checkpoint_size()
+    await db.maybe_backup(now=time.time() + db.backup_interval)  # Anche gli shard da cancellare
+    totals_before = await db.get_success_rate_for_action('stop')
+    db.compaction_step_rows = 500
+    db.hourly_stats_days = 7  # Anche i bucket orari di 30 giorni fa diventano giornalieri
+    start = time.perf_counter()
+    compacted = await db.compact()
+    elapsed = (time.perf_counter() - start) * 1000
+    size_after = await checkpoint_size()
+    remaining = len(await db.query_experiences(limit=10 ** 6))
+    samples = await db.get_replay_samples(limit=10000)
+    print(f"\nCompattazione: {compacted} in {elapsed:.0f}ms")
+    print(f"  Righe rimaste: {remaining}, campioni replay: {len(samples)}, indice: {db.index.size}, "
+          f"file: {size_before // 1024}KB → {size_after // 1024}KB")
+    assert remaining == 2092 and db.index.size == 2092 and len(db.shards.shards) == 1
+    assert await db.get_success_rate_for_action('stop') == totals_before
+    
+    # Backup: la seconda volta si copia solo ciò che è cambiato (shard attivo + principale)
+    first_backup = await db.maybe_backup(now=time.time() + 2 * db.backup_interval)
+    backups = sorted(file.name for file in db.backup_dir.iterdir())
+    unchanged = await db.maybe_backup(now=time.time() + 3 * db.backup_interval)
+    await asyncio.sleep(0.01)
+    await db.record_experience({'distance_cm': 50.0}, 'stop', None, 'success', 1.0, 100)
+    await db.flush()
+    second_backup = await db.maybe_backup(now=time.time() + 4 * db.backup_interval)
+    print(f"Backup: {first_backup['copied']}, poi invariati {unchanged['skipped']}, "
+          f"dopo una scrittura: {second_backup['copied']}, rimossi: {len(first_backup['pruned'])}")
+    assert not unchanged['copied'] and len(second_backup['copied']) == 2
+    assert len(first_backup['pruned']) == 3 and len(backups) == 2
+    
+    # Query indicizzata sulle colonne tipizzate
+    close_stops = await db.query_experiences(action='stop', max_distance=30)
+    active = db.shards.covering()[0]
+    plan = await db._read(lambda connection: [dict(row) for row in connection.execute(f"""
+        EXPLAIN QUERY PLAN SELECT * FROM {attach_shard(connection, active)}.experiences
+        WHERE action = 'stop' AND distance_cm < 30
+    """)])
+    print(f"\n'stop' con distanza < 30: {len(close_stops)} esperienze ({plan[0]['detail']})")
+    
     await db.cleanup()
+    
+    # Migrazione da schema JSON (versione 0)
+    legacy_path = Path("data/test_experiences_legacy.db")
+    legacy_path.unlink(missing_ok=True)
+    shutil.rmtree(default_shard_dir(legacy_path), ignore_errors=True)
+    legacy = sqlite3.connect(legacy_path)
+    legacy.execute("""
+        CREATE TABLE experiences (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL NOT NULL,
+            situation TEXT NOT NULL, action TEXT NOT NULL, action_parameters TEXT, outcome TEXT NOT NULL,
+            reward REAL DEFAULT 0.0, duration_ms INTEGER DEFAULT 0, context TEXT, learned_from INTEGER DEFAULT 0)
+    """)
+    legacy.execute("CREATE INDEX idx_situation ON experiences(situation)")
+    legacy.executemany("INSERT INTO experiences (timestamp, situation, action, outcome) VALUES (?, ?, ?, ?)", [
+        (time.time(), json.dumps({'distance_cm': 12.0, 'light_levels': [400, 600]}), 'stop', 'success'),
+        (time.time(), json.dumps({'distance_cm': 180.0, 'current_emotion': 'curious'}), 'move_forward', 'success')
+    ])
+    legacy.commit()
+    legacy.close()
+    
+    migrated_db = ExperienceDatabase(config, db_path=str(legacy_path))
+    await migrated_db.initialize()
+    rows = await migrated_db.query_experiences(max_distance=30)
+    print(f"Migrazione schema: {migrated_db.stats['total_experiences']} righe, "
+          f"vicine: {[(r['action'], r['distance_cm'], r['light_level']) for r in rows]}")
+    assert len(rows) == 1 and rows[0]['light_level'] == 500.0
+    assert len(migrated_db.shards.shards) == 1 and not migrated_db._has_legacy_experiences(sqlite3.connect(legacy_path))
+    assert sqlite3.connect(legacy_path).execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    await migrated_db.cleanup()
+    legacy_path.unlink()
+    shutil.rmtree(default_shard_dir(legacy_path))
+    shutil.rmtree('data/test_backups')
+    
     print("\nTest completato!")
 
 
+async def benchmark_experience_db(rows: int = 5000, readers: int = 4):
+    """
+    Benchmark: flusso di scritture con query insights concorrenti.
+    
+    Confronta il setup precedente (journal DELETE, una sola connessione di
+    lettura) con WAL + pool di lettori.
+    """
+    import random
+    import tempfile
+    
+    scenarios = {
+        'senza pool (DELETE, 1 lettore)': {
+            'read_pool_size': 1,
+            'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+        },
+        f'con pool (WAL, {readers} lettori)': {
+            'read_pool_size': readers
+        }
+    }
+    actions = ['move_forward', 'turn_left', 'turn_right', 'stop', 'explore']
+    outcomes = ['success', 'failure', 'partial']
+    
+    print("=== BENCHMARK EXPERIENCE DATABASE ===")
+    for name, db_config in scenarios.items():
+        with tempfile.TemporaryDirectory() as directory:
+            config = {'system': {'database': {'path': f"{directory}/benchmark.db", **db_config}}}
+            db = ExperienceDatabase(config)
+            await db.initialize()
+            latencies = []
+            
+            async def write_stream():
+                for i in range(rows):
+                    situation = {'distance_cm': random.uniform(10, 200), 'battery_level': random.uniform(20, 100)}
+                    await db.record_experience(situation, random.choice(actions), None,
+                                               random.choice(outcomes), random.uniform(-1, 1), 100)
+                    if i % 50 == 0:
+                        await asyncio.sleep(0)  # Lascia girare i lettori
+                await db.flush()
+            
+            async def query_stream(writes: asyncio.Task):
+                while not writes.done():
+                    start = time.perf_counter()
+                    await db.get_learning_insights()
+                    latencies.append((time.perf_counter() - start) * 1000)
+            
+            start = time.perf_counter()
+            writes = asyncio.create_task(write_stream())
+            await asyncio.gather(writes, *[query_stream(writes) for _ in range(readers)])
+            elapsed = time.perf_counter() - start
+            
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] if latencies else 0.0
+            p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+            print(f"{name}:")
+            print(f"  Insert: {rows / elapsed:.0f}/s ({db.writer.get_state()['commits']} commit)")
+            print(f"  Query insights: {len(latencies)} in parallelo, p50 {p50:.1f}ms, p95 {p95:.1f}ms")
+            await db.cleanup()
+
+
 if __name__ == "__main__":
-    asyncio.run(test_experience_db())
\ No newline at end of file
+    import sys
+    if '--benchmark' in sys.argv:
+        asyncio.run(benchmark_experience_db())
+    else:
+        asyncio.run(test_experience_db())
\ No newline at end of file
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Experience Export - Robot AI Memory System
+==========================================
+
+Export colonnare della storia esperienze per analisi e training offline.
+
+In parole semplici:
+- Le righe si leggono a blocchi (chunk_size) e diventano array NumPy
+  strutturati: memoria limitata anche con milioni di esperienze
+- export_experiences scrive una colonna per file .npy (apribile con
+  mmap_mode='r' senza caricarla tutta) più meta.json con i vocabolari
+  (azioni, esiti, emozioni codificati come interi)
+- La colonna 'features' contiene il vettore encode_situation (lo stesso
+  della ricerca esperienze simili), calcolato una volta per situazione
+- Si leggono solo gli shard del periodo richiesto (experience_shards),
+  dal più vecchio. Gli shard chiusi non cambiano; per quello attivo il
+  conteggio fissa l'ultimo id, così righe e conteggio coincidono anche
+  se il robot continua a scrivere nel frattempo
+
+Uso da terminale:
+    python -m memory.experience_export --db data/robot_memory.db --out data/export \
+        --since 2025-01-01 --until 2025-02-01
+
+Author: Andrea Vavassori
+"""
+
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Any, List
+import numpy as np
+
+from .experience_index import encode_situation, FEATURE_DIM, FEATURE_COLUMNS
+from .experience_shards import ShardRouter, ShardInfo, attach_shard, default_shard_dir
+
+logger = logging.getLogger(__name__)
+
+# Colonne esportate: (nome, dtype). Categorie → codice intero (-1 = assente)
+EXPORT_COLUMNS = (
+    ('id', '<i8'),
+    ('timestamp', '<f8'),
+    ('distance_cm', '<f4'),     # NaN = assente
+    ('light_level', '<f4'),
+    ('battery_level', '<f4'),
+    ('novelty', '<f4'),
+    ('state_id', '<i4'),
+    ('situation_id', '<i8'),
+    ('emotion', '<i2'),         # Codice nel vocabolario meta.json
+    ('action', '<i2'),
+    ('outcome', '<i2'),
+    ('reward', '<f4'),
+    ('duration_ms', '<i4'),
+)
+EXPORT_DTYPE = np.dtype(list(EXPORT_COLUMNS) + [('features', '<f4', (FEATURE_DIM,))])
+
+_CATEGORICAL = ('emotion', 'action', 'outcome')
+_SITUATION_CACHE_MAX = 100000
+
+
+def _query(since: Optional[float], until: Optional[float], max_id: Optional[int] = None):
+    clauses, parameters = [], []
+    if since is not None:
+        clauses.append("e.timestamp >= ?")
+        parameters.append(since)
+    if until is not None:
+        clauses.append("e.timestamp < ?")
+        parameters.append(until)
+    if max_id is not None:
+        clauses.append("e.id <= ?")
+        parameters.append(max_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, tuple(parameters)
+
+
+def _shards(db_path, shard_dir, since: Optional[float], until: Optional[float]) -> List[ShardInfo]:
+    """
+    Shard che possono contenere righe in [since, until), dal più vecchio.
+
+    Non serve conoscere period_hours: uno shard finisce al più tardi dove
+    inizia il successivo.
+    """
+    shards = ShardRouter(shard_dir or default_shard_dir(db_path)).covering(until=until)[::-1]
+    next_starts = [shard.start for shard in shards[1:]] + [None]
+    return [shard for shard, next_start in zip(shards, next_starts)
+            if since is None or next_start is None or next_start > since]
+
+
+def _open(db_path) -> sqlite3.Connection:
+    connection = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True,
+                                 isolation_level=None)
+    connection.execute("PRAGMA query_only = 1")
+    return connection
+
+
+def _row_vector(row: tuple, feature_index: Dict[str, int]) -> np.ndarray:
+    """Vettore feature di una riga: JSON della situazione o, se manca, colonne tipizzate."""
+    situation = None
+    if row[-1] is not None:
+        try:
+            situation = json.loads(row[-1])
+        except ValueError:
+            situation = None
+    if not isinstance(situation, dict):
+        situation = {name: row[feature_index[name]] for name in FEATURE_COLUMNS
+                     if name in feature_index and row[feature_index[name]] is not None}
+        situation['current_emotion'] = row[feature_index['emotion']]
+    return encode_situation(situation)
+
+
+def _iter_chunks(connection: sqlite3.Connection, schema: str, where: str, parameters: tuple, chunk_size: int,
+                 vocabularies: Dict[str, Dict[str, int]],
+                 situation_vectors: Dict[int, np.ndarray]) -> Iterator[np.ndarray]:
+    """Blocchi strutturati da uno shard collegato come schema."""
+    columns = [name for name, _ in EXPORT_COLUMNS]
+    cursor = connection.execute(f"""
+        SELECT {', '.join('e.' + name for name in columns)}, COALESCE(s.situation, e.situation)
+        FROM {schema}.experiences e LEFT JOIN main.situations s ON s.id = e.situation_id
+        {where}
+        ORDER BY e.timestamp
+    """, parameters)
+
+    feature_index = {name: i for i, name in enumerate(columns)}
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunk = np.empty(len(rows), dtype=EXPORT_DTYPE)
+        values = list(zip(*rows))
+
+        for index, (name, dtype) in enumerate(EXPORT_COLUMNS):
+            column = values[index]
+            if name in _CATEGORICAL:
+                vocabulary = vocabularies[name]
+                chunk[name] = [-1 if value is None else vocabulary.setdefault(value, len(vocabulary))
+                               for value in column]
+            elif dtype.startswith('<f'):
+                chunk[name] = [np.nan if value is None else value for value in column]
+            else:
+                chunk[name] = [-1 if value is None else value for value in column]
+
+        # Vettori feature: una decodifica JSON per situazione internata
+        situation_ids = chunk['situation_id']
+        interned = situation_ids >= 0
+        unique_ids, first_rows = np.unique(situation_ids[interned], return_index=True)
+        interned_rows = np.flatnonzero(interned)
+        vectors = np.empty((len(unique_ids), FEATURE_DIM), dtype=np.float32)
+        for i, (situation_id, first) in enumerate(zip(unique_ids.tolist(), first_rows)):
+            vector = situation_vectors.get(situation_id)
+            if vector is None:
+                vector = _row_vector(rows[interned_rows[first]], feature_index)
+                if len(situation_vectors) >= _SITUATION_CACHE_MAX:
+                    situation_vectors.clear()
+                situation_vectors[situation_id] = vector
+            vectors[i] = vector
+        if len(unique_ids):
+            chunk['features'][interned] = vectors[np.searchsorted(unique_ids, situation_ids[interned])]
+        for row_index in np.flatnonzero(~interned):
+            chunk['features'][row_index] = _row_vector(rows[row_index], feature_index)
+
+        yield chunk
+
+
+def iter_experience_chunks(db_path, since: float = None, until: float = None,
+                           chunk_size: int = 50000, shard_dir=None) -> Iterator[np.ndarray]:
+    """
+    Esperienze in [since, until) come array strutturati EXPORT_DTYPE.
+
+    I codici di emotion/action/outcome sono stabili per tutta l'iterazione
+    (vocabolario costruito nell'ordine di apparizione).
+    """
+    where, parameters = _query(since, until)
+    vocabularies = {name: {} for name in _CATEGORICAL}
+    situation_vectors: Dict[int, np.ndarray] = {}
+    connection = _open(db_path)
+    try:
+        for shard in _shards(db_path, shard_dir, since, until):
+            schema = attach_shard(connection, shard)
+            if schema is not None:
+                yield from _iter_chunks(connection, schema, where, parameters, chunk_size,
+                                        vocabularies, situation_vectors)
+    finally:
+        connection.close()
+
+
+def export_experiences(db_path, out_dir, since: float = None, until: float = None,
+                       chunk_size: int = 50000, shard_dir=None) -> Dict[str, Any]:
+    """
+    Esporta le esperienze in [since, until) come colonne .npy + meta.json.
+
+    Ogni colonna è scritta in un file memory-mapped a blocchi: la memoria
+    usata dipende da chunk_size, non dal numero di righe.
+
+    Returns:
+        dict: Metadati dell'export (righe, colonne, vocabolari, tempi)
+    """
+    start = time.perf_counter()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    vocabularies = {name: {} for name in _CATEGORICAL}
+    situation_vectors: Dict[int, np.ndarray] = {}
+    connection = _open(db_path)
+    try:
+        # Conteggio per shard: l'ultimo id letto limita poi le righe esportate
+        plan, total = [], 0
+        where, parameters = _query(since, until)
+        for shard in _shards(db_path, shard_dir, since, until):
+            schema = attach_shard(connection, shard)
+            if schema is None:
+                continue
+            count, max_id = connection.execute(
+                f"SELECT COUNT(*), MAX(e.id) FROM {schema}.experiences e {where}", parameters).fetchone()
+            if count:
+                plan.append((shard, max_id))
+                total += count
+
+        columns = {}
+        for name in EXPORT_DTYPE.names:
+            field = EXPORT_DTYPE.fields[name][0]
+            columns[name] = np.lib.format.open_memmap(
+                out_dir / f"{name}.npy", mode='w+', dtype=field.base, shape=(total,) + field.shape
+            )
+
+        written = 0
+        for shard, max_id in plan:
+            schema = attach_shard(connection, shard)
+            if schema is None:
+                logger.warning(f"Shard sparito durante l'export: {shard.path.name}")
+                continue
+            shard_where, shard_parameters = _query(since, until, max_id)
+            for chunk in _iter_chunks(connection, schema, shard_where, shard_parameters, chunk_size,
+                                      vocabularies, situation_vectors):
+                for name, column in columns.items():
+                    column[written:written + len(chunk)] = chunk[name]
+                written += len(chunk)
+    finally:
+        connection.close()
+
+    for column in columns.values():
+        column.flush()
+    del columns
+
+    meta = {
+        'rows': written,
+        'since': since,
+        'until': until,
+        'shards': [shard.path.name for shard, _ in plan],
+        'columns': {name: str(EXPORT_DTYPE.fields[name][0]) for name in EXPORT_DTYPE.names},
+        'vocabularies': {name: sorted(vocabulary, key=vocabulary.get) for name, vocabulary in vocabularies.items()},
+        'feature_dim': FEATURE_DIM,
+        'exported_at': time.time(),
+        'elapsed_s': time.perf_counter() - start
+    }
+    (out_dir / 'meta.json').write_text(json.dumps(meta, indent=2))
+    logger.info(f"Export esperienze: {written} righe da {len(plan)} shard in {meta['elapsed_s']:.1f}s → {out_dir}")
+    return meta
+
+
+def load_export(out_dir, mmap: bool = True) -> Dict[str, Any]:
+    """Colonne di un export (memory-mapped se mmap=True) più 'meta'."""
+    out_dir = Path(out_dir)
+    meta = json.loads((out_dir / 'meta.json').read_text())
+    # [:rows]: uno shard cancellato durante l'export lascia righe vuote in coda
+    data: Dict[str, Any] = {
+        name: np.load(out_dir / f"{name}.npy", mmap_mode='r' if mmap else None)[:meta['rows']]
+        for name in meta['columns']
+    }
+    data['meta'] = meta
+    return data
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    """Data ISO (2025-01-31, 2025-01-31T12:00) o timestamp epoch."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+# Testing functions
+def test_experience_export():
+    """Test: export a blocchi di 60k esperienze con memoria limitata."""
+    import random
+    import tempfile
+    import tracemalloc
+    from .experience_db import ExperienceDatabase, INSERT_EXPERIENCE, EXPERIENCE_COLUMNS, create_shard_schema
+    from .experience_index import extract_features, canonical_situation
+    import asyncio
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = Path(directory) / 'export.db'
+
+        async def populate():
+            db = ExperienceDatabase({'system': {'database': {'path': str(db_path)}}})
+            await db.initialize()
+            await db.cleanup()
+
+        asyncio.run(populate())
+
+        # Riempimento diretto degli shard (più veloce del writer per il test):
+        # 60000 secondi dal 14/11/2023 22:13 UTC → due shard giornalieri
+        connection = sqlite3.connect(db_path)
+        connection.execute("INSERT INTO situations (id, hash, situation) VALUES (1, 1, ?)",
+                           (canonical_situation({'distance_cm': 40.0, 'current_emotion': 'curious'})[1],))
+        connection.commit()
+        connection.close()
+        router = ShardRouter(default_shard_dir(db_path))
+        base = 1_700_000_000.0
+        shard_rows: Dict[float, List[tuple]] = {}
+        for i in range(60000):
+            features = extract_features({'distance_cm': 40.0, 'current_emotion': 'curious'})
+            shard_rows.setdefault(router.period_start(base + i), []).append((
+                base + i, *(features[column] for column in FEATURE_COLUMNS), 1,
+                random.choice(['stop', 'explore']), None, random.choice(['success', 'failure']), 0.5, 100))
+        for start, rows in shard_rows.items():
+            connection = sqlite3.connect(router.path_for(start))
+            create_shard_schema(connection)
+            connection.executemany(INSERT_EXPERIENCE, rows)
+            connection.commit()
+            connection.close()
+        assert EXPERIENCE_COLUMNS[0] == 'timestamp' and len(shard_rows) == 2
+
+        tracemalloc.start()
+        meta = export_experiences(db_path, Path(directory) / 'out', since=base + 5000, until=base + 55000,
+                                  chunk_size=1024)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        data = load_export(Path(directory) / 'out')
+        print("Testing experience export...")
+        print(f"  Righe esportate: {meta['rows']} in {meta['elapsed_s'] * 1000:.0f}ms, "
+              f"picco memoria Python: {peak / 1024 / 1024:.1f}MB "
+              f"(dati: {meta['rows'] * EXPORT_DTYPE.itemsize / 1024 / 1024:.1f}MB)")
+        print(f"  Azioni: {meta['vocabularies']['action']}, feature: {data['features'].shape}")
+        assert meta['rows'] == 50000 and len(meta['shards']) == 2
+        assert data['timestamp'][0] == base + 5000 and np.all(np.diff(data['timestamp']) > 0)
+        assert data['features'][0, 0] == np.float32(40.0 / 300.0)
+
+        chunks = list(iter_experience_chunks(db_path, until=base + 100, chunk_size=30))
+        assert [len(chunk) for chunk in chunks] == [30, 30, 30, 10]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export colonnare esperienze (.npy)")
+    parser.add_argument('--db', default='data/robot_memory.db', help='Database esperienze')
+    parser.add_argument('--out', help='Cartella di destinazione (senza: esegue il test)')
+    parser.add_argument('--since', help='Inizio (ISO o epoch, incluso)')
+    parser.add_argument('--until', help='Fine (ISO o epoch, escluso)')
+    parser.add_argument('--shard-dir', help='Cartella shard (default: <db>_shards accanto al database)')
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    if args.out is None:
+        test_experience_export()
+    else:
+        logging.basicConfig(level=logging.INFO)
+        result = export_experiences(args.db, args.out, _parse_time(args.since), _parse_time(args.until),
+                                    args.chunk_size, args.shard_dir)
+        print(f"Esportate {result['rows']} esperienze in {args.out}")
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Experience Index - Robot AI Memory System
+=========================================
+
+Indice vettoriale delle esperienze: ogni situazione diventa un vettore
+numerico di lunghezza fissa e la ricerca "esperienze simili" è un k-NN
+su tutta la storia, non solo sulle ultime righe.
+
+In parole semplici:
+- encode_situation trasforma il dict della situazione (distanza, luce,
+  batteria, novità, emozione...) in numeri tra 0 e 1, sempre nello
+  stesso ordine; le categorie (emozione, momento del giorno) diventano
+  one-hot
+- Finché le esperienze sono poche si confronta tutto in un colpo con
+  numpy (forza bruta vettorizzata)
+- Oltre tree_threshold si costruisce un KD-tree (scipy); le esperienze
+  arrivate dopo l'ultima costruzione si cercano a forza bruta e si
+  uniscono ai risultati dell'albero. L'albero si ricostruisce quando la
+  "coda" supera rebuild_fraction
+- extract_features / discretize_state danno le stesse grandezze come
+  colonne tipizzate del database e come id intero dello stato discreto
+- canonical_situation dà forma e hash canonici di una situazione (chiavi
+  ordinate, float arrotondati) per deduplicarla nel database
+
+Author: Andrea Vavassori
+"""
+
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Tuple, Any, Optional
+import numpy as np
+from scipy.spatial import cKDTree
+
+# (chiave, scala, default se assente): valore / scala, limitato a [0, 1]
+NUMERIC_FEATURES = (
+    ('distance_cm', 300.0, 200.0),
+    ('light_level', 1000.0, 500.0),
+    ('battery_level', 100.0, 80.0),
+    ('novelty', 1.0, 0.0),
+    ('map_change', 1.0, 0.0),
+    ('speed_multiplier', 2.0, 0.7),
+    ('exploration_bias', 1.0, 0.5),
+    ('caution_level', 1.0, 0.5),
+    ('emotion_intensity', 1.0, 0.5),
+)
+
+CATEGORICAL_FEATURES = (
+    ('current_emotion', ('curious', 'cautious', 'playful', 'alert', 'focused', 'resting')),
+    ('time_of_day', ('morning', 'afternoon', 'evening', 'night')),
+)
+
+# Soglie di discretizzazione dello stato (come LearningAgent._hash_situation)
+STATE_BUCKETS = (
+    ('distance_cm', (20.0, 50.0, 150.0)),      # very_close, close, medium, far
+    ('light_level', (400.0, 700.0)),           # dark, normal, bright
+    ('battery_level', (30.0, 70.0)),           # low, medium, high
+    ('novelty', (0.3, 0.7)),                   # familiar, seen, new
+    ('map_change', (0.5,)),                    # stable, changed
+)
+
+# Colonne tipizzate della tabella experiences (vedi extract_features)
+FEATURE_COLUMNS = ('distance_cm', 'light_level', 'battery_level', 'novelty', 'emotion', 'state_id')
+
+# One-hot scalato: due categorie diverse distano 1 come un numerico agli estremi
+_ONE_HOT = 1.0 / math.sqrt(2.0)
+FEATURE_DIM = len(NUMERIC_FEATURES) + sum(len(values) for _, values in CATEGORICAL_FEATURES)
+_MAX_DISTANCE = math.sqrt(len(NUMERIC_FEATURES) + len(CATEGORICAL_FEATURES))
+_DEFAULTS = {key: default for key, _, default in NUMERIC_FEATURES}
+
+
+def _numeric_value(situation: Dict[str, Any], key: str) -> Optional[float]:
+    """
+    Valore numerico della situazione, None se assente.
+
+    'light_level' assente ma 'light_levels' presente (lista sensori) → media.
+    """
+    value = situation.get(key)
+    if value is None and key == 'light_level' and situation.get('light_levels'):
+        levels = situation['light_levels']
+        value = sum(levels) / len(levels)
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return None
+    return float(value)
+
+
+def discretize_state(situation: Dict[str, Any]) -> int:
+    """
+    Stato discreto come intero (radice mista dei bucket + emozione).
+
+    Stessa situazione discreta → stesso id: utile per GROUP BY e aggregati.
+    """
+    state_id = 0
+    for key, thresholds in STATE_BUCKETS:
+        value = _numeric_value(situation, key)
+        if value is None:
+            value = _DEFAULTS[key]
+        bucket = sum(1 for threshold in thresholds if value >= threshold)
+        state_id = state_id * (len(thresholds) + 1) + bucket
+
+    emotions = CATEGORICAL_FEATURES[0][1]
+    emotion = situation.get('current_emotion')
+    emotion_index = emotions.index(emotion) + 1 if emotion in emotions else 0
+    return state_id * (len(emotions) + 1) + emotion_index
+
+
+def extract_features(situation: Dict[str, Any]) -> Dict[str, Any]:
+    """Valori per le colonne FEATURE_COLUMNS (None se il dato manca)."""
+    emotion = situation.get('current_emotion')
+    return {
+        'distance_cm': _numeric_value(situation, 'distance_cm'),
+        'light_level': _numeric_value(situation, 'light_level'),
+        'battery_level': _numeric_value(situation, 'battery_level'),
+        'novelty': _numeric_value(situation, 'novelty'),
+        'emotion': emotion if isinstance(emotion, str) else None,
+        'state_id': discretize_state(situation)
+    }
+
+
+def _canonical_value(value: Any, digits: int) -> Any:
+    if isinstance(value, float):
+        return round(value, digits)
+    if isinstance(value, dict):
+        return {str(key): _canonical_value(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical_value(item, digits) for item in value]
+    return value
+
+
+def canonical_situation(situation: Dict[str, Any], digits: int = 1) -> Tuple[int, str]:
+    """
+    Forma canonica della situazione: (hash 64 bit con segno, JSON).
+
+    Chiavi ordinate e float arrotondati a `digits` decimali: situazioni
+    uguali a meno del rumore dei sensori danno lo stesso hash.
+    """
+    text = json.dumps(_canonical_value(situation, digits), sort_keys=True,
+                      separators=(',', ':'), default=str)
+    digest = hashlib.blake2b(text.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True), text
+
+
+def encode_situation(situation: Dict[str, Any]) -> np.ndarray:
+    """Situazione → vettore float32 di lunghezza FEATURE_DIM."""
+    vector = np.zeros(FEATURE_DIM, dtype=np.float32)
+
+    for i, (key, scale, default) in enumerate(NUMERIC_FEATURES):
+        value = _numeric_value(situation, key)
+        if value is None:
+            value = default
+        vector[i] = min(max(value / scale, 0.0), 1.0)
+
+    offset = len(NUMERIC_FEATURES)
+    for key, values in CATEGORICAL_FEATURES:
+        value = situation.get(key)
+        if value in values:
+            vector[offset + values.index(value)] = _ONE_HOT
+        offset += len(values)
+
+    return vector
+
+
+def distance_to_similarity(distance: np.ndarray) -> np.ndarray:
+    """Distanza euclidea tra vettori codificati → similarità 0-1."""
+    return np.clip(1.0 - np.asarray(distance) / _MAX_DISTANCE, 0.0, 1.0)
+
+
+class ExperienceIndex:
+    """
+    Matrice in memoria (id esperienza → vettore) con ricerca k-NN.
+
+    add() dal thread dell'event loop, search() anche da un executor:
+    search lavora su una "fotografia" (albero, array, dimensione) presa
+    sotto lock all'inizio.
+    """
+
+    def __init__(self, config: dict):
+        self.logger = logging.getLogger(__name__)
+
+        index_config = config.get('similarity_index', {})
+        self.tree_threshold = index_config.get('tree_threshold', 20000)     # righe prima del KD-tree
+        self.rebuild_fraction = index_config.get('rebuild_fraction', 0.1)   # coda / albero per ricostruire
+        self.min_similarity = index_config.get('min_similarity', 0.3)
+
+        self._vectors = np.empty((1024, FEATURE_DIM), dtype=np.float32)
+        self._ids = np.empty(1024, dtype=np.int64)
+        self.size = 0
+
+        self._tree: Optional[cKDTree] = None
+        self._tree_size = 0
+        self._tree_lock = threading.Lock()     # Array + albero letti/sostituiti insieme
+        self._build_lock = threading.Lock()    # Una costruzione KD-tree alla volta
+        self._generation = 0                   # Incrementato da remove(): albero in costruzione da scartare
+
+        self.stats = {
+            'searches': 0,
+            'tree_builds': 0,
+            'last_search_ms': 0.0
+        }
+
+    def _reserve(self, extra: int):
+        needed = self.size + extra
+        if needed <= len(self._ids):
+            return
+        capacity = max(needed, len(self._ids) * 2)
+        vectors = np.empty((capacity, FEATURE_DIM), dtype=np.float32)
+        ids = np.empty(capacity, dtype=np.int64)
+        vectors[:self.size] = self._vectors[:self.size]
+        ids[:self.size] = self._ids[:self.size]
+        # Nuovi array: eventuali search in corso continuano sui vecchi
+        self._vectors, self._ids = vectors, ids
+
+    def add(self, experience_id: int, vector: np.ndarray):
+        """Aggiunge un'esperienza (vettore da encode_situation)."""
+        self._reserve(1)
+        self._vectors[self.size] = vector
+        self._ids[self.size] = experience_id
+        self.size += 1
+
+    def add_batch(self, ids: np.ndarray, vectors: np.ndarray):
+        """Aggiunge molte esperienze (caricamento iniziale)."""
+        n = len(ids)
+        if n == 0:
+            return
+        self._reserve(n)
+        self._vectors[self.size:self.size + n] = vectors
+        self._ids[self.size:self.size + n] = ids
+        self.size += n
+
+    def remove(self, experience_ids) -> int:
+        """Toglie dall'indice le esperienze indicate (compattazione storia)."""
+        keep = ~np.isin(self._ids[:self.size], np.asarray(experience_ids, dtype=np.int64))
+        removed = self.size - int(keep.sum())
+        if removed == 0:
+            return 0
+        remaining = self.size - removed
+        vectors = np.empty((max(remaining, 1024), FEATURE_DIM), dtype=np.float32)
+        ids = np.empty(len(vectors), dtype=np.int64)
+        vectors[:remaining] = self._vectors[:self.size][keep]
+        ids[:remaining] = self._ids[:self.size][keep]
+        with self._tree_lock:
+            self._vectors, self._ids = vectors, ids
+            self.size = remaining
+            self._tree, self._tree_size = None, 0
+            self._generation += 1
+        return removed
+
+    def _tree_snapshot(self) -> Tuple[Optional[cKDTree], int, np.ndarray, np.ndarray, int]:
+        """
+        Fotografia coerente (albero, righe nell'albero, vettori, id, dimensione).
+
+        Gli array si leggono sotto _tree_lock, lo stesso lock con cui
+        remove() li sostituisce: l'albero restituito indicizza sempre gli
+        array restituiti. La costruzione avviene fuori da _tree_lock (remove
+        dal loop non aspetta i KD-tree grandi), una alla volta (_build_lock);
+        se nel frattempo remove() ha cambiato gli array, l'albero serve solo
+        a questa ricerca e non viene salvato.
+        """
+        tree, tree_size, vectors, ids, n, generation = self._snapshot()
+        if n < self.tree_threshold:
+            return None, 0, vectors, ids, n
+        if not self._tree_stale(tree, tree_size, n):
+            return tree, tree_size, vectors, ids, n
+
+        with self._build_lock:
+            tree, tree_size, vectors, ids, n, generation = self._snapshot()
+            if not self._tree_stale(tree, tree_size, n):
+                return tree, tree_size, vectors, ids, n  # Costruito da un'altra ricerca
+            start = time.perf_counter()
+            tree = cKDTree(vectors[:n].copy())
+            with self._tree_lock:
+                if self._generation == generation:
+                    self._tree, self._tree_size = tree, n
+                    self.stats['tree_builds'] += 1
+            self.logger.debug(f"KD-tree esperienze: {n} righe in {(time.perf_counter() - start) * 1000:.0f}ms")
+            return tree, n, vectors, ids, n
+
+    def _snapshot(self) -> Tuple[Optional[cKDTree], int, np.ndarray, np.ndarray, int, int]:
+        with self._tree_lock:
+            # Prima la dimensione: add() scrive la riga e poi incrementa size
+            n = self.size
+            return self._tree, self._tree_size, self._vectors, self._ids, n, self._generation
+
+    def _tree_stale(self, tree: Optional[cKDTree], tree_size: int, n: int) -> bool:
+        return tree is None or n - tree_size > self.rebuild_fraction * tree_size
+
+    def search(self, vector: np.ndarray, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Le k esperienze più simili.
+
+        Returns:
+            List[(id, similarity)]: Dalla più simile, sopra min_similarity
+        """
+        start = time.perf_counter()
+        if self.size == 0 or k <= 0:
+            return []
+
+        tree, tree_size, vectors, ids, n = self._tree_snapshot()
+        candidate_rows = []
+        candidate_distances = []
+
+        if tree is not None:
+            distances, rows = tree.query(vector, k=min(k, tree_size))
+            candidate_rows.append(np.atleast_1d(rows))
+            candidate_distances.append(np.atleast_1d(distances))
+
+        # Forza bruta sulle righe fuori dall'albero (tutte, se albero assente)
+        if n > tree_size:
+            tail = vectors[tree_size:n]
+            distances = np.sqrt(((tail - vector) ** 2).sum(axis=1))
+            if len(distances) > k:
+                top = np.argpartition(distances, k - 1)[:k]
+            else:
+                top = np.arange(len(distances))
+            candidate_rows.append(top + tree_size)
+            candidate_distances.append(distances[top])
+
+        rows = np.concatenate(candidate_rows)
+        distances = np.concatenate(candidate_distances)
+        order = np.argsort(distances, kind='stable')[:k]
+        similarities = distance_to_similarity(distances[order])
+
+        self.stats['searches'] += 1
+        self.stats['last_search_ms'] = (time.perf_counter() - start) * 1000
+        return [(int(ids[row]), float(similarity))
+                for row, similarity in zip(rows[order], similarities)
+                if similarity >= self.min_similarity]
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'size': self.size,
+            'tree_size': self._tree_size,
+            'stats': self.stats.copy()
+        }
+
+
+# Testing functions
+def test_experience_index():
+    """Test: forza bruta e KD-tree danno gli stessi vicini."""
+    rng = np.random.default_rng(0)
+    n = 200000
+    emotions = CATEGORICAL_FEATURES[0][1]
+    situations = [{
+        'distance_cm': float(rng.uniform(5, 300)),
+        'light_levels': [float(rng.uniform(100, 900))] * 4,
+        'battery_level': float(rng.uniform(20, 100)),
+        'novelty': float(rng.random()),
+        'current_emotion': emotions[int(rng.integers(len(emotions)))]
+    } for _ in range(2000)]
+
+    start = time.perf_counter()
+    vectors = np.stack([encode_situation(s) for s in situations])
+    encode_us = (time.perf_counter() - start) / len(situations) * 1e6
+    vectors = vectors[rng.integers(0, len(vectors), n)] + rng.normal(0, 0.01, (n, FEATURE_DIM)).astype(np.float32)
+
+    brute = ExperienceIndex({'similarity_index': {'tree_threshold': 10 ** 9}})
+    tree = ExperienceIndex({'similarity_index': {'tree_threshold': 1000}})
+    brute.add_batch(np.arange(n), vectors)
+    tree.add_batch(np.arange(n - 500), vectors[:n - 500])
+    tree.search(vectors[0], 10)                                     # Costruisce l'albero
+    for i in range(n - 500, n):                                     # Coda fuori dall'albero
+        tree.add(i, vectors[i])
+
+    query = encode_situation({'distance_cm': 25, 'light_level': 500, 'battery_level': 60,
+                              'novelty': 0.2, 'current_emotion': 'cautious'})
+    timings = {}
+    for name, index in (('forza bruta', brute), ('kd-tree', tree)):
+        start = time.perf_counter()
+        for _ in range(20):
+            result = index.search(query, 10)
+        timings[name] = ((time.perf_counter() - start) / 20 * 1000, result)
+
+    print("Testing ExperienceIndex...")
+    print(f"  encode_situation: {encode_us:.1f}µs, dimensione vettore: {FEATURE_DIM}")
+    for name, (ms, result) in timings.items():
+        print(f"  {name} su {n} esperienze: {ms:.2f}ms, top similarity {result[0][1]:.3f}")
+    assert [i for i, _ in timings['forza bruta'][1]] == [i for i, _ in timings['kd-tree'][1]]
+
+    # remove() durante una ricerca in un altro thread: albero e id restano coerenti
+    removed = [i for i, _ in timings['forza bruta'][1][:5]]
+    searcher = threading.Thread(target=lambda: [tree.search(query, 10) for _ in range(20)])
+    searcher.start()
+    brute.remove(removed)
+    tree.remove(removed)
+    searcher.join()
+    after = [i for i, _ in tree.search(query, 10)]
+    print(f"  dopo remove: {len(set(after) & set(removed))} rimossi nei risultati, "
+          f"KD-tree costruiti {tree.stats['tree_builds']}")
+    assert after == [i for i, _ in brute.search(query, 10)] and not set(after) & set(removed)
+
+
+if __name__ == "__main__":
+    test_experience_index()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Experience Shards - Robot AI Memory System
+==========================================
+
+Storia delle esperienze divisa in file SQLite per periodo di tempo.
+
+In parole semplici:
+- Le righe grezze di experiences stanno in un file per periodo
+  (period_hours, un giorno di default): data/robot_memory_shards/
+  experiences-20250131T00.db. Il database principale tiene il resto:
+  situazioni, aggregati, campioni, oggetti, pattern
+- Solo lo shard del periodo corrente è attivo (lo scrive il writer);
+  a periodo finito viene sigillato: checkpoint del WAL e permessi di
+  sola lettura. Archiviarlo o cancellarlo = spostare o togliere un file
+- La retention cancella shard interi invece di DELETE riga per riga,
+  il backup orario copia solo lo shard attivo
+- ShardRouter sa quali shard coprono un intervallo di tempo (o di id):
+  le query li collegano con ATTACH e leggono shard per shard
+- Gli id restano unici su tutti gli shard: ogni nuovo shard parte
+  dall'ultimo id usato
+
+Author: Andrea Vavassori
+"""
+
+import logging
+import math
+import os
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Tuple
+
+SHARD_PREFIX = 'experiences-'
+SHARD_TIME_FORMAT = '%Y%m%dT%H'     # Inizio periodo in UTC
+SHARD_SCHEMA_PREFIX = 'shard_'      # Nome ATTACH: shard_<inizio epoch>
+MAX_ATTACHED = 8                    # SQLite: max 10 database collegati per connessione
+
+
+def default_shard_dir(db_path) -> Path:
+    """Cartella shard accanto al database principale (robot_memory.db → robot_memory_shards)."""
+    db_path = Path(db_path)
+    return db_path.parent / f"{db_path.stem}_shards"
+
+
+def shard_files(path) -> List[Path]:
+    """File di uno shard: database più eventuali -wal/-shm."""
+    path = Path(path)
+    return [path, path.with_name(path.name + '-wal'), path.with_name(path.name + '-shm')]
+
+
+@dataclass
+class ShardInfo:
+    """Uno shard: periodo [start, end) e intervallo di id che contiene."""
+    start: float
+    end: float
+    path: Path
+    first_id: Optional[int] = None
+    last_id: Optional[int] = None
+    rows: int = 0
+
+    @property
+    def schema(self) -> str:
+        return f"{SHARD_SCHEMA_PREFIX}{int(self.start)}"
+
+    def may_contain(self, experience_id: int) -> bool:
+        """False solo se l'id è sicuramente fuori dallo shard."""
+        if self.first_id is None:
+            return True  # Intervallo non ancora noto (shard nuovo o ripristinato)
+        return self.first_id <= experience_id and (self.last_id is None or experience_id <= self.last_id)
+
+
+class ShardRouter:
+    """
+    Elenco degli shard (dal filesystem) e instradamento delle query.
+
+    Usato dal thread dell'event loop: le funzioni che girano nel pool
+    letture ricevono liste di ShardInfo già selezionate.
+    """
+
+    def __init__(self, directory, period_hours: float = 24):
+        self.logger = logging.getLogger(__name__)
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.period = float(period_hours) * 3600
+
+        self.shards: Dict[float, ShardInfo] = {}  # inizio periodo → shard
+        self.refresh()
+
+    def period_start(self, timestamp: float) -> float:
+        """Inizio del periodo che contiene timestamp."""
+        return (timestamp // self.period) * self.period
+
+    def path_for(self, start: float) -> Path:
+        name = datetime.fromtimestamp(start, timezone.utc).strftime(SHARD_TIME_FORMAT)
+        return self.directory / f"{SHARD_PREFIX}{name}.db"
+
+    @staticmethod
+    def _parse_start(path: Path) -> Optional[float]:
+        try:
+            moment = datetime.strptime(path.stem[len(SHARD_PREFIX):], SHARD_TIME_FORMAT)
+        except ValueError:
+            return None
+        return moment.replace(tzinfo=timezone.utc).timestamp()
+
+    def refresh(self) -> int:
+        """
+        Rilegge la cartella: shard archiviati o cancellati a mano spariscono,
+        quelli ripristinati ricompaiono (con intervallo id da ricalcolare).
+
+        Returns:
+            int: Numero di shard
+        """
+        found = {}
+        for path in self.directory.glob(f"{SHARD_PREFIX}*.db"):
+            start = self._parse_start(path)
+            if start is not None:
+                found[start] = path
+        for start in list(self.shards):
+            if start not in found:
+                del self.shards[start]
+        for start, path in found.items():
+            if start not in self.shards:
+                self.shards[start] = ShardInfo(start, start + self.period, path)
+        self._update_ends()
+        return len(self.shards)
+
+    def _update_ends(self):
+        # Un periodo dura period_hours ma non oltre l'inizio del successivo
+        # (period_hours può cambiare tra un avvio e l'altro)
+        starts = sorted(self.shards)
+        for start, next_start in zip(starts, starts[1:] + [math.inf]):
+            self.shards[start].end = min(start + self.period, next_start)
+
+    def add(self, start: float) -> ShardInfo:
+        """Registra uno shard appena creato dal writer."""
+        shard = self.shards.get(start)
+        if shard is None:
+            shard = self.shards[start] = ShardInfo(start, start + self.period, self.path_for(start))
+            self._update_ends()
+        return shard
+
+    def remove(self, start: float):
+        self.shards.pop(start, None)
+        self._update_ends()
+
+    def record_id(self, start: float, experience_id: int):
+        """Aggiorna l'intervallo id dello shard dopo un insert committato."""
+        shard = self.shards.get(start)
+        if shard is None:
+            return
+        if shard.first_id is None or experience_id < shard.first_id:
+            shard.first_id = experience_id
+        if shard.last_id is None or experience_id > shard.last_id:
+            shard.last_id = experience_id
+        shard.rows += 1
+
+    def max_id(self) -> int:
+        return max((shard.last_id for shard in self.shards.values() if shard.last_id is not None), default=0)
+
+    def covering(self, since: float = None, until: float = None) -> List[ShardInfo]:
+        """Shard che intersecano [since, until), dal più recente."""
+        return [
+            shard for _, shard in sorted(self.shards.items(), reverse=True)
+            if (since is None or shard.end > since) and (until is None or shard.start < until)
+        ]
+
+    def expired(self, cutoff: float) -> List[ShardInfo]:
+        """Shard interamente più vecchi di cutoff, dal più vecchio."""
+        return [shard for _, shard in sorted(self.shards.items()) if shard.end <= cutoff]
+
+    def for_ids(self, ids: List[int]) -> List[Tuple[ShardInfo, List[int]]]:
+        """Raggruppa gli id per shard (dal più recente)."""
+        routed = []
+        for shard in self.covering():
+            matching = [experience_id for experience_id in ids if shard.may_contain(experience_id)]
+            if matching:
+                routed.append((shard, matching))
+        return routed
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'directory': str(self.directory),
+            'period_hours': self.period / 3600,
+            'shards': len(self.shards),
+            'rows': sum(shard.rows for shard in self.shards.values())
+        }
+
+
+def attach_shard(connection: sqlite3.Connection, shard: ShardInfo) -> Optional[str]:
+    """
+    Collega lo shard in sola lettura alla connessione (se non lo è già).
+
+    La connessione deve essere aperta con uri=True. Scollega gli shard
+    il cui file non esiste più (lo spazio su disco si libera solo allora)
+    e, oltre MAX_ATTACHED, i collegati da più tempo.
+
+    Returns:
+        str: Nome dello schema da usare nelle query, None se il file manca
+    """
+    attached = [(row[1], row[2]) for row in connection.execute("PRAGMA database_list")
+                if row[1].startswith(SHARD_SCHEMA_PREFIX)]
+    live = []
+    for name, filename in attached:
+        if filename and not os.path.exists(filename):
+            connection.execute(f"DETACH DATABASE {name}")
+        else:
+            live.append(name)
+    if shard.schema in live:
+        return shard.schema
+
+    while len(live) >= MAX_ATTACHED:
+        connection.execute(f"DETACH DATABASE {live.pop(0)}")
+
+    if not shard.path.exists():
+        return None  # Archiviato o cancellato dopo l'ultimo refresh
+    connection.execute(f"ATTACH DATABASE ? AS {shard.schema}", (f"{shard.path.resolve().as_uri()}?mode=ro",))
+    return shard.schema
+
+
+# Testing functions
+def test_shard_router():
+    """Test: periodi, instradamento per tempo/id, refresh dal filesystem."""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        router = ShardRouter(directory, period_hours=24)
+        day = 86400.0
+        base = router.period_start(1_700_000_000.0)
+        for offset, (first, last) in enumerate([(1, 100), (101, 250), (251, None)]):
+            shard = router.add(base + offset * day)
+            sqlite3.connect(shard.path).execute("CREATE TABLE experiences (id INTEGER PRIMARY KEY)").connection.close()
+            shard.first_id, shard.last_id = first, last
+
+        print("Testing ShardRouter...")
+        print(f"  Shard: {[shard.path.name for shard in router.covering()]}")
+        assert router.path_for(base).name == 'experiences-20231114T00.db'
+        assert [shard.start for shard in router.covering(since=base + day + 5)] == [base + 2 * day, base + day]
+        assert [shard.start for shard in router.covering(until=base + 10)] == [base]
+        assert [(shard.start, ids) for shard, ids in router.for_ids([5, 120, 999])] == [
+            (base + 2 * day, [999]), (base + day, [120]), (base, [5])]
+        assert [shard.start for shard in router.expired(base + 2 * day)] == [base, base + day]
+
+        # ATTACH a rotazione: mai oltre MAX_ATTACHED, file spariti scollegati
+        connection = sqlite3.connect(f"{(Path(directory) / 'main.db').resolve().as_uri()}", uri=True)
+        for shard in router.covering():
+            assert attach_shard(connection, shard) == shard.schema
+        router.shards[base].path.unlink()
+        router.refresh()
+        assert len(router.shards) == 2 and router.shards[base + day].end == base + 2 * day
+        attach_shard(connection, router.shards[base + day])
+        attached = [row[1] for row in connection.execute("PRAGMA database_list")]
+        print(f"  Collegati dopo cancellazione: {attached}")
+        assert f"{SHARD_SCHEMA_PREFIX}{int(base)}" not in attached
+        connection.close()
+
+
+if __name__ == "__main__":
+    test_shard_router()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Frontier Detector - Robot AI Memory System
+==========================================
+
+Trova le "frontiere" della mappa: celle libere confinanti con spazio
+sconosciuto. Sono i punti migliori dove andare per esplorare.
+
+In parole semplici:
+- Una frontiera è il bordo tra "so che è libero" e "non so cosa c'è"
+- Invece di riscansionare tutta la mappa ad ogni update, controlliamo
+  solo le celle appena cambiate e le loro vicine
+- Le celle di frontiera vengono raggruppate in cluster (zone da esplorare);
+  dopo un update si rifanno solo i cluster vicini alle celle cambiate
+- nearest_frontiers(k) restituisce le k zone più vicine in pochi microsecondi
+
+Author: Andrea Vavassori
+"""
+
+import logging
+from collections import deque
+from typing import Dict, List, Tuple, Any, Set
+import numpy as np
+
+UNKNOWN = -1
+FREE = 0
+
+# Offset 4-vicini (frontiera) e 8-vicini (clustering)
+_NEIGHBORS_4 = np.array([[0, 0], [1, 0], [-1, 0], [0, 1], [0, -1]])
+_NEIGHBORS_8 = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+_NEIGHBORS_9 = [(0, 0)] + _NEIGHBORS_8
+
+
+class FrontierDetector:
+    """
+    Indice incrementale delle celle di frontiera.
+
+    - frontier_mask: bool per cella, True se la cella è frontiera
+    - frontier_cells: insieme (x, y) delle frontiere correnti
+    - segmenti: ogni cella di frontiera appartiene a un segmento 8-connesso;
+      quando l'insieme cambia si sciolgono e rifanno solo i segmenti che
+      toccano le celle cambiate (il resto della frontiera non si riguarda)
+    """
+
+    def __init__(self, map_size: Tuple[int, int], min_cluster_size: int = 5, max_cluster_size: int = 60):
+        self.logger = logging.getLogger(__name__)
+
+        self.map_size = tuple(map_size)
+        self.min_cluster_size = min_cluster_size
+        self.max_cluster_size = max_cluster_size  # Frontiere lunghe spezzate in segmenti
+
+        self.frontier_mask = np.zeros(self.map_size, dtype=bool)
+        self.frontier_cells: Set[Tuple[int, int]] = set()
+
+        # Segmenti in slot riutilizzabili: cella → slot, slot → celle
+        self._cell_segment: Dict[Tuple[int, int], int] = {}
+        self._segments: Dict[int, List[Tuple[int, int]]] = {}
+        self._free_slots: List[int] = []
+        self._dirty_cells: Set[Tuple[int, int]] = set()  # Cambiate dall'ultimo clustering
+        self._full_recluster = True
+        self._clusters_dirty = True
+
+        # Per slot: centroide, goal, dimensione (0 = slot libero). Sono cluster
+        # i segmenti con almeno min_cluster_size celle
+        self.cluster_centroids = np.zeros((64, 2))
+        self.cluster_goals = np.zeros((64, 2), dtype=np.int64)
+        self.cluster_sizes = np.zeros(64, dtype=np.int64)
+
+        self.stats = {
+            'frontier_cells': 0,
+            'clusters': 0,
+            'incremental_updates': 0,
+            'cells_checked': 0,
+            'reclusters': 0,
+            'reclustered_cells': 0
+        }
+
+    def rebuild(self, grid_map: np.ndarray):
+        """Ricostruzione completa (solo all'avvio o dopo load_map)."""
+        free = grid_map == FREE
+        unknown = grid_map == UNKNOWN
+
+        # Celle libere con almeno un 4-vicino sconosciuto
+        has_unknown_neighbor = np.zeros_like(free)
+        has_unknown_neighbor[1:, :] |= unknown[:-1, :]
+        has_unknown_neighbor[:-1, :] |= unknown[1:, :]
+        has_unknown_neighbor[:, 1:] |= unknown[:, :-1]
+        has_unknown_neighbor[:, :-1] |= unknown[:, 1:]
+
+        self.frontier_mask = free & has_unknown_neighbor
+        xs, ys = np.nonzero(self.frontier_mask)
+        self.frontier_cells = set(zip(xs.tolist(), ys.tolist()))
+
+        self._full_recluster = True
+        self._clusters_dirty = True
+        self.stats['frontier_cells'] = len(self.frontier_cells)
+
+    def update_cells(self, grid_map: np.ndarray, xs: np.ndarray, ys: np.ndarray):
+        """
+        Aggiorna l'indice dopo che le celle (xs, ys) sono cambiate.
+
+        Solo le celle cambiate e i loro 4-vicini possono cambiare stato di frontiera.
+        """
+        xs = np.asarray(xs, dtype=np.intp)
+        ys = np.asarray(ys, dtype=np.intp)
+        if xs.size == 0:
+            return
+
+        # Candidati: celle cambiate + 4-vicini, unici e dentro la mappa
+        cand_x = (xs[:, None] + _NEIGHBORS_4[:, 0]).ravel()
+        cand_y = (ys[:, None] + _NEIGHBORS_4[:, 1]).ravel()
+        inside = (cand_x >= 0) & (cand_y >= 0) & (cand_x < self.map_size[0]) & (cand_y < self.map_size[1])
+        flat = np.unique(np.ravel_multi_index((cand_x[inside], cand_y[inside]), self.map_size))
+        cand_x, cand_y = np.unravel_index(flat, self.map_size)
+
+        new_state = self._is_frontier(grid_map, cand_x, cand_y)
+        old_state = self.frontier_mask[cand_x, cand_y]
+        changed = new_state != old_state
+
+        if np.any(changed):
+            self.frontier_mask[cand_x[changed], cand_y[changed]] = new_state[changed]
+
+            added = changed & new_state
+            removed = changed & ~new_state
+            self.frontier_cells.update(zip(cand_x[added].tolist(), cand_y[added].tolist()))
+            self.frontier_cells.difference_update(zip(cand_x[removed].tolist(), cand_y[removed].tolist()))
+
+            self._dirty_cells.update(zip(cand_x[changed].tolist(), cand_y[changed].tolist()))
+            self._clusters_dirty = True
+
+        self.stats['incremental_updates'] += 1
+        self.stats['cells_checked'] += int(flat.size)
+        self.stats['frontier_cells'] = len(self.frontier_cells)
+
+    def _is_frontier(self, grid_map: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Stato di frontiera vettorizzato per le celle indicate."""
+        result = grid_map[xs, ys] == FREE
+        max_x = self.map_size[0] - 1
+        max_y = self.map_size[1] - 1
+
+        unknown_neighbor = np.zeros(xs.shape, dtype=bool)
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            nx = xs + dx
+            ny = ys + dy
+            inside = (nx >= 0) & (ny >= 0) & (nx <= max_x) & (ny <= max_y)
+            values = grid_map[np.clip(nx, 0, max_x), np.clip(ny, 0, max_y)]
+            unknown_neighbor |= inside & (values == UNKNOWN)
+
+        return result & unknown_neighbor
+
+    def _recluster(self):
+        """
+        Aggiorna i segmenti di frontiera (8-connessi, al massimo
+        max_cluster_size celle) attorno alle celle cambiate.
+
+        I segmenti che contengono o toccano una cella cambiata vengono
+        sciolti e le loro celle, con quelle nuove, riassegnate a "macchia":
+        così i segmenti spezzati da una rimozione si dividono e le celle
+        nuove si uniscono a quelle vicine. Gli altri segmenti restano.
+        """
+        if self._full_recluster:
+            self._cell_segment.clear()
+            self._segments.clear()
+            self.cluster_sizes[:] = 0
+            self._free_slots = list(range(self.cluster_sizes.size - 1, -1, -1))
+            pool = set(self.frontier_cells)
+            self._full_recluster = False
+        else:
+            dropped = set()
+            for cx, cy in self._dirty_cells:
+                for dx, dy in _NEIGHBORS_9:
+                    slot = self._cell_segment.get((cx + dx, cy + dy))
+                    if slot is not None:
+                        dropped.add(slot)
+            pool = {cell for cell in self._dirty_cells if cell in self.frontier_cells}
+            for slot in dropped:
+                for cell in self._segments.pop(slot):
+                    del self._cell_segment[cell]
+                    if cell in self.frontier_cells:
+                        pool.add(cell)
+                self.cluster_sizes[slot] = 0
+                self._free_slots.append(slot)
+        self._dirty_cells.clear()
+        self.stats['reclustered_cells'] += len(pool)
+
+        while pool:
+            seed = pool.pop()
+            queue = deque([seed])
+            members = []
+
+            # BFS limitata: il segmento cresce a "macchia" attorno al seme
+            while queue and len(members) < self.max_cluster_size:
+                cell = queue.popleft()
+                members.append(cell)
+                cx, cy = cell
+                for dx, dy in _NEIGHBORS_8:
+                    neighbor = (cx + dx, cy + dy)
+                    if neighbor in pool:
+                        pool.remove(neighbor)
+                        queue.append(neighbor)
+
+            # Celle scoperte ma non assegnate tornano disponibili per altri segmenti
+            pool.update(queue)
+            self._store_segment(members)
+
+        self._clusters_dirty = False
+        self.stats['reclusters'] += 1
+        self.stats['clusters'] = int(np.count_nonzero(self.cluster_sizes >= self.min_cluster_size))
+
+    def _store_segment(self, members: List[Tuple[int, int]]):
+        """Salva un segmento in uno slot libero (centroide e goal in Python: ≤ max_cluster_size celle)."""
+        if not self._free_slots:
+            capacity = self.cluster_sizes.size
+            self.cluster_centroids = np.concatenate([self.cluster_centroids, np.zeros((capacity, 2))])
+            self.cluster_goals = np.concatenate([self.cluster_goals, np.zeros((capacity, 2), dtype=np.int64)])
+            self.cluster_sizes = np.concatenate([self.cluster_sizes, np.zeros(capacity, dtype=np.int64)])
+            self._free_slots = list(range(2 * capacity - 1, capacity - 1, -1))
+        slot = self._free_slots.pop()
+
+        count = len(members)
+        mean_x = sum(cell[0] for cell in members) / count
+        mean_y = sum(cell[1] for cell in members) / count
+        # Obiettivo = cella di frontiera più vicina al centroide
+        goal = min(members, key=lambda cell: (cell[0] - mean_x) ** 2 + (cell[1] - mean_y) ** 2)
+
+        self._segments[slot] = members
+        for cell in members:
+            self._cell_segment[cell] = slot
+        self.cluster_centroids[slot] = (mean_x, mean_y)
+        self.cluster_goals[slot] = goal
+        self.cluster_sizes[slot] = count
+
+    def nearest_frontiers(self, position: Tuple[float, float], k: int = 1) -> List[Dict[str, Any]]:
+        """
+        Restituisce i k cluster di frontiera più vicini a position.
+
+        Args:
+            position: (x, y) in pixel
+            k: Numero di cluster
+
+        Returns:
+            List[Dict]: goal (cella di frontiera), centroid, size, distance_pixels
+                        ordinati per distanza dal goal
+        """
+        if self._clusters_dirty:
+            self._recluster()
+
+        slots = np.flatnonzero(self.cluster_sizes >= self.min_cluster_size)
+        if slots.size == 0:
+            return []
+
+        deltas = self.cluster_goals[slots] - np.asarray(position, dtype=np.float64)
+        distances = np.hypot(deltas[:, 0], deltas[:, 1])
+
+        k = min(k, distances.size)
+        if k < distances.size:
+            nearest = np.argpartition(distances, k - 1)[:k]
+        else:
+            nearest = np.arange(distances.size)
+        nearest = nearest[np.argsort(distances[nearest])]
+
+        return [
+            {
+                'goal': (int(self.cluster_goals[i, 0]), int(self.cluster_goals[i, 1])),
+                'centroid': (float(self.cluster_centroids[i, 0]), float(self.cluster_centroids[i, 1])),
+                'size': int(self.cluster_sizes[i]),
+                'distance_pixels': float(distance)
+            }
+            for i, distance in zip(slots[nearest], distances[nearest])
+        ]
+
+    def get_state(self) -> Dict[str, Any]:
+        """Statistiche indice frontiere."""
+        return self.stats.copy()
+
+
+# Testing functions
+def test_frontier_detector():
+    """Test: confronto indice incrementale vs ricostruzione completa."""
+    import time
+
+    rng = np.random.default_rng(0)
+    size = (2000, 2000)
+    grid = np.full(size, UNKNOWN, dtype=np.int8)
+
+    incremental = FrontierDetector(size)
+    incremental.rebuild(grid)
+
+    print("Testing FrontierDetector su mappa 2000x2000...")
+    update_time = 0.0
+
+    # Simula 500 update di raggi liberi da una posizione centrale
+    for _ in range(500):
+        angle = rng.uniform(0, 2 * np.pi)
+        length = rng.integers(10, 80)
+        steps = np.arange(length)
+        xs = (1000 + steps * np.cos(angle)).astype(int)
+        ys = (1000 + steps * np.sin(angle)).astype(int)
+        grid[xs, ys] = FREE
+
+        start = time.perf_counter()
+        incremental.update_cells(grid, xs, ys)
+        update_time += time.perf_counter() - start
+
+    reference = FrontierDetector(size)
+    reference.rebuild(grid)
+    assert incremental.frontier_cells == reference.frontier_cells, "Indice incrementale non coerente!"
+
+    start = time.perf_counter()
+    incremental.nearest_frontiers((1000, 1000), 3)
+    first_query = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        nearest = incremental.nearest_frontiers((1000, 1000), 3)
+    query_time = (time.perf_counter() - start) / 1000
+
+    print(f"  Frontiere: {len(incremental.frontier_cells)}, cluster: {incremental.stats['clusters']}")
+    print(f"  Update incrementale medio: {update_time / 500 * 1e6:.0f}µs")
+    print(f"  Prima query (con clustering): {first_query * 1000:.1f}ms")
+    print(f"  Query successive: {query_time * 1e6:.1f}µs")
+
+    # Un raggio nuovo: si rifanno solo i segmenti vicini alle celle cambiate
+    recluster_time = 0.0
+    for _ in range(50):
+        angle = rng.uniform(0, 2 * np.pi)
+        steps = np.arange(rng.integers(10, 80))
+        xs = (1000 + steps * np.cos(angle)).astype(int)
+        ys = (1000 + steps * np.sin(angle)).astype(int)
+        grid[xs, ys] = FREE
+        incremental.update_cells(grid, xs, ys)
+        start = time.perf_counter()
+        incremental.nearest_frontiers((1000, 1000), 3)
+        recluster_time += time.perf_counter() - start
+    print(f"  Query dopo un update (clustering locale): {recluster_time / 50 * 1e6:.0f}µs")
+
+    # Ogni frontiera in esattamente un segmento, segmenti connessi e limitati
+    assigned = [cell for members in incremental._segments.values() for cell in members]
+    assert len(assigned) == len(set(assigned)) and set(assigned) == incremental.frontier_cells
+    for slot, members in incremental._segments.items():
+        assert len(members) == incremental.cluster_sizes[slot] <= incremental.max_cluster_size
+    for frontier in nearest:
+        print(f"    {frontier}")
+
+
+if __name__ == "__main__":
+    test_frontier_detector()
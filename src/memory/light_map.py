@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Light Map - Robot AI Memory System
+==================================
+
+Layer della mappa che ricorda "quanta luce c'è dove", costruito dalle
+letture dei 4 fotoresistori mentre il robot si muove.
+
+In parole semplici:
+- Ogni fotoresistore deposita la sua lettura nelle celle vicine alla sua
+  posizione sul robot (impronta gaussiana)
+- Ogni cella tiene una media pesata: letture nuove pesano di più,
+  la fiducia nelle vecchie decade nel tempo (la luce cambia!)
+- Il decadimento è "pigro": calcolato solo quando si legge, dal timestamp
+  dell'ultimo update della cella (nessun loop periodico sulla mappa)
+- window_mean() media vettorizzata su una finestra attorno a un punto
+
+Il layer ha risoluzione più grossa della griglia SLAM: la luce varia
+lentamente nello spazio e così la memoria resta piccola.
+
+Author: Andrea Vavassori
+"""
+
+import logging
+import math
+import time
+from typing import Dict, List, Tuple, Optional, Any
+import numpy as np
+
+
+class LightMap:
+    """
+    Stima di intensità luminosa per cella con fiducia che decade nel tempo.
+
+    Coordinate di input in pixel della mappa SLAM; internamente celle
+    di dimensione cell_size pixel.
+    """
+
+    def __init__(self, config: dict, map_size: Tuple[int, int], map_resolution: float):
+        self.logger = logging.getLogger(__name__)
+
+        light_config = config.get('light_map', {})
+
+        self.map_resolution = map_resolution
+        self.resolution = light_config.get('resolution', 0.2)  # metri per cella
+        self.cell_size = max(1, int(round(self.resolution / map_resolution)))  # pixel SLAM per cella
+        self.decay_time = light_config.get('decay_time', 300.0)  # secondi (costante di tempo)
+        self.max_weight = light_config.get('max_weight', 20.0)
+        self.footprint_radius = light_config.get('footprint_radius', 0.2)  # metri
+        self.sensor_offset = light_config.get('sensor_offset', 0.08)  # metri dal centro robot
+        # Direzione di ogni fotoresistore rispetto al robot (gradi, positivo = sinistra)
+        self.sensor_angles = np.radians(light_config.get('sensor_angles_deg', [45, 135, -45, -135]))
+
+        self.shape = (
+            int(math.ceil(map_size[0] / self.cell_size)),
+            int(math.ceil(map_size[1] / self.cell_size))
+        )
+
+        self.intensity = np.zeros(self.shape, dtype=np.float32)
+        self.weight = np.zeros(self.shape, dtype=np.float32)
+        self.last_update = np.zeros(self.shape, dtype=np.float64)
+
+        # Impronta gaussiana precalcolata (offset e pesi in celle)
+        radius_cells = self.footprint_radius / self.resolution
+        r = int(math.ceil(radius_cells))
+        dx, dy = np.mgrid[-r:r + 1, -r:r + 1]
+        dist2 = dx ** 2 + dy ** 2
+        inside = dist2 <= max(radius_cells, 0.5) ** 2
+        sigma = max(radius_cells / 2.0, 0.5)
+        self._footprint_dx = dx[inside]
+        self._footprint_dy = dy[inside]
+        self._footprint_w = np.exp(-0.5 * dist2[inside] / sigma ** 2).astype(np.float32)
+
+        self.stats = {
+            'observations': 0,
+            'cells_touched': 0
+        }
+
+    def _decay_factor(self, last_update: np.ndarray, now: float) -> np.ndarray:
+        return np.exp(-np.maximum(now - last_update, 0.0) / self.decay_time)
+
+    def observe(self, position: Tuple[float, float], orientation: float,
+                light_levels: List[float], timestamp: Optional[float] = None):
+        """
+        Integra una lettura dei fotoresistori dalla posa corrente.
+
+        Args:
+            position: (x, y) robot in pixel SLAM
+            orientation: Orientamento robot (radianti)
+            light_levels: Un valore per fotoresistore
+            timestamp: Tempo lettura (default time.time())
+        """
+        if not light_levels:
+            return
+        now = time.time() if timestamp is None else timestamp
+
+        values = np.asarray(light_levels[:len(self.sensor_angles)], dtype=np.float32)
+        angles = orientation + self.sensor_angles[:values.size]
+        offset_px = self.sensor_offset / self.map_resolution
+
+        # Celle dei sensori + impronta: shape (sensori, punti impronta)
+        sensor_x = (position[0] + offset_px * np.cos(angles)) / self.cell_size
+        sensor_y = (position[1] + offset_px * np.sin(angles)) / self.cell_size
+        xs = (sensor_x.astype(np.intp)[:, None] + self._footprint_dx).ravel()
+        ys = (sensor_y.astype(np.intp)[:, None] + self._footprint_dy).ravel()
+        obs_values = np.repeat(values, self._footprint_w.size)
+        obs_weights = np.tile(self._footprint_w, values.size)
+
+        inside = (xs >= 0) & (ys >= 0) & (xs < self.shape[0]) & (ys < self.shape[1])
+        xs, ys = xs[inside], ys[inside]
+        obs_values, obs_weights = obs_values[inside], obs_weights[inside]
+
+        # Accumula osservazioni sovrapposte (sensori vicini) per cella
+        flat = np.ravel_multi_index((xs, ys), self.shape)
+        cells, inverse = np.unique(flat, return_inverse=True)
+        w_sum = np.bincount(inverse, weights=obs_weights).astype(np.float32)
+        v_sum = np.bincount(inverse, weights=obs_weights * obs_values).astype(np.float32)
+        cx, cy = np.unravel_index(cells, self.shape)
+
+        # Media pesata con il peso precedente decaduto
+        old_weight = self.weight[cx, cy] * self._decay_factor(self.last_update[cx, cy], now).astype(np.float32)
+        new_weight = old_weight + w_sum
+        self.intensity[cx, cy] = (self.intensity[cx, cy] * old_weight + v_sum) / new_weight
+        self.weight[cx, cy] = np.minimum(new_weight, self.max_weight)
+        self.last_update[cx, cy] = now
+
+        self.stats['observations'] += 1
+        self.stats['cells_touched'] += int(cells.size)
+
+    def query(self, xs: np.ndarray, ys: np.ndarray, timestamp: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Intensità e fiducia corrente per punti (pixel SLAM), vettorizzato.
+
+        Returns:
+            Tuple[ndarray, ndarray]: intensità stimata, peso decaduto (0 = mai visto)
+        """
+        now = time.time() if timestamp is None else timestamp
+        cx = np.clip(np.asarray(xs, dtype=np.intp) // self.cell_size, 0, self.shape[0] - 1)
+        cy = np.clip(np.asarray(ys, dtype=np.intp) // self.cell_size, 0, self.shape[1] - 1)
+        weight = self.weight[cx, cy] * self._decay_factor(self.last_update[cx, cy], now)
+        return self.intensity[cx, cy], weight
+
+    def window_mean(self, center: Tuple[float, float], radius_m: float,
+                    timestamp: Optional[float] = None) -> Tuple[Optional[float], float]:
+        """
+        Intensità media (pesata per fiducia) in una finestra quadrata.
+
+        Args:
+            center: (x, y) in pixel SLAM
+            radius_m: Semi-lato finestra in metri
+
+        Returns:
+            Tuple: (intensità media o None se nessun dato, fiducia totale)
+        """
+        now = time.time() if timestamp is None else timestamp
+        cx = int(center[0]) // self.cell_size
+        cy = int(center[1]) // self.cell_size
+        r = max(0, int(round(radius_m / self.resolution)))
+
+        x0, x1 = max(0, cx - r), min(self.shape[0], cx + r + 1)
+        y0, y1 = max(0, cy - r), min(self.shape[1], cy + r + 1)
+        if x0 >= x1 or y0 >= y1:
+            return None, 0.0
+
+        weight = self.weight[x0:x1, y0:y1] * self._decay_factor(self.last_update[x0:x1, y0:y1], now)
+        total = float(weight.sum())
+        if total <= 1e-6:
+            return None, 0.0
+
+        return float((self.intensity[x0:x1, y0:y1] * weight).sum() / total), total
+
+    def side_intensity(self, position: Tuple[float, float], orientation: float,
+                       distance_m: float = 0.5, radius_m: float = 0.4,
+                       timestamp: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """
+        Luce ricordata a sinistra, davanti e a destra del robot.
+
+        Returns:
+            dict: left/front/right → intensità media (None se zona mai vista)
+        """
+        distance_px = distance_m / self.map_resolution
+        result = {}
+        for side, offset in (('left', math.pi / 2), ('front', 0.0), ('right', -math.pi / 2)):
+            angle = orientation + offset
+            center = (position[0] + distance_px * math.cos(angle), position[1] + distance_px * math.sin(angle))
+            result[side], _ = self.window_mean(center, radius_m, timestamp)
+        return result
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Array per salvataggio insieme alla mappa."""
+        return {
+            'light_intensity': self.intensity,
+            'light_weight': self.weight,
+            'light_last_update': self.last_update
+        }
+
+    def load_arrays(self, data) -> bool:
+        """Ripristina il layer da array salvati (se compatibili)."""
+        if 'light_intensity' not in data or data['light_intensity'].shape != self.shape:
+            return False
+        self.intensity[...] = data['light_intensity']
+        self.weight[...] = data['light_weight']
+        self.last_update[...] = data['light_last_update']
+        return True
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'shape': self.shape,
+            'resolution': self.resolution,
+            'cells_known': int(np.count_nonzero(self.weight)),
+            'stats': self.stats.copy()
+        }
+
+
+# Testing functions
+def test_light_map():
+    """Test: robot che gira vicino a una lampada, poi query sinistra/destra."""
+    light_map = LightMap({}, (2000, 2000), 0.05)
+    lamp = np.array([1000.0, 1060.0])  # lampada 3m a sinistra (asse +y)
+
+    # Percorso a serpentina su un'area 4x4m attorno a (1000, 1000)
+    now = 1000.0
+    step = 0
+    for row, y in enumerate(np.arange(960.0, 1040.0, 4.0)):
+        xs = np.arange(960.0, 1040.0, 2.0)
+        for x in (xs if row % 2 == 0 else xs[::-1]):
+            angles = light_map.sensor_angles
+            offset = light_map.sensor_offset / light_map.map_resolution
+            sensor_pos = np.stack([x + offset * np.cos(angles), y + offset * np.sin(angles)], axis=1)
+            dist_m = np.hypot(*(sensor_pos - lamp).T) * light_map.map_resolution
+            light_map.observe((x, y), 0.0, (900 - 100 * dist_m).tolist(), now + step * 0.1)
+            step += 1
+    now += step * 0.1
+
+    sides = light_map.side_intensity((1000.0, 1000.0), 0.0, timestamp=now)
+    print("Testing LightMap...")
+    print(f"  Sinistra: {sides['left']:.1f}, Destra: {sides['right']:.1f}")
+    assert sides['left'] > sides['right'], "La lampada è a sinistra!"
+
+    _, fresh = light_map.window_mean((1000.0, 1000.0), 0.4, now)
+    _, stale = light_map.window_mean((1000.0, 1000.0), 0.4, now + light_map.decay_time)
+    print(f"  Fiducia ora: {fresh:.1f}, dopo decay_time: {stale:.1f} (~{fresh / math.e:.1f} attesa)")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        light_map.observe((1000.0, 1000.0), 0.3, [500, 480, 520, 490])
+    print(f"  observe: {(time.perf_counter() - start) * 1000:.1f}µs")
+
+    xs = np.random.default_rng(0).integers(0, 2000, 10000)
+    start = time.perf_counter()
+    light_map.query(xs, xs)
+    print(f"  query 10000 punti: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    test_light_map()
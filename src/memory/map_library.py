@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Map Library - Robot AI Memory System
+====================================
+
+Libreria di mappe salvate (una per ambiente/sessione) sotto data/maps,
+con metadati e descrittori compatti per riconoscere "dove sono" all'avvio.
+
+In parole semplici:
+- Ogni mappa salvata ha la sua cartella: map.npz (griglia + layer)
+- index.json elenca tutte le mappe con i metadati: dimensioni, riquadro
+  esplorato, ostacoli, sessioni, ultima posa e un descrittore
+- Il descrittore è un istogramma delle distanze che il sonar vedrebbe
+  da punti liberi della mappa (16 numeri): non dipende da posizione né
+  orientamento, quindi si confronta subito con le prime letture reali
+- All'avvio: si ordinano le mappe per somiglianza del descrittore, e
+  solo sulle migliori si fa la ricerca correlativa coarse-to-fine
+  (CorrelativeScanMatcher) per trovare la posa esatta
+
+Author: Andrea Vavassori
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional, Any
+import numpy as np
+
+from .ray_casting import cast_rays
+from .scan_matcher import CorrelativeScanMatcher
+
+INDEX_VERSION = 1
+
+
+class MapLibrary:
+    """
+    Mappe salvate + ricerca della mappa/posa che spiega meglio una scansione.
+    """
+
+    INDEX = 'index.json'
+    MAP_FILE = 'map.npz'
+
+    def __init__(self, config: dict, map_size: Tuple[int, int], map_resolution: float):
+        self.logger = logging.getLogger(__name__)
+
+        library_config = config.get('map_library', {})
+
+        self.directory = Path(library_config.get('directory', 'data/maps/library'))
+        self.map_size = tuple(map_size)
+        self.map_resolution = map_resolution
+
+        # Descrittore: istogramma distanze sonar
+        self.max_range_cm = library_config.get('max_range_cm', 300.0)
+        self.descriptor_bins = library_config.get('descriptor_bins', 16)
+        self.descriptor_samples = library_config.get('descriptor_samples', 400)
+
+        # Ricerca correlativa
+        self.max_candidates = library_config.get('max_candidates', 3)
+        self.min_match_score = library_config.get('min_match_score', 0.6)
+        self.angle_step = np.radians(library_config.get('angle_step_deg', 2.0))
+        self.matcher_sigma = library_config.get('matcher_sigma', 0.1)  # metri
+        self.matcher_levels = library_config.get('matcher_levels', 4)
+
+        self._index: List[Dict[str, Any]] = self._read_index()
+        self._matchers: Dict[str, CorrelativeScanMatcher] = {}  # lookup precalcolati per mappa
+
+    # ------------------------------------------------------------------
+    # Indice
+    # ------------------------------------------------------------------
+
+    def _read_index(self) -> List[Dict[str, Any]]:
+        path = self.directory / self.INDEX
+        if not path.exists():
+            return []
+        try:
+            data = json.loads(path.read_text())
+            if data.get('version') != INDEX_VERSION:
+                self.logger.warning("Indice libreria mappe di versione diversa - ignorato")
+                return []
+            return data.get('maps', [])
+        except Exception as e:
+            self.logger.error(f"Errore lettura indice libreria mappe: {e}")
+            return []
+
+    def _write_index(self):
+        """Scrittura atomica dell'indice (file temporaneo + rename)."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / self.INDEX
+        tmp_path = self.directory / (self.INDEX + '.tmp')
+        payload = json.dumps({'version': INDEX_VERSION, 'maps': self._index}, indent=2)
+        with open(tmp_path, 'w') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def list_maps(self) -> List[Dict[str, Any]]:
+        """Metadati delle mappe compatibili con la configurazione corrente."""
+        return [
+            entry for entry in self._index
+            if tuple(entry.get('map_size', ())) == self.map_size
+            and entry.get('map_resolution') == self.map_resolution
+        ]
+
+    def get_metadata(self, map_id: str) -> Optional[Dict[str, Any]]:
+        for entry in self._index:
+            if entry['id'] == map_id:
+                return entry
+        return None
+
+    # ------------------------------------------------------------------
+    # Descrittori
+    # ------------------------------------------------------------------
+
+    def _histogram(self, ranges_cm: np.ndarray) -> np.ndarray:
+        """Istogramma normalizzato: bin regolari fino a max_range + bin "nessuna eco"."""
+        ranges_cm = np.asarray(ranges_cm, dtype=np.float64)
+        edges = np.linspace(0.0, self.max_range_cm, self.descriptor_bins)
+        hist = np.zeros(self.descriptor_bins)
+        near = ranges_cm < self.max_range_cm
+        hist[:-1] = np.histogram(ranges_cm[near], bins=edges)[0]
+        hist[-1] = np.count_nonzero(~near)
+        total = hist.sum()
+        return hist / total if total > 0 else hist
+
+    def scan_descriptor(self, ranges_cm: np.ndarray) -> np.ndarray:
+        """Descrittore delle letture reali (stesso spazio dei descrittori mappa)."""
+        return self._histogram(ranges_cm)
+
+    def compute_descriptor(self, grid_map: np.ndarray, seed: int = 0) -> np.ndarray:
+        """
+        Descrittore di una mappa: raggi simulati da celle libere casuali.
+
+        Invariante a traslazione e rotazione → confrontabile con le prime
+        letture prima di sapere dove si trova il robot.
+        """
+        free_x, free_y = np.nonzero(grid_map == 0)
+        if free_x.size == 0:
+            return np.zeros(self.descriptor_bins)
+
+        rng = np.random.default_rng(seed)
+        pick = rng.integers(0, free_x.size, self.descriptor_samples)
+        angles = rng.uniform(-np.pi, np.pi, self.descriptor_samples)
+
+        max_range_px = self.max_range_cm / 100.0 / self.map_resolution
+        ranges_px = cast_rays(grid_map, free_x[pick], free_y[pick], angles, max_range_px)
+        return self._histogram(ranges_px * self.map_resolution * 100.0)
+
+    @staticmethod
+    def descriptor_similarity(a: np.ndarray, b: np.ndarray) -> float:
+        """Coefficiente di Bhattacharyya (1.0 = distribuzioni identiche)."""
+        return float(np.sum(np.sqrt(np.asarray(a) * np.asarray(b))))
+
+    # ------------------------------------------------------------------
+    # Salvataggio / caricamento
+    # ------------------------------------------------------------------
+
+    def save(self, grid_map: np.ndarray, robot_pose: Tuple[float, float, float],
+             layers: Optional[Dict[str, np.ndarray]] = None,
+             map_id: Optional[str] = None, name: Optional[str] = None) -> str:
+        """
+        Salva (o aggiorna) una mappa nella libreria. Bloccante: usare in un thread.
+
+        Args:
+            grid_map: Griglia di occupazione
+            robot_pose: Ultima posa (x, y, theta)
+            layers: Array extra da salvare (luce, visite, storico)
+            map_id: Mappa esistente da aggiornare (None = nuova)
+            name: Nome leggibile
+
+        Returns:
+            str: Id della mappa
+        """
+        now = time.time()
+        entry = self.get_metadata(map_id) if map_id else None
+        if entry is None:
+            if not map_id:
+                base_id = time.strftime('map_%Y%m%d_%H%M%S', time.localtime(now))
+                map_id, suffix = base_id, 1
+                while self.get_metadata(map_id) is not None:
+                    suffix += 1
+                    map_id = f"{base_id}_{suffix}"
+            entry = {'id': map_id, 'name': name or map_id, 'created': now, 'sessions': 0}
+            self._index.append(entry)
+
+        map_dir = self.directory / map_id
+        map_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = map_dir / ('tmp_' + self.MAP_FILE)  # np.savez vuole estensione .npz
+        np.savez_compressed(
+            tmp_path,
+            grid_map=grid_map,
+            robot_pose=np.asarray(robot_pose, dtype=np.float64),
+            **(layers or {})
+        )
+        os.replace(tmp_path, map_dir / self.MAP_FILE)
+
+        known_x, known_y = np.nonzero(grid_map != -1)
+        bbox = ([int(known_x.min()), int(known_y.min()), int(known_x.max()), int(known_y.max())]
+                if known_x.size else None)
+
+        entry.update({
+            'name': name or entry['name'],
+            'updated': now,
+            'sessions': entry.get('sessions', 0) + 1,
+            'map_size': list(self.map_size),
+            'map_resolution': self.map_resolution,
+            'bbox': bbox,
+            'known_cells': int(known_x.size),
+            'obstacle_cells': int(np.count_nonzero(grid_map == 1)),
+            'last_pose': [float(v) for v in robot_pose],
+            'descriptor': [round(float(v), 5) for v in self.compute_descriptor(grid_map)]
+        })
+        self._write_index()
+        self._matchers.pop(map_id, None)  # lookup da ricostruire
+
+        self.logger.info(f"Mappa '{entry['name']}' salvata in libreria ({map_id}, sessione {entry['sessions']})")
+        return map_id
+
+    def load(self, map_id: str) -> Optional[Dict[str, np.ndarray]]:
+        """Carica griglia e layer di una mappa (dict di array), None se mancante."""
+        path = self.directory / map_id / self.MAP_FILE
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+
+    def _get_matcher(self, map_id: str) -> Optional[CorrelativeScanMatcher]:
+        matcher = self._matchers.get(map_id)
+        if matcher is None:
+            data = self.load(map_id)
+            if data is None:
+                return None
+            matcher = CorrelativeScanMatcher(self.map_resolution, self.matcher_sigma, self.matcher_levels)
+            matcher.build(data['grid_map'])
+            self._matchers[map_id] = matcher
+        return matcher
+
+    # ------------------------------------------------------------------
+    # Relocalizzazione
+    # ------------------------------------------------------------------
+
+    def rank_candidates(self, ranges_cm: np.ndarray) -> List[Tuple[str, float]]:
+        """Mappe ordinate per somiglianza del descrittore con le letture."""
+        scan = self.scan_descriptor(ranges_cm)
+        ranked = [
+            (entry['id'], self.descriptor_similarity(scan, entry['descriptor']))
+            for entry in self.list_maps() if entry.get('descriptor')
+        ]
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked
+
+    def relocalize(self, points: np.ndarray, ranges_cm: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Trova mappa e posa che spiegano meglio i punti osservati.
+        Bloccante (decine di ms per mappa): usare in un thread.
+
+        Args:
+            points: Punti ostacolo (N, 2) in pixel, relativi alla posa da stimare
+            ranges_cm: Tutte le distanze lette (per il descrittore)
+
+        Returns:
+            dict: map_id, x, y, theta, score, similarity; None se nessuna
+                  mappa supera min_match_score
+        """
+        if len(points) == 0:
+            return None
+
+        best = None
+        for map_id, similarity in self.rank_candidates(ranges_cm)[:self.max_candidates]:
+            matcher = self._get_matcher(map_id)
+            if matcher is None:
+                continue
+            result = matcher.match(points, theta_step=self.angle_step)
+            if result is None:
+                continue
+            self.logger.debug(f"Relocalizzazione su {map_id}: score {result['score']:.2f} "
+                              f"(descrittore {similarity:.2f})")
+            if best is None or result['score'] > best['score']:
+                best = {'map_id': map_id, 'similarity': similarity, **result}
+
+        if best is None or best['score'] < self.min_match_score:
+            return None
+        return best
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'directory': str(self.directory),
+            'maps': len(self._index),
+            'compatible_maps': len(self.list_maps())
+        }
+
+
+# Testing functions
+def test_map_library():
+    """Test: due stanze in libreria, relocalizzazione da un ventaglio di letture."""
+    import tempfile
+
+    def room(size, furniture):
+        grid = np.full((2000, 2000), -1, dtype=np.int8)
+        x0, y0 = 900, 900
+        grid[x0:x0 + size[0], y0:y0 + size[1]] = 0
+        grid[x0, y0:y0 + size[1]] = grid[x0 + size[0] - 1, y0:y0 + size[1]] = 1
+        grid[x0:x0 + size[0], y0] = grid[x0:x0 + size[0], y0 + size[1] - 1] = 1
+        for fx, fy, w, h in furniture:
+            grid[x0 + fx:x0 + fx + w, y0 + fy:y0 + fy + h] = 1
+        return grid
+
+    kitchen = room((80, 60), [(10, 10, 20, 10), (50, 30, 10, 25)])
+    living = room((120, 100), [(30, 20, 15, 30), (90, 60, 10, 35)])
+
+    with tempfile.TemporaryDirectory() as directory:
+        library = MapLibrary({'map_library': {'directory': directory}}, (2000, 2000), 0.05)
+        library.save(kitchen, (940, 930, 0.0), name='cucina')
+        living_id = library.save(living, (960, 950, 0.0), name='soggiorno')
+
+        # Robot nel soggiorno, in una posa sconosciuta: ventaglio 360° a 10°
+        true_pose = (1000, 940, -2.2)
+        angles = np.radians(np.arange(-180, 180, 10.0))
+        ranges_px = cast_rays(living, true_pose[0], true_pose[1], true_pose[2] + angles, 60.0)
+        ranges_cm = ranges_px * 0.05 * 100 + np.random.default_rng(1).normal(0, 1.5, angles.size)
+
+        near = ranges_cm < 300
+        points = np.stack([ranges_cm[near] / 5.0 * np.cos(true_pose[2] + angles[near]),
+                           ranges_cm[near] / 5.0 * np.sin(true_pose[2] + angles[near])], axis=1)
+        # I punti sono nel frame della nuova sessione: ruotato rispetto alla mappa salvata
+        session_rotation = 1.0
+        c, s = np.cos(-session_rotation), np.sin(-session_rotation)
+        points = points @ np.array([[c, s], [-s, c]])
+
+        print("Testing MapLibrary...")
+        print(f"  Candidati per descrittore: {library.rank_candidates(ranges_cm)}")
+
+        start = time.perf_counter()
+        result = library.relocalize(points, ranges_cm)
+        print(f"  Relocalizzazione: {(time.perf_counter() - start) * 1000:.0f}ms → {result['map_id']} "
+              f"({result['x']}, {result['y']}) rotazione {result['theta']:.2f} score {result['score']:.2f}")
+        assert result['map_id'] == living_id
+        assert abs(result['x'] - true_pose[0]) <= 3 and abs(result['y'] - true_pose[1]) <= 3
+        assert abs(result['theta'] - session_rotation) < 0.1
+
+        reopened = MapLibrary({'map_library': {'directory': directory}}, (2000, 2000), 0.05)
+        print(f"  Indice riletto: {[m['name'] for m in reopened.list_maps()]}")
+
+
+if __name__ == "__main__":
+    test_map_library()
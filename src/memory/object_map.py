@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+Object Map - Robot AI Memory System
+===================================
+
+Layer semantico della mappa: oggetti riconosciuti (gatto, sedia, persona...)
+posizionati nelle coordinate SLAM e indicizzati con uno spatial hash.
+
+In parole semplici:
+- Ogni riconoscimento viene proiettato sulla mappa: posa del robot +
+  direzione (dal riquadro nell'immagine) + distanza (sonar o stima)
+- Se lo stesso tipo di oggetto è già stato visto lì vicino, si aggiorna
+  quello (media pesata della posizione, conteggio avvistamenti)
+  invece di creare un duplicato
+- Spatial hash: dizionario cella → oggetti. Ricerca per raggio e
+  "k più vicini" guardano solo le celle intorno, non tutti gli oggetti
+- "Dove ho visto il gatto l'ultima volta?" = lettura di un dizionario
+- Gli oggetti cambiati vengono scritti nella tabella SQLite `objects`
+  a blocchi (una transazione), non ad ogni avvistamento
+
+Author: Andrea Vavassori
+"""
+
+import logging
+import math
+import time
+from typing import Dict, List, Tuple, Optional, Any, Union
+
+
+class SemanticObjectMap:
+    """
+    Oggetti in coordinate mappa (pixel SLAM) con spatial hash.
+
+    Rilevamenti accettati da observe():
+    - stringa: solo etichetta ('person'), davanti al robot
+    - dict: type/label, confidence, bearing (rad, + = sinistra) oppure
+      bbox [x, y, w, h] in pixel immagine, distance_cm opzionale, properties
+    """
+
+    def __init__(self, config: dict, map_resolution: float, experience_db=None):
+        self.logger = logging.getLogger(__name__)
+
+        objects_config = config.get('ai', {}).get('slam', {}).get('objects', {})
+        camera_config = config.get('hardware', {}).get('camera', {})
+
+        self.map_resolution = map_resolution
+        self.cell_size_px = max(1.0, objects_config.get('cell_size', 0.5) / map_resolution)
+        self.merge_radius_px = objects_config.get('merge_radius', 0.4) / map_resolution
+        self.default_distance_cm = objects_config.get('default_distance', 1.0) * 100.0
+        self.min_confidence = objects_config.get('min_confidence', 0.3)
+        self.sync_interval = objects_config.get('sync_interval', 10.0)  # secondi
+
+        self.camera_fov = math.radians(camera_config.get('fov_deg', 62.2))
+        self.image_width = camera_config.get('resolution', [640, 480])[0]
+
+        self.experience_db = experience_db
+
+        self.objects: Dict[int, Dict[str, Any]] = {}
+        self._cells: Dict[Tuple[int, int], set] = {}        # spatial hash
+        self._bounds: Optional[List[int]] = None            # celle min/max occupate (limite anelli kNN)
+        self._last_by_type: Dict[str, int] = {}             # tipo → oggetto visto più di recente
+        self._dirty: set = set()                            # da sincronizzare col DB
+        self._session_ids: Optional[set] = set()            # visti in frame sessione (None dopo reproject)
+        self._next_id = 1
+        self._last_sync = time.monotonic()
+
+        self.stats = {
+            'observations': 0,
+            'merged': 0,
+            'created': 0,
+            'synced_rows': 0
+        }
+
+    # ------------------------------------------------------------------
+    # Spatial hash
+    # ------------------------------------------------------------------
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x // self.cell_size_px), int(y // self.cell_size_px)
+
+    def _hash_insert(self, obj: Dict[str, Any]):
+        cell = self._cell(obj['x'], obj['y'])
+        obj['_cell'] = cell
+        self._cells.setdefault(cell, set()).add(obj['id'])
+        if self._bounds is None:
+            self._bounds = [cell[0], cell[1], cell[0], cell[1]]
+        else:
+            b = self._bounds
+            b[0], b[1] = min(b[0], cell[0]), min(b[1], cell[1])
+            b[2], b[3] = max(b[2], cell[0]), max(b[3], cell[1])
+
+    def _hash_remove(self, obj: Dict[str, Any]):
+        bucket = self._cells.get(obj['_cell'])
+        if bucket is not None:
+            bucket.discard(obj['id'])
+            if not bucket:
+                del self._cells[obj['_cell']]
+
+    def _candidates(self, x: float, y: float, radius_px: float):
+        """Oggetti nelle celle che toccano il cerchio (x, y, radius)."""
+        cx0, cy0 = self._cell(x - radius_px, y - radius_px)
+        cx1, cy1 = self._cell(x + radius_px, y + radius_px)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for object_id in self._cells.get((cx, cy), ()):
+                    yield self.objects[object_id]
+
+    # ------------------------------------------------------------------
+    # Osservazioni
+    # ------------------------------------------------------------------
+
+    def _project(self, detection: Union[str, Dict[str, Any]], pose: Tuple[float, float, float],
+                 distance_cm: Optional[float]) -> Optional[Dict[str, Any]]:
+        """Converte un rilevamento in (tipo, confidenza, posizione mappa)."""
+        if isinstance(detection, str):
+            detection = {'type': detection}
+
+        object_type = detection.get('type') or detection.get('label')
+        confidence = float(detection.get('confidence', 1.0))
+        if not object_type or confidence < self.min_confidence:
+            return None
+
+        bearing = detection.get('bearing')
+        if bearing is None and detection.get('bbox') is not None:
+            x, _, w, _ = detection['bbox']
+            offset = (x + w / 2.0) / self.image_width - 0.5   # -0.5 sinistra immagine, +0.5 destra
+            bearing = -offset * self.camera_fov                # + = sinistra del robot
+        bearing = float(bearing or 0.0)
+
+        # Distanza: dal rilevamento, altrimenti sonar (se l'oggetto è davanti), altrimenti stima
+        distance = detection.get('distance_cm')
+        if distance is None:
+            if distance_cm is not None and distance_cm < 300 and abs(bearing) < math.radians(15):
+                distance = distance_cm
+            else:
+                distance = self.default_distance_cm
+        r = float(distance) / 100.0 / self.map_resolution
+
+        angle = pose[2] + bearing
+        return {
+            'type': object_type,
+            'confidence': confidence,
+            'x': pose[0] + r * math.cos(angle),
+            'y': pose[1] + r * math.sin(angle),
+            'properties': detection.get('properties', {})
+        }
+
+    def observe(self, detections: List[Union[str, Dict[str, Any]]], pose: Tuple[float, float, float],
+                distance_cm: Optional[float] = None, timestamp: Optional[float] = None) -> List[int]:
+        """
+        Integra i rilevamenti della telecamera.
+
+        Args:
+            detections: Lista rilevamenti (stringhe o dict)
+            pose: Posa robot (x, y pixel, theta radianti)
+            distance_cm: Lettura sonar frontale corrente (opzionale)
+            timestamp: Tempo osservazione (default: ora)
+
+        Returns:
+            List[int]: Id degli oggetti aggiornati/creati
+        """
+        now = time.time() if timestamp is None else timestamp
+        touched = []
+
+        for detection in detections or ():
+            projected = self._project(detection, pose, distance_cm)
+            if projected is None:
+                continue
+            self.stats['observations'] += 1
+
+            # Oggetto dello stesso tipo già noto lì vicino?
+            match = None
+            best_d2 = self.merge_radius_px ** 2
+            for obj in self._candidates(projected['x'], projected['y'], self.merge_radius_px):
+                if obj['type'] != projected['type']:
+                    continue
+                d2 = (obj['x'] - projected['x']) ** 2 + (obj['y'] - projected['y']) ** 2
+                if d2 <= best_d2:
+                    match, best_d2 = obj, d2
+
+            if match is not None:
+                # Media pesata con la confidenza: più avvistamenti = posizione più stabile
+                weight = match['weight'] + projected['confidence']
+                alpha = projected['confidence'] / weight
+                new_x = match['x'] + alpha * (projected['x'] - match['x'])
+                new_y = match['y'] + alpha * (projected['y'] - match['y'])
+                if self._cell(new_x, new_y) != match['_cell']:
+                    self._hash_remove(match)
+                    match['x'], match['y'] = new_x, new_y
+                    self._hash_insert(match)
+                else:
+                    match['x'], match['y'] = new_x, new_y
+                match['weight'] = weight
+                match['confidence'] = max(match['confidence'], projected['confidence'])
+                match['sightings'] += 1
+                match['last_seen'] = now
+                match['properties'].update(projected['properties'])
+                obj = match
+                self.stats['merged'] += 1
+            else:
+                obj = {
+                    'id': self._next_id,
+                    'db_id': None,
+                    'type': projected['type'],
+                    'x': projected['x'],
+                    'y': projected['y'],
+                    'confidence': projected['confidence'],
+                    'weight': projected['confidence'],
+                    'sightings': 1,
+                    'first_seen': now,
+                    'last_seen': now,
+                    'properties': dict(projected['properties'])
+                }
+                self._next_id += 1
+                self.objects[obj['id']] = obj
+                self._hash_insert(obj)
+                self.stats['created'] += 1
+
+            self._last_by_type[obj['type']] = obj['id']
+            self._dirty.add(obj['id'])
+            if self._session_ids is not None:
+                self._session_ids.add(obj['id'])
+            touched.append(obj['id'])
+
+        return touched
+
+    def reproject(self, to_map) -> int:
+        """
+        Porta nel frame della mappa salvata gli oggetti visti in questa sessione.
+
+        Chiamata da SLAMSystem quando adotta una mappa della libreria
+        (add_relocalization_listener): to_map(x, y) → (x, y) nel nuovo frame.
+        Gli oggetti caricati dal database sono già nel frame della mappa.
+
+        Returns:
+            int: Oggetti riproiettati
+        """
+        session_ids, self._session_ids = self._session_ids or set(), None
+        for object_id in session_ids:
+            obj = self.objects[object_id]
+            self._hash_remove(obj)
+            x, y = to_map(obj['x'], obj['y'])
+            obj['x'], obj['y'] = float(x), float(y)
+            self._hash_insert(obj)
+            self._dirty.add(object_id)
+        if session_ids:
+            self.logger.info(f"Riproiettati {len(session_ids)} oggetti nel frame della mappa salvata")
+        return len(session_ids)
+
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+
+    def query_radius(self, x: float, y: float, radius_m: float,
+                     object_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Oggetti entro radius_m da (x, y) pixel, ordinati per distanza.
+
+        Ogni risultato ha 'distance_m'.
+        """
+        radius_px = radius_m / self.map_resolution
+        results = []
+        for obj in self._candidates(x, y, radius_px):
+            if object_type is not None and obj['type'] != object_type:
+                continue
+            d = math.hypot(obj['x'] - x, obj['y'] - y)
+            if d <= radius_px:
+                results.append({**self._public(obj), 'distance_m': d * self.map_resolution})
+        results.sort(key=lambda item: item['distance_m'])
+        return results
+
+    @staticmethod
+    def _ring_cells(cx: int, cy: int, ring: int):
+        """Celle sul bordo del quadrato di raggio ring (solo il bordo, non l'interno)."""
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for gx in range(cx - ring, cx + ring + 1):
+            yield (gx, cy - ring)
+            yield (gx, cy + ring)
+        for gy in range(cy - ring + 1, cy + ring):
+            yield (cx - ring, gy)
+            yield (cx + ring, gy)
+
+    def nearest(self, x: float, y: float, k: int = 1, object_type: Optional[str] = None,
+                max_distance_m: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        k oggetti più vicini: anelli di celle crescenti finché i k trovati sono
+        sicuramente più vicini di qualunque cella non ancora visitata.
+        """
+        if not self.objects:
+            return []
+
+        cx, cy = self._cell(x, y)
+        b = self._bounds
+        max_ring = max(abs(cx - b[0]), abs(cx - b[2]), abs(cy - b[1]), abs(cy - b[3]))
+        if max_distance_m is not None:
+            max_ring = min(max_ring, int(math.ceil(max_distance_m / self.map_resolution / self.cell_size_px)) + 1)
+
+        found = []
+        for ring in range(0, max_ring + 1):
+            for cell in self._ring_cells(cx, cy, ring):
+                for object_id in self._cells.get(cell, ()):
+                    obj = self.objects[object_id]
+                    if object_type is None or obj['type'] == object_type:
+                        found.append((math.hypot(obj['x'] - x, obj['y'] - y), obj))
+
+            # Le celle fuori dall'anello distano almeno ring * cell_size
+            if len(found) >= k:
+                found.sort(key=lambda item: item[0])
+                if found[k - 1][0] <= ring * self.cell_size_px:
+                    break
+
+        found.sort(key=lambda item: item[0])
+        results = []
+        for d, obj in found[:k]:
+            if max_distance_m is not None and d * self.map_resolution > max_distance_m:
+                break
+            results.append({**self._public(obj), 'distance_m': d * self.map_resolution})
+        return results
+
+    def last_seen(self, object_type: str) -> Optional[Dict[str, Any]]:
+        """Dove è stato visto per l'ultima volta un tipo di oggetto (O(1))."""
+        object_id = self._last_by_type.get(object_type)
+        if object_id is None:
+            return None
+        return self._public(self.objects[object_id])
+
+    def _public(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'id': obj['id'],
+            'type': obj['type'],
+            'position_pixels': [obj['x'], obj['y']],
+            'position_meters': [obj['x'] * self.map_resolution, obj['y'] * self.map_resolution],
+            'confidence': obj['confidence'],
+            'sightings': obj['sightings'],
+            'first_seen': obj['first_seen'],
+            'last_seen': obj['last_seen'],
+            'properties': obj['properties']
+        }
+
+    # ------------------------------------------------------------------
+    # Sincronizzazione SQLite
+    # ------------------------------------------------------------------
+
+    async def load(self) -> int:
+        """Ricarica gli oggetti dalla tabella `objects` (all'avvio)."""
+        if self.experience_db is None:
+            return 0
+
+        rows = await self.experience_db.load_objects()
+        for row in rows:
+            properties = dict(row.get('properties') or {})
+            meta = properties.pop('_map', {})
+            obj = {
+                'id': self._next_id,
+                'db_id': row['id'],
+                'type': row['object_type'],
+                'x': row['position_x'] / self.map_resolution,
+                'y': row['position_y'] / self.map_resolution,
+                'confidence': row['confidence'],
+                'weight': meta.get('weight', row['confidence']),
+                'sightings': meta.get('sightings', 1),
+                'first_seen': meta.get('first_seen', row['timestamp']),
+                'last_seen': row['timestamp'],
+                'properties': properties
+            }
+            self._next_id += 1
+            self.objects[obj['id']] = obj
+            self._hash_insert(obj)
+            last = self._last_by_type.get(obj['type'])
+            if last is None or self.objects[last]['last_seen'] <= obj['last_seen']:
+                self._last_by_type[obj['type']] = obj['id']
+
+        self.logger.info(f"Caricati {len(rows)} oggetti nella mappa semantica")
+        return len(rows)
+
+    async def sync(self) -> int:
+        """Scrive gli oggetti cambiati in una sola transazione. Returns: righe scritte."""
+        self._last_sync = time.monotonic()
+        if self.experience_db is None or not self._dirty:
+            return 0
+
+        dirty = [self.objects[object_id] for object_id in self._dirty]
+        self._dirty = set()
+        records = [{
+            'id': obj['db_id'],
+            'timestamp': obj['last_seen'],
+            'object_type': obj['type'],
+            'confidence': obj['confidence'],
+            'position_x': obj['x'] * self.map_resolution,
+            'position_y': obj['y'] * self.map_resolution,
+            'properties': {
+                **obj['properties'],
+                '_map': {'sightings': obj['sightings'], 'first_seen': obj['first_seen'], 'weight': obj['weight']}
+            }
+        } for obj in dirty]
+
+        db_ids = await self.experience_db.upsert_objects(records)
+        if db_ids is None:
+            self._dirty.update(obj['id'] for obj in dirty)  # Riprova al prossimo sync
+            return 0
+
+        for obj, db_id in zip(dirty, db_ids):
+            obj['db_id'] = db_id
+        self.stats['synced_rows'] += len(records)
+        return len(records)
+
+    async def maybe_sync(self) -> int:
+        """Sync periodico (ogni sync_interval secondi)."""
+        if time.monotonic() - self._last_sync < self.sync_interval:
+            return 0
+        return await self.sync()
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'objects': len(self.objects),
+            'types': sorted(self._last_by_type),
+            'pending_sync': len(self._dirty),
+            'stats': self.stats.copy()
+        }
+
+
+# Testing functions
+async def test_object_map():
+    """Test: avvistamenti ripetuti, query spaziali e sync con SQLite."""
+    import random
+    import tempfile
+    from pathlib import Path
+    from memory.experience_db import ExperienceDatabase
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = ExperienceDatabase({}, str(Path(directory) / 'objects.db'))
+        await db.initialize()
+
+        objects = SemanticObjectMap({}, 0.05, db)
+        rng = random.Random(0)
+        types = ['chair', 'bottle', 'plant', 'cat', 'person']
+
+        print("Testing SemanticObjectMap...")
+        # 2000 oggetti sparsi + avvistamenti ripetuti del gatto
+        for _ in range(2000):
+            pose = (rng.uniform(0, 2000), rng.uniform(0, 2000), rng.uniform(-math.pi, math.pi))
+            objects.observe([{'type': rng.choice(types[:-2]), 'confidence': 0.8, 'distance_cm': 100}], pose)
+        for step in range(20):
+            pose = (1000 + rng.gauss(0, 1), 1000 + rng.gauss(0, 1), 0.0)
+            objects.observe([{'type': 'cat', 'bbox': [300, 200, 40, 40], 'confidence': 0.9}], pose, distance_cm=80)
+
+        cat = objects.last_seen('cat')
+        print(f"  Oggetti: {len(objects.objects)}, gatto: {cat['sightings']} avvistamenti "
+              f"in {[round(v, 2) for v in cat['position_meters']]}m")
+        assert cat['sightings'] == 20
+
+        start = time.perf_counter()
+        for _ in range(10000):
+            objects.last_seen('cat')
+        print(f"  last_seen: {(time.perf_counter() - start) / 10000 * 1e6:.2f}µs")
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            near = objects.query_radius(1000, 1000, 2.0)
+        print(f"  query_radius 2m: {(time.perf_counter() - start):.3f}ms ({len(near)} oggetti)")
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            knn = objects.nearest(500, 500, k=5)
+        brute = sorted(objects.objects.values(), key=lambda o: math.hypot(o['x'] - 500, o['y'] - 500))[:5]
+        print(f"  nearest k=5: {(time.perf_counter() - start):.3f}ms")
+        assert [o['id'] for o in knn] == [o['id'] for o in brute]
+
+        start = time.perf_counter()
+        written = await objects.sync()
+        print(f"  Sync: {written} righe in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        reloaded = SemanticObjectMap({}, 0.05, db)
+        await reloaded.load()
+        assert reloaded.last_seen('cat')['sightings'] == 20
+
+        # Mappa salvata adottata: solo gli oggetti visti in sessione cambiano frame
+        before = objects.last_seen('cat')['position_pixels']
+        moved = objects.reproject(lambda x, y: (y + 100.0, -x + 3000.0))
+        after = objects.last_seen('cat')['position_pixels']
+        print(f"  Riproiettati: {moved}, gatto {[round(v) for v in before]} → {[round(v) for v in after]}")
+        assert moved == len(objects.objects) and reloaded.reproject(lambda x, y: (x, y)) == 0
+        assert after == [before[1] + 100.0, -before[0] + 3000.0]
+        assert any(o['id'] == cat['id'] for o in objects.query_radius(after[0], after[1], 0.1, 'cat'))
+        await db.cleanup()
+
+
+if __name__ == "__main__":
+    import asyncio
+    asyncio.run(test_object_map())
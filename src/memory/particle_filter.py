@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Particle Filter - Robot AI Memory System
+========================================
+
+Localizzazione Monte Carlo (particle filter) completamente vettorizzata.
+Stima la posa del robot (x, y, theta) nella griglia dello SLAM usando
+i comandi motore e le letture del sensore ultrasonico.
+
+In parole semplici:
+- Teniamo tante "ipotesi" di dove può essere il robot (particelle)
+- Quando il robot si muove, tutte le ipotesi si muovono (con un po' di rumore)
+- Quando il sensore misura una distanza, le ipotesi coerenti con la mappa
+  diventano più probabili
+- Ogni tanto si ricampiona: le ipotesi buone si moltiplicano, quelle
+  cattive spariscono
+
+Tutte le operazioni lavorano su array NumPy: nessun loop Python per particella,
+così 100-1000 particelle stanno nel budget del loop a 10Hz.
+
+Author: Andrea Vavassori
+"""
+
+import logging
+import math
+from typing import Dict, List, Tuple, Optional, Any, Union
+import numpy as np
+
+from .ray_casting import cast_rays
+
+# Direzioni comando motore → segno (avanti, rotazione)
+# Accetta sia i valori di MotorDirection sia i nomi azione del LearningAgent
+_COMMAND_SIGNS = {
+    'MOVE_FORWARD': (1.0, 0.0),
+    'MOVE_BACKWARD': (-1.0, 0.0),
+    'TURN_LEFT': (0.0, 1.0),
+    'TURN_RIGHT': (0.0, -1.0),
+    'STOP': (0.0, 0.0),
+    'move_forward': (1.0, 0.0),
+    'move_backward': (-1.0, 0.0),
+    'turn_left': (0.0, 1.0),
+    'turn_right': (0.0, -1.0),
+    'stop': (0.0, 0.0),
+}
+
+
+class ParticleFilter:
+    """
+    Filtro a particelle per localizzazione su griglia di occupazione.
+
+    Stato interno (array NumPy di lunghezza N):
+    - x, y: posizione in pixel della mappa
+    - theta: orientamento in radianti (0 = asse +x)
+    - weights: pesi normalizzati delle particelle
+    """
+
+    def __init__(self, slam_config: dict, map_size: Tuple[int, int], map_resolution: float,
+                 seed: Optional[int] = None):
+        self.logger = logging.getLogger(__name__)
+
+        self.map_size = tuple(map_size)
+        self.map_resolution = map_resolution
+        self.particle_count = int(slam_config.get('particle_count', 100))
+
+        # Range massimo sensore in pixel
+        self.max_range_px = slam_config.get('laser_range', 4.0) / map_resolution
+
+        # Modello di moto: velocità per unità di speed PWM
+        motion_config = slam_config.get('motion_model', {})
+        self.linear_cm_per_speed = motion_config.get('linear_cm_s_per_speed', 0.5)     # speed 40 → 20cm/s
+        self.angular_deg_per_speed = motion_config.get('angular_deg_s_per_speed', 2.25)  # speed 40 → 90°/s
+
+        # Rumore di moto (stile odometria: proporzionale al movimento)
+        self.alpha_trans = motion_config.get('translation_noise', 0.1)   # 10% della traslazione
+        self.alpha_rot = motion_config.get('rotation_noise', 0.15)       # 15% della rotazione
+        # Rumore minimo come random walk nel tempo (σ ∝ √dt): la dispersione
+        # non dipende da quanto spesso arrivano i delta (odometria a 50Hz o 10Hz)
+        self.min_trans_noise_px = 0.2 / math.sqrt(0.1)       # px/√s (0.2px ogni 0.1s)
+        self.min_rot_noise = math.radians(1.0) / math.sqrt(0.1)  # rad/√s
+
+        # Modello sensore HC-SR04
+        sensor_config = slam_config.get('sensor_model', {})
+        self.sensor_sigma_px = sensor_config.get('sigma_cm', 5.0) / 100.0 / map_resolution
+        self.random_measurement_prob = sensor_config.get('random_prob', 0.1)
+        self.ray_step = 1.0
+
+        # Ricampionamento quando N_eff scende sotto questa frazione
+        self.resample_threshold = slam_config.get('resample_threshold', 0.5)
+
+        self.rng = np.random.default_rng(seed)
+
+        # Array particelle
+        self.x = np.zeros(self.particle_count)
+        self.y = np.zeros(self.particle_count)
+        self.theta = np.zeros(self.particle_count)
+        self.weights = np.full(self.particle_count, 1.0 / self.particle_count)
+
+        self.stats = {
+            'predictions': 0,
+            'updates': 0,
+            'resamples': 0,
+            'effective_particles': float(self.particle_count)
+        }
+
+        self.logger.info(f"ParticleFilter inizializzato - {self.particle_count} particelle")
+
+    def reset(self, pose: Tuple[float, float, float],
+              position_spread_px: float = 2.0, angle_spread: float = 0.05):
+        """
+        Inizializza particelle attorno a una posa nota.
+
+        Args:
+            pose: (x, y, theta) in pixel/radianti
+            position_spread_px: Deviazione standard posizione
+            angle_spread: Deviazione standard orientamento (radianti)
+        """
+        n = self.particle_count
+        self.x = pose[0] + self.rng.normal(0.0, position_spread_px, n)
+        self.y = pose[1] + self.rng.normal(0.0, position_spread_px, n)
+        self.theta = pose[2] + self.rng.normal(0.0, angle_spread, n)
+        self.weights.fill(1.0 / n)
+        self._clip_to_map()
+
+    def command_to_motion(self, direction: Union[str, Any], speed: int, dt: float) -> Tuple[float, float]:
+        """
+        Converte comando motore in movimento atteso.
+
+        Args:
+            direction: MotorDirection o nome azione ('move_forward', 'TURN_LEFT', ...)
+            speed: Velocità PWM del comando
+            dt: Durata del comando in secondi
+
+        Returns:
+            Tuple[float, float]: (traslazione in pixel, rotazione in radianti)
+        """
+        key = getattr(direction, 'value', direction)
+        forward_sign, turn_sign = _COMMAND_SIGNS.get(key, (0.0, 0.0))
+
+        distance_cm = forward_sign * self.linear_cm_per_speed * speed * dt
+        rotation_deg = turn_sign * self.angular_deg_per_speed * speed * dt
+
+        return distance_cm / 100.0 / self.map_resolution, math.radians(rotation_deg)
+
+    def predict(self, translation_px: float, rotation: float, dt: float):
+        """
+        Propaga tutte le particelle con movimento (traslazione, rotazione) + rumore.
+
+        Modello: prima metà rotazione, traslazione, seconda metà rotazione.
+
+        Args:
+            translation_px: Traslazione in avanti (pixel)
+            rotation: Rotazione (radianti)
+            dt: Secondi di moto coperti dal delta (scala il rumore minimo)
+        """
+        n = self.particle_count
+
+        time_scale = math.sqrt(max(0.0, dt))
+        trans_sigma = self.alpha_trans * abs(translation_px) + self.min_trans_noise_px * time_scale
+        rot_sigma = self.alpha_rot * abs(rotation) + self.min_rot_noise * time_scale
+
+        noisy_trans = translation_px + self.rng.normal(0.0, trans_sigma, n)
+        noisy_rot = rotation + self.rng.normal(0.0, rot_sigma, n)
+
+        heading = self.theta + 0.5 * noisy_rot
+        self.x += noisy_trans * np.cos(heading)
+        self.y += noisy_trans * np.sin(heading)
+        self.theta = heading + 0.5 * noisy_rot
+
+        self._clip_to_map()
+        self.stats['predictions'] += 1
+
+    def apply_correction(self, dx: float, dy: float, dtheta: float, pivot: Tuple[float, float]):
+        """
+        Sposta rigidamente tutte le particelle (correzione da scan matching).
+
+        Args:
+            dx, dy: Traslazione in pixel
+            dtheta: Rotazione (radianti) attorno a pivot
+            pivot: Punto di rotazione (posa stimata corrente)
+        """
+        cos_t, sin_t = math.cos(dtheta), math.sin(dtheta)
+        rel_x = self.x - pivot[0]
+        rel_y = self.y - pivot[1]
+        self.x = pivot[0] + cos_t * rel_x - sin_t * rel_y + dx
+        self.y = pivot[1] + sin_t * rel_x + cos_t * rel_y + dy
+        self.theta = self.theta + dtheta
+        self._clip_to_map()
+
+    def update(self, grid_map: np.ndarray, ranges_cm: Union[float, List[float], np.ndarray],
+               relative_angles: Optional[Union[List[float], np.ndarray]] = None) -> float:
+        """
+        Aggiorna pesi con le letture ultrasoniche (uno o più raggi).
+
+        Args:
+            grid_map: Griglia di occupazione corrente
+            ranges_cm: Distanze misurate in cm (scalare o una per raggio)
+            relative_angles: Angolo di ogni raggio rispetto al robot (default: 0)
+
+        Returns:
+            float: Numero effettivo di particelle dopo l'update
+        """
+        ranges_px = np.atleast_1d(np.asarray(ranges_cm, dtype=np.float64)) / 100.0 / self.map_resolution
+        if relative_angles is None:
+            relative_angles = np.zeros_like(ranges_px)
+        relative_angles = np.atleast_1d(np.asarray(relative_angles, dtype=np.float64))
+
+        # Raggi attesi per ogni (particella, raggio): shape (N, K)
+        expected = cast_rays(
+            grid_map,
+            self.x[:, None],
+            self.y[:, None],
+            self.theta[:, None] + relative_angles[None, :],
+            self.max_range_px,
+            self.ray_step
+        )
+
+        # Letture oltre il range = "nessun ostacolo"
+        measured = np.minimum(ranges_px, self.max_range_px)[None, :]
+
+        # Miscela gaussiana + uniforme (robusta a letture spurie e celle sconosciute)
+        gaussian = np.exp(-0.5 * ((expected - measured) / self.sensor_sigma_px) ** 2)
+        uniform = 1.0 / self.max_range_px
+        likelihood = ((1.0 - self.random_measurement_prob) * gaussian
+                      + self.random_measurement_prob * uniform)
+
+        # Log-likelihood per stabilità numerica con molti raggi
+        log_weights = np.log(self.weights + 1e-300) + np.log(likelihood).sum(axis=1)
+        log_weights -= log_weights.max()
+        weights = np.exp(log_weights)
+        self.weights = weights / weights.sum()
+
+        n_eff = self.effective_particles()
+        self.stats['updates'] += 1
+        self.stats['effective_particles'] = n_eff
+
+        if n_eff < self.resample_threshold * self.particle_count:
+            self.resample()
+
+        return n_eff
+
+    def effective_particles(self) -> float:
+        """Numero effettivo di particelle (1 / somma pesi²)."""
+        return float(1.0 / np.sum(self.weights ** 2))
+
+    def resample(self):
+        """Ricampionamento sistematico (O(N), un solo numero casuale)."""
+        n = self.particle_count
+        positions = (self.rng.random() + np.arange(n)) / n
+        cumulative = np.cumsum(self.weights)
+        cumulative[-1] = 1.0  # Evita errori di arrotondamento
+        indices = np.searchsorted(cumulative, positions)
+
+        self.x = self.x[indices]
+        self.y = self.y[indices]
+        self.theta = self.theta[indices]
+        self.weights.fill(1.0 / n)
+        self.stats['resamples'] += 1
+
+    def estimate(self) -> Tuple[float, float, float]:
+        """
+        Posa stimata come media pesata (media circolare per l'angolo).
+
+        Returns:
+            Tuple[float, float, float]: (x, y, theta)
+        """
+        x = float(np.dot(self.weights, self.x))
+        y = float(np.dot(self.weights, self.y))
+        theta = math.atan2(float(np.dot(self.weights, np.sin(self.theta))),
+                           float(np.dot(self.weights, np.cos(self.theta))))
+        return x, y, theta
+
+    def covariance(self) -> np.ndarray:
+        """Covarianza pesata 2x2 della posizione (pixel²)."""
+        dx = self.x - np.dot(self.weights, self.x)
+        dy = self.y - np.dot(self.weights, self.y)
+        cxx = np.dot(self.weights, dx * dx)
+        cyy = np.dot(self.weights, dy * dy)
+        cxy = np.dot(self.weights, dx * dy)
+        return np.array([[cxx, cxy], [cxy, cyy]])
+
+    def get_state(self) -> Dict[str, Any]:
+        """Riassunto stato filtro per get_current_state."""
+        x, y, theta = self.estimate()
+        cov = self.covariance()
+        return {
+            'estimate_pixels': [x, y],
+            'estimate_orientation_degrees': math.degrees(theta),
+            'position_std_pixels': float(math.sqrt(max(0.0, cov[0, 0] + cov[1, 1]))),
+            'particle_count': self.particle_count,
+            'stats': self.stats.copy()
+        }
+
+    def _clip_to_map(self):
+        """Mantiene le particelle dentro i limiti della mappa."""
+        np.clip(self.x, 0, self.map_size[0] - 1, out=self.x)
+        np.clip(self.y, 0, self.map_size[1] - 1, out=self.y)
+
+
+# Testing functions
+def test_particle_filter(particle_count: int = 500, steps: int = 50):
+    """Test rapido: robot che avanza verso un muro in una stanza semplice."""
+    import time
+
+    # Corridoio largo 3m (60px) che termina con un muro
+    grid = np.zeros((400, 400), dtype=np.int8)
+    grid[0, :] = grid[-1, :] = grid[:, 0] = grid[:, -1] = 1
+    grid[:, 170] = grid[:, 230] = 1
+    grid[260, :] = 1
+
+    config = {'particle_count': particle_count, 'laser_range': 4.0}
+    pf = ParticleFilter(config, grid.shape, 0.05, seed=42)
+
+    true_pose = [200.0, 200.0, 0.0]
+    pf.reset(tuple(true_pose), position_spread_px=10.0, angle_spread=0.1)
+
+    print(f"Testing ParticleFilter con {particle_count} particelle...")
+    start = time.time()
+
+    for _ in range(steps):
+        # Comando: avanti a speed 40 per 0.1s
+        translation, rotation = pf.command_to_motion('MOVE_FORWARD', 40, 0.1)
+        true_pose[0] = min(true_pose[0] + translation, 250)
+        pf.predict(translation, rotation, 0.1)
+
+        # Lettura simulata verso il muro di fondo (+x) e due raggi laterali
+        angles = np.array([0.0, math.pi / 2, -math.pi / 2])
+        true_ranges = cast_rays(grid, true_pose[0], true_pose[1], angles, pf.max_range_px)
+        ranges_cm = true_ranges * 0.05 * 100 + np.random.normal(0, 2, 3)
+        pf.update(grid, ranges_cm, angles)
+
+    elapsed = (time.time() - start) / steps * 1000
+    x, y, theta = pf.estimate()
+    print(f"  Posa vera: ({true_pose[0]:.1f}, {true_pose[1]:.1f})")
+    print(f"  Stima:     ({x:.1f}, {y:.1f}, {math.degrees(theta):.1f}°)")
+    print(f"  Tempo medio per step: {elapsed:.2f}ms")
+    print(f"  Statistiche: {pf.stats}")
+
+    # Stessa durata di moto a 50Hz o a 10Hz: stessa dispersione
+    spreads = []
+    for rate in (50, 10):
+        pf.reset((200.0, 200.0, 0.0), position_spread_px=0.0, angle_spread=0.0)
+        for _ in range(rate * 2):
+            pf.predict(0.0, 0.0, 1.0 / rate)
+        spreads.append(float(np.std(pf.theta)))
+    print(f"  Dispersione angolo dopo 2s fermo: 50Hz {math.degrees(spreads[0]):.2f}°, "
+          f"10Hz {math.degrees(spreads[1]):.2f}°")
+    assert abs(spreads[0] - spreads[1]) < 0.2 * spreads[1]
+
+
+if __name__ == "__main__":
+    test_particle_filter()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Pattern Miner - Robot AI Memory System
+======================================
+
+Sequenze frequenti (stato, azione) → esito scoperte sul flusso delle
+esperienze, in memoria fissa.
+
+In parole semplici:
+- Il robot ricorda gli ultimi max_length passi (stato discreto, azione):
+  ogni nuova esperienza chiude sequenze di 2..4 passi, ciascuna con
+  l'esito dell'ultima azione ("fermo vicino al muro, poi giro a destra
+  → successo")
+- Contare tutte le sequenze possibili non sta in memoria: un count-min
+  sketch (tabella fissa di contatori) stima quante volte è apparsa una
+  sequenza, una tabella Space-Saving tiene solo le top_k più frequenti
+  con la distribuzione dei loro esiti
+- Le migliori finiscono nella tabella patterns del database; la
+  previsione dell'esito di un'azione è una ricerca in dizionario, niente
+  query sulla storia
+- Se tra due esperienze passano più di max_gap secondi la sequenza si
+  interrompe (il robot ha fatto altro nel frattempo)
+
+Author: Andrea Vavassori
+"""
+
+import heapq
+import logging
+import random
+import time
+from array import array
+from collections import deque
+from typing import Dict, List, Optional, Any, Tuple, Hashable
+
+_MASK64 = (1 << 64) - 1
+
+Step = Tuple[int, str]           # (state_id, azione)
+Sequence = Tuple[Step, ...]      # Passi consecutivi, l'ultimo è quello con l'esito
+
+
+class CountMinSketch:
+    """
+    Conteggi approssimati in depth × width contatori.
+
+    La stima non è mai inferiore al vero conteggio; con l'aggiornamento
+    conservativo (si alzano solo i contatori al minimo) l'eccesso resta
+    piccolo anche con molte chiavi rare.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4, seed: int = 0):
+        self.width = 1 << max(1, (int(width) - 1).bit_length())  # Potenza di 2
+        self.depth = max(1, int(depth))
+        self._shift = 64 - (self.width.bit_length() - 1)
+        # Tabella piatta: riga r, colonna c → r * width + c. Pochi contatori
+        # per chiave: interi Python costano meno delle chiamate numpy
+        self.table = array('q', bytes(8 * self.depth * self.width))
+
+        # Hash multiply-shift indipendenti per riga (a dispari), con l'offset di riga
+        rng = random.Random(seed)
+        self._hashes = [(rng.getrandbits(64) | 1, rng.getrandbits(64), row * self.width)
+                        for row in range(self.depth)]
+        self.total = 0
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.table) * self.table.itemsize
+
+    def _cells(self, key: Hashable) -> List[int]:
+        h = hash(key) & _MASK64
+        shift = self._shift
+        return [offset + (((a * h + b) & _MASK64) >> shift) for a, b, offset in self._hashes]
+
+    def add(self, key: Hashable, count: int = 1) -> int:
+        """Conta key e restituisce la stima aggiornata."""
+        table = self.table
+        cells = self._cells(key)
+        estimate = min([table[cell] for cell in cells]) + count
+        for cell in cells:
+            if table[cell] < estimate:
+                table[cell] = estimate
+        self.total += count
+        return estimate
+
+    def estimate(self, key: Hashable) -> int:
+        table = self.table
+        return min([table[cell] for cell in self._cells(key)])
+
+
+class SpaceSaving:
+    """
+    Le capacity chiavi più frequenti di un flusso (algoritmo Space-Saving).
+
+    Una chiave nuova con tabella piena prende il posto della meno
+    frequente se la sua stima (count-min, o minimo + 1 senza sketch) la
+    supera. errors[key] è quanto il conteggio può essere sovrastimato.
+    """
+
+    def __init__(self, capacity: int = 512):
+        self.capacity = max(1, int(capacity))
+        self.counts: Dict[Hashable, int] = {}
+        self.errors: Dict[Hashable, int] = {}
+        self._heap: List[Tuple[int, Hashable]] = []  # (conteggio al push, chiave), una voce per chiave
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.counts
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _min_entry(self) -> Tuple[int, Hashable]:
+        # I conteggi crescono senza toccare l'heap: rimette a posto la cima
+        # finché il suo conteggio è quello attuale
+        while True:
+            count, key = self._heap[0]
+            current = self.counts[key]
+            if current == count:
+                return count, key
+            heapq.heapreplace(self._heap, (current, key))
+
+    def offer(self, key: Hashable, estimate: int = None) -> Tuple[bool, Optional[Hashable]]:
+        """
+        Conta un'occorrenza di key.
+
+        Returns:
+            Tuple: (key è tracciata, chiave espulsa per farle posto o None)
+        """
+        if key in self.counts:
+            self.counts[key] += 1
+            return True, None
+
+        if len(self.counts) < self.capacity:
+            count = estimate or 1
+            self.counts[key] = count
+            self.errors[key] = count - 1
+            heapq.heappush(self._heap, (count, key))
+            return True, None
+
+        minimum, evicted = self._min_entry()
+        if estimate is None:
+            count, error = minimum + 1, minimum
+        else:
+            count, error = estimate, estimate - 1
+        if count <= minimum:
+            return False, None
+
+        heapq.heapreplace(self._heap, (count, key))
+        del self.counts[evicted], self.errors[evicted]
+        self.counts[key] = count
+        self.errors[key] = error
+        return True, evicted
+
+    def top(self, n: int = None) -> List[Tuple[Hashable, int, int]]:
+        """(chiave, conteggio, errore) dalla più frequente."""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return [(key, count, self.errors[key]) for key, count in ranked[:n]]
+
+
+class PatternMiner:
+    """
+    Miner incrementale di sequenze (stato, azione) → esito.
+
+    observe() per ogni esperienza (costo costante: max_length - 1
+    sequenze), top_patterns() per salvarle, context() per le chiavi da
+    cercare quando si valuta un'azione candidata.
+    """
+
+    def __init__(self, config: dict):
+        self.config = config.get('pattern_mining', {})
+        self.logger = logging.getLogger(__name__)
+
+        self.min_length = max(2, self.config.get('min_length', 2))
+        self.max_length = max(self.min_length, self.config.get('max_length', 4))
+        self.max_gap = self.config.get('max_gap', 10.0)          # s tra passi della stessa sequenza
+        self.min_support = self.config.get('min_support', 5)     # esiti osservati prima di fidarsi
+
+        self.sketch = CountMinSketch(self.config.get('sketch_width', 2048), self.config.get('sketch_depth', 4))
+        self.top_k = SpaceSaving(self.config.get('top_k', 512))
+        self.outcomes: Dict[Sequence, Dict[str, Any]] = {}  # Solo sequenze tracciate da top_k
+
+        self.window: deque = deque(maxlen=self.max_length)
+        self._last_time: Optional[float] = None
+
+        self.stats = {
+            'observations': 0,
+            'sequences': 0,
+            'evictions': 0
+        }
+
+    def _recent_steps(self, timestamp: float) -> Tuple[Step, ...]:
+        if self._last_time is None or timestamp - self._last_time > self.max_gap:
+            return ()
+        return tuple(self.window)
+
+    def observe(self, state_id: int, action: str, outcome: str,
+                reward: float = 0.0, timestamp: float = None):
+        """Aggiunge un passo e conta le sequenze che termina."""
+        timestamp = time.time() if timestamp is None else timestamp
+        if not self._recent_steps(timestamp):
+            self.window.clear()
+        self.window.append((int(state_id), action))
+        self._last_time = timestamp
+        self.stats['observations'] += 1
+
+        steps = tuple(self.window)
+        for length in range(self.min_length, len(steps) + 1):
+            key = steps[-length:]
+            tracked, evicted = self.top_k.offer(key, self.sketch.add(key))
+            self.stats['sequences'] += 1
+            if evicted is not None:
+                del self.outcomes[evicted]
+                self.stats['evictions'] += 1
+            if not tracked:
+                continue
+
+            entry = self.outcomes.get(key)
+            if entry is None:
+                entry = self.outcomes[key] = {'outcomes': {}, 'observed': 0, 'reward_sum': 0.0,
+                                              'first_seen': timestamp, 'last_seen': timestamp}
+            entry['outcomes'][outcome] = entry['outcomes'].get(outcome, 0) + 1
+            entry['observed'] += 1
+            entry['reward_sum'] += reward
+            entry['last_seen'] = timestamp
+
+    def context(self, state_id: int, action: str, now: float = None) -> List[Sequence]:
+        """
+        Sequenze che terminerebbero con (state_id, action) dopo i passi
+        recenti, dalla più lunga (più specifica).
+        """
+        steps = self._recent_steps(time.time() if now is None else now)
+        candidate = ((int(state_id), action),)
+        longest = min(self.max_length, len(steps) + 1)
+        return [steps[len(steps) - length + 1:] + candidate
+                for length in range(longest, self.min_length - 1, -1)]
+
+    def top_patterns(self, n: int = None) -> List[Dict[str, Any]]:
+        """Sequenze più frequenti con almeno min_support esiti osservati."""
+        patterns = []
+        for key, count, error in self.top_k.top():
+            entry = self.outcomes[key]
+            observed = entry['observed']
+            if observed < self.min_support:
+                continue
+            outcomes = entry['outcomes']
+            patterns.append({
+                'sequence': key,
+                'count': count,
+                'error': error,
+                'outcomes': dict(outcomes),
+                'predicted_outcome': max(outcomes, key=outcomes.get),
+                'success_rate': outcomes.get('success', 0) / observed,
+                'avg_reward': entry['reward_sum'] / observed,
+                'first_seen': entry['first_seen'],
+                'last_seen': entry['last_seen']
+            })
+            if n is not None and len(patterns) >= n:
+                break
+        return patterns
+
+    def seed(self, patterns: List[Dict[str, Any]]):
+        """Riparte dai pattern salvati (stesso formato di top_patterns)."""
+        for pattern in patterns:
+            key = tuple(pattern['sequence'])
+            if key in self.top_k or len(self.top_k) >= self.top_k.capacity:
+                continue
+            self.top_k.offer(key, self.sketch.add(key, pattern['count']))
+            observed = sum(pattern['outcomes'].values())
+            self.outcomes[key] = {
+                'outcomes': dict(pattern['outcomes']),
+                'observed': observed,
+                'reward_sum': pattern['avg_reward'] * observed,
+                'first_seen': pattern['first_seen'],
+                'last_seen': pattern['last_seen']
+            }
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'tracked': len(self.top_k),
+            'capacity': self.top_k.capacity,
+            'sketch_bytes': self.sketch.nbytes,
+            'stats': self.stats.copy()
+        }
+
+
+# Testing functions
+def test_pattern_miner():
+    """Test: pattern piantato nel rumore, memoria limitata, stime count-min."""
+    rng = random.Random(7)
+    miner = PatternMiner({'pattern_mining': {'top_k': 64, 'sketch_width': 512}})
+    actions = ['move_forward', 'turn_left', 'turn_right', 'stop', 'explore']
+
+    print("Testing PatternMiner...")
+    now = 1_700_000_000.0
+    true_counts: Dict[Sequence, int] = {}
+    window: deque = deque(maxlen=4)
+    for step in range(20000):
+        now += 1.0
+        if step % 10 == 0:
+            # Pattern: avanti in spazio libero (stato 3), vicino al muro (stato 1) → stop
+            for state_id, action, outcome in [(3, 'move_forward', 'success'), (1, 'stop', 'success')]:
+                miner.observe(state_id, action, outcome if rng.random() < 0.9 else 'failure', 1.0, now)
+                window.append((state_id, action))
+                now += 1.0
+        else:
+            state_id, action = rng.randrange(200), rng.choice(actions)
+            miner.observe(state_id, action, rng.choice(['success', 'failure']), 0.0, now)
+            window.append((state_id, action))
+        if len(window) >= 2:
+            key = tuple(window)[-2:]
+            true_counts[key] = true_counts.get(key, 0) + 1
+
+    planted = ((3, 'move_forward'), (1, 'stop'))
+    top = miner.top_patterns(5)
+    print(f"  Sequenze viste: {miner.stats['sequences']}, tracciate: {len(miner.top_k)}, "
+          f"sketch: {miner.sketch.nbytes // 1024}KB")
+    print(f"  Top: {top[0]['sequence']} ×{top[0]['count']} success_rate={top[0]['success_rate']:.2f}")
+    assert top[0]['sequence'] == planted and 0.8 < top[0]['success_rate'] <= 1.0
+    assert len(miner.top_k) <= 64 and len(miner.outcomes) == len(miner.top_k)
+
+    # Count-min: mai sotto il vero conteggio
+    for key, count in list(true_counts.items())[:500]:
+        assert miner.sketch.estimate(key) >= count
+
+    # Previsione: dopo "avanti in stato 3", stop in stato 1 è il pattern noto
+    miner.observe(3, 'move_forward', 'success', 1.0, now)
+    context = miner.context(1, 'stop', now + 1.0)
+    assert context[-1] == planted and len(context) == 3
+    assert miner.context(1, 'stop', now + 60.0) == []  # Sequenza interrotta
+
+    # Ripartenza dai pattern salvati
+    restored = PatternMiner({'pattern_mining': {'top_k': 64}})
+    restored.seed(top)
+    assert restored.top_patterns(1)[0]['sequence'] == planted
+
+
+if __name__ == "__main__":
+    test_pattern_miner()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Position History - Robot AI Memory System
+=========================================
+
+Storico pose del robot (x, y, theta, t) in un ring buffer NumPy
+preallocato: niente liste Python che crescono e pop(0) ad ogni tick.
+
+In parole semplici:
+- Ogni posa viene scritta due volte (posizione i e i + capacity):
+  così le ultime N pose sono SEMPRE una fetta contigua dell'array,
+  anche quando il buffer "gira". Le finestre sono viste, zero copie
+- append() è O(1): due scritture e un incremento
+- window(since) trova l'inizio con ricerca binaria sui timestamp
+- distance_traveled() somma i passi con NumPy (niente loop)
+
+Author: Andrea Vavassori
+"""
+
+from typing import Optional
+import numpy as np
+
+POSE_DTYPE = np.dtype([('x', np.float64), ('y', np.float64), ('theta', np.float64), ('t', np.float64)])
+
+
+class PositionHistory:
+    """
+    Ring buffer "specchiato" di pose con viste cronologiche contigue.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = int(capacity)
+        self._buffer = np.zeros(2 * self.capacity, dtype=POSE_DTYPE)
+        self._head = 0     # Prossima posizione di scrittura (0..capacity-1)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, x: float, y: float, theta: float, t: float):
+        """Aggiunge una posa (O(1))."""
+        record = (x, y, theta, t)
+        self._buffer[self._head] = record
+        self._buffer[self._head + self.capacity] = record
+
+        self._head += 1
+        if self._head == self.capacity:
+            self._head = 0
+        if self._count < self.capacity:
+            self._count += 1
+
+    def last(self, n: Optional[int] = None) -> np.ndarray:
+        """
+        Ultime n pose in ordine cronologico (vista, non copia).
+
+        Args:
+            n: Numero pose (default: tutte)
+        """
+        n = self._count if n is None else max(0, min(int(n), self._count))
+        end = self._head + self.capacity
+        return self._buffer[end - n:end]
+
+    def window(self, since: float) -> np.ndarray:
+        """Pose con timestamp >= since (vista, ricerca binaria sui tempi)."""
+        poses = self.last()
+        start = int(np.searchsorted(poses['t'], since, side='left'))
+        return poses[start:]
+
+    def latest(self) -> Optional[np.void]:
+        """Posa più recente, None se vuoto."""
+        if self._count == 0:
+            return None
+        return self._buffer[self._head + self.capacity - 1]
+
+    @staticmethod
+    def path_length(poses: np.ndarray) -> float:
+        """Lunghezza del percorso (pixel) di una sequenza di pose, vettorizzata."""
+        if len(poses) < 2:
+            return 0.0
+        return float(np.hypot(np.diff(poses['x']), np.diff(poses['y'])).sum())
+
+    def distance_traveled(self, n: Optional[int] = None, since: Optional[float] = None) -> float:
+        """
+        Distanza percorsa (pixel) sulle ultime n pose o dal tempo since.
+        """
+        poses = self.window(since) if since is not None else self.last(n)
+        return self.path_length(poses)
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    def to_array(self) -> np.ndarray:
+        """Copia cronologica (per salvataggio)."""
+        return self.last().copy()
+
+    def load_array(self, data: np.ndarray):
+        """
+        Ripristina da array salvato.
+
+        Accetta array strutturati (x, y, theta, t) o il vecchio formato
+        a righe [x, y, timestamp].
+        """
+        self.clear()
+        if data is None or data.size == 0:
+            return
+
+        if data.dtype.names:
+            poses = data
+            xs, ys, thetas, ts = poses['x'], poses['y'], poses['theta'], poses['t']
+        else:
+            rows = np.asarray(data, dtype=np.float64).reshape(len(data), -1)
+            xs, ys, ts = rows[:, 0], rows[:, 1], rows[:, -1]
+            thetas = np.zeros(len(rows))
+
+        # Solo le ultime capacity pose, scritte in blocco in entrambe le metà
+        n = min(len(xs), self.capacity)
+        block = np.zeros(n, dtype=POSE_DTYPE)
+        block['x'], block['y'], block['theta'], block['t'] = xs[-n:], ys[-n:], thetas[-n:], ts[-n:]
+
+        self._buffer[:n] = block
+        self._buffer[self.capacity:self.capacity + n] = block
+        self._head = n % self.capacity
+        self._count = n
+
+
+# Testing functions
+def test_position_history():
+    """Test: correttezza dopo wrap e confronto con lista Python."""
+    import time
+
+    history = PositionHistory(capacity=1000)
+    reference = []
+
+    rng = np.random.default_rng(0)
+    for i in range(2500):
+        x, y = rng.uniform(0, 2000, 2)
+        history.append(x, y, 0.0, float(i))
+        reference.append([x, y, float(i)])
+        if len(reference) > 1000:
+            reference.pop(0)
+
+    ref = np.array(reference)
+    assert np.allclose(history.last()['x'], ref[:, 0]) and np.allclose(history.last()['t'], ref[:, 2])
+    assert np.shares_memory(history.last(10), history._buffer), "La finestra dovrebbe essere una vista"
+
+    ref_distance = sum(np.hypot(ref[i + 1, 0] - ref[i, 0], ref[i + 1, 1] - ref[i, 1]) for i in range(len(ref) - 1))
+    assert abs(history.distance_traveled() - ref_distance) < 1e-6
+
+    restored = PositionHistory(capacity=1000)
+    restored.load_array(history.to_array())
+    assert np.array_equal(restored.last(), history.last())
+
+    print("Testing PositionHistory...")
+    print(f"  Pose: {len(history)}, finestra t>=2400: {len(history.window(2400.0))}")
+    print(f"  Distanza ultime 100 pose: {history.distance_traveled(100):.1f}px")
+
+    start = time.perf_counter()
+    for i in range(100000):
+        history.append(1.0, 2.0, 0.0, 3000.0 + i)
+    print(f"  append: {(time.perf_counter() - start) / 100000 * 1e6:.2f}µs")
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        history.distance_traveled(200)
+    print(f"  distance_traveled(200): {(time.perf_counter() - start) / 10000 * 1e6:.1f}µs")
+
+
+if __name__ == "__main__":
+    test_position_history()
@@ -17,6 +17,7 @@ Author: Andrea Vavassori
 
 import asyncio
 import logging
+import asyncio
 import json
 import time
 import math
@@ -24,6 +25,17 @@ from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Any
 import numpy as np
 
+from .particle_filter import ParticleFilter
+from .frontier_detector import FrontierDetector
+from .distance_field import DistanceField
+from .light_map import LightMap
+from .visitation_map import VisitationMap
+from .change_map import ChangeMap
+from .position_history import PositionHistory
+from .map_store import MapStore
+from .map_library import MapLibrary
+from .scan_matcher import ScanMatchTracker
+
 class SLAMSystem:
     """
     Sistema SLAM per mappatura e localizzazione.
@@ -56,9 +68,13 @@ class SLAMSystem:
         self._sin_orientation = 0.0
         self._last_orientation_update = 0.0
         
-        # Storico posizioni per path tracking
-        self.position_history = []
+        # Localizzazione: particle filter (usato con hardware reale)
+        self.particle_filter = ParticleFilter(self.config, self.map_size, self.map_resolution)
+        self.particle_filter.reset((self.robot_position[0], self.robot_position[1], self.robot_orientation))
+        
+        # Storico posizioni per path tracking (ring buffer preallocato)
         self.max_history = 1000  # Tieni ultime 1000 posizioni
+        self.position_history = PositionHistory(self.max_history)
         
         # Statistics
         self.stats = {
@@ -66,37 +82,186 @@ class SLAMSystem:
             'total_obstacles': 0,
             'total_free_space': 0,
             'distance_traveled': 0.0,
+            'scans_integrated': 0,
             'last_update_time': 0.0
         }
         
         # Simulation: ambiente virtuale con ostacoli
+        self.world_map = None
         if simulation_mode:
             self._create_simulation_environment()
+        
+        # Persistenza incrementale (memmap + tile sporchi + manifest atomico)
+        persistence_config = self.config.get('persistence', {})
+        self.map_store = None
+        self.flush_interval = persistence_config.get('flush_interval', 5.0)  # secondi
+        self._last_flush = time.monotonic()
+        self._flush_task = None
+        self.active_map_id = None  # Mappa della libreria su cui si sta lavorando
+        if persistence_config.get('enabled', True) and (not simulation_mode or persistence_config.get('in_simulation', False)):
+            self.map_store = MapStore(
+                persistence_config.get('directory', 'data/maps/live'),
+                self.map_size,
+                self.map_resolution,
+                persistence_config.get('tile_size', 64)
+            )
+            if not (persistence_config.get('resume', True) and self._resume_from_store()):
+                self.map_store.mark_all_dirty()
+        
+        # Indice incrementale frontiere (confine libero/sconosciuto)
+        self.frontier_detector = FrontierDetector(self.map_size)
+        self.frontier_detector.rebuild(self.grid_map)
+        
+        # Campo di distanza dagli ostacoli (clearance O(1))
+        max_clearance = self.config.get('distance_field_max', 1.0)  # metri
+        self.distance_field = DistanceField(self.map_size, max_clearance / self.map_resolution)
+        self.distance_field.rebuild(self.grid_map)
+        
+        # Layer luce dai fotoresistori (risoluzione più grossa, decadimento nel tempo)
+        self.light_map = LightMap(self.config, self.map_size, self.map_resolution)
+        
+        # Layer visite (novità zone per curiosità / reward shaping)
+        self.visitation_map = VisitationMap(self.config, self.map_size, self.map_resolution)
+        
+        # Layer cambiamenti (osservazioni che contraddicono la mappa)
+        self.change_map = ChangeMap(self.config, self.map_size, self.map_resolution)
+        
+        # Listener esterni per celle cambiate (es. PathPlanner)
+        self._map_listeners = []
+        # Listener cambio di frame (mappa della libreria adottata): to_map(x, y)
+        self._relocalization_listeners = []
+        
+        # Scan matching locale contro la deriva dei cingoli (solo hardware)
+        self.scan_tracker = None
+        if self.config.get('scan_matching', {}).get('enabled', True) and not simulation_mode:
+            self.scan_tracker = ScanMatchTracker(self.config, self.map_size, self.map_resolution)
+            self.add_map_listener(self.scan_tracker.on_cells_changed)
+        
+        # Libreria mappe multi-sessione: all'avvio (senza snapshot ripresa) prova
+        # a riconoscere l'ambiente dalle prime scansioni
+        library_config = self.config.get('map_library', {})
+        self.map_library = None
+        self._relocalization = None
+        if library_config.get('enabled', True) and (not simulation_mode or library_config.get('in_simulation', False)):
+            self.map_library = MapLibrary(self.config, self.map_size, self.map_resolution)
+            if (self.active_map_id is None and not simulation_mode
+                    and library_config.get('relocalize_on_startup', True) and self.map_library.list_maps()):
+                self._relocalization = {
+                    'points': [],
+                    'ranges': [],
+                    'count': 0,
+                    'next_attempt': library_config.get('relocalization_min_points', 20),
+                    'max_points': library_config.get('relocalization_max_points', 300),
+                    'task': None,
+                    'launch_pose': None
+                }
+                self.logger.info(f"Relocalizzazione attiva su {len(self.map_library.list_maps())} mappe salvate")
             
         self.logger.info(f"SLAM System inizializzato - Map: {self.map_size[0]}x{self.map_size[1]}")
     
+    def _resume_from_store(self) -> bool:
+        """Riprende griglia, posa e storico dall'ultima snapshot su disco."""
+        snapshot = self.map_store.load()
+        if snapshot is None:
+            return False
+        
+        manifest = snapshot['manifest']
+        self.grid_map[...] = snapshot['grid_map']
+        self.robot_position = [int(v) for v in manifest.get('robot_position', self.robot_position)]
+        self.robot_orientation = float(manifest.get('robot_orientation', self.robot_orientation))
+        self._cos_orientation = math.cos(self.robot_orientation)
+        self._sin_orientation = math.sin(self.robot_orientation)
+        self._last_orientation_update = self.robot_orientation
+        self.stats.update(manifest.get('statistics', {}))
+        self.active_map_id = manifest.get('library_map_id')
+        
+        if snapshot['history'] is not None:
+            self.position_history.load_array(snapshot['history'])
+        
+        self.particle_filter.reset((self.robot_position[0], self.robot_position[1], self.robot_orientation))
+        
+        self.logger.info(f"Mappa ripresa da snapshot #{manifest.get('sequence')} - posa {self.robot_position}")
+        return True
+    
+    def _snapshot_state(self) -> Dict[str, Any]:
+        """Stato leggero salvato nel manifest ad ogni flush."""
+        return {
+            'robot_position': list(self.robot_position),
+            'robot_orientation': self.robot_orientation,
+            'statistics': self.stats.copy(),
+            'library_map_id': self.active_map_id
+        }
+    
+    def _maybe_schedule_flush(self):
+        """Avvia un flush in background se è passato flush_interval e nessun flush è in corso."""
+        if self.map_store is None:
+            return
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        
+        now = time.monotonic()
+        if now - self._last_flush < self.flush_interval:
+            return
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Chiamato fuori da un event loop: flush al prossimo update async
+        self._last_flush = now
+        
+        self._flush_task = loop.create_task(
+            self.map_store.flush_async(self.grid_map, self._snapshot_state(), self.position_history.to_array())
+        )
+        self._flush_task.add_done_callback(self._on_flush_done)
+    
+    def _on_flush_done(self, task: asyncio.Task):
+        """Errori del flush in background (i tile restano sporchi per il prossimo)."""
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(f"Errore flush mappa: {task.exception()}")
+    
+    async def flush_map(self):
+        """Flush immediato dei tile modificati (attende eventuale flush in corso)."""
+        if self.map_store is None:
+            return
+        if self._flush_task is not None:
+            await asyncio.wait([self._flush_task])  # Errori già loggati da _on_flush_done
+            self._flush_task = None
+        await self.map_store.flush_async(self.grid_map, self._snapshot_state(), self.position_history.to_array())
+        self._last_flush = time.monotonic()
+    
     def _create_simulation_environment(self):
-        """Crea un ambiente virtuale con ostacoli per testing."""
+        """
+        Crea un ambiente virtuale con ostacoli per testing.
+        
+        Il mondo "vero" sta in world_map (ground truth per sensori simulati);
+        grid_map resta sconosciuta e viene costruita dalle letture come su hardware.
+        """
+        self.world_map = np.zeros(self.map_size, dtype=np.int8)
+        
         # Simula una stanza con mobili
         # Muri perimetrali
-        self.grid_map[0, :] = 1     # Muro nord
-        self.grid_map[-1, :] = 1    # Muro sud  
-        self.grid_map[:, 0] = 1     # Muro ovest
-        self.grid_map[:, -1] = 1    # Muro est
+        self.world_map[0, :] = 1     # Muro nord
+        self.world_map[-1, :] = 1    # Muro sud  
+        self.world_map[:, 0] = 1     # Muro ovest
+        self.world_map[:, -1] = 1    # Muro est
         
         # Aggiungi alcuni "mobili" simulati
         # Tavolo (rettangolo)
-        self.grid_map[100:120, 150:200] = 1
+        self.world_map[100:120, 150:200] = 1
         
         # Divano (L-shape)
-        self.grid_map[250:270, 100:150] = 1
-        self.grid_map[250:300, 140:150] = 1
+        self.world_map[250:270, 100:150] = 1
+        self.world_map[250:300, 140:150] = 1
         
         # Sedia (piccolo quadrato)
-        self.grid_map[180:190, 80:90] = 1
+        self.world_map[180:190, 80:90] = 1
         
         self.logger.info("Ambiente simulato creato con ostacoli")
     
+    def get_simulated_pose(self) -> Tuple[float, float, float]:
+        """Posa vera del robot simulato (x, y pixel, theta radianti) per i sensori simulati."""
+        return (float(self.robot_position[0]), float(self.robot_position[1]), self.robot_orientation)
+    
     async def update_position(self, distance_reading: float, light_levels: List[float] = None) -> bool:
         """
         Aggiorna posizione robot e mappa basandosi su lettura sensore distanza.
@@ -115,28 +280,281 @@ class SLAMSystem:
             # Simula movimento del robot (in modalità simulation)
             if self.simulation_mode:
                 await self._simulate_robot_movement()
+            else:
+                # Hardware: posa stimata dal particle filter
+                self._localize(distance_reading)
             
             # Aggiorna mappa con nuove informazioni
             self._update_map_with_sensor_data(distance_reading)
+            self._collect_relocalization_points(distance_reading)
             
-            # Salva posizione corrente nello storico
-            current_pos = self.robot_position.copy()
-            current_pos.append(time.time())  # Aggiungi timestamp
-            self.position_history.append(current_pos)
+            # Memoria spaziale della luce
+            if light_levels:
+                self.light_map.observe(self.robot_position, self.robot_orientation, light_levels)
             
-            # Mantieni storico limitato per memoria
-            if len(self.position_history) > self.max_history:
-                self.position_history.pop(0)
+            self.visitation_map.visit(self.robot_position)
+            
+            # Salva posa corrente nello storico (O(1), le più vecchie vengono sovrascritte)
+            self.position_history.append(
+                self.robot_position[0], self.robot_position[1], self.robot_orientation, time.time()
+            )
             
             # Aggiorna statistics
             self._update_statistics()
             
+            # Persistenza periodica in background (solo tile cambiati)
+            self._maybe_schedule_flush()
+            self._maybe_relocalize()
+            
             return True
             
         except Exception as e:
             self.logger.error(f"Errore update posizione: {e}")
             return False
     
+    def update_with_scan(self, distances_cm: List[float], relative_angles: List[float]) -> bool:
+        """
+        Aggiorna localizzazione e mappa con un ventaglio completo di letture (sweep servo).
+        
+        Tutti i raggi vengono integrati in un solo update batch: una correzione
+        del particle filter e una scrittura vettorizzata della griglia.
+        
+        Args:
+            distances_cm: Distanze lette (cm), una per raggio
+            relative_angles: Angolo di ogni raggio rispetto all'orientamento (radianti, positivo = sinistra)
+            
+        Returns:
+            bool: True se update riuscito
+        """
+        try:
+            distances = np.asarray(distances_cm, dtype=np.float64)
+            angles = np.asarray(relative_angles, dtype=np.float64)
+            if distances.size == 0:
+                return False
+            
+            if not self.simulation_mode:
+                self._localize(distances, angles)
+                # Allineamento del ventaglio alla mappa PRIMA di scriverlo
+                self._correct_with_scan(distances, angles)
+            
+            self._update_map_with_sensor_data(distances, angles)
+            self._collect_relocalization_points(distances, angles)
+            self._update_statistics()
+            self.stats['scans_integrated'] = self.stats.get('scans_integrated', 0) + 1
+            self._maybe_schedule_flush()
+            self._maybe_relocalize()
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Errore update scansione: {e}")
+            return False
+    
+    def _collect_relocalization_points(self, distance_cm, relative_angles=None):
+        """Accumula i punti ostacolo (frame della sessione) finché la relocalizzazione è in corso."""
+        reloc = self._relocalization
+        if reloc is None:
+            return
+        
+        distances = np.atleast_1d(np.asarray(distance_cm, dtype=np.float64))
+        relative = 0.0 if relative_angles is None else np.asarray(relative_angles, dtype=np.float64)
+        angles = np.broadcast_to(self.robot_orientation + relative, distances.shape)
+        near = distances < 300
+        r = distances[near] / 100.0 / self.map_resolution
+        points = np.stack([
+            self.robot_position[0] + r * np.cos(angles[near]),
+            self.robot_position[1] + r * np.sin(angles[near])
+        ], axis=1)
+        
+        reloc['points'].append(points)
+        reloc['ranges'].append(distances)
+        reloc['count'] += points.shape[0]
+    
+    def _maybe_relocalize(self):
+        """
+        Gestisce la relocalizzazione all'avvio senza bloccare l'event loop.
+        
+        Con abbastanza punti lancia la ricerca sulla libreria in un thread;
+        al risultato adotta la mappa riconosciuta, altrimenti riprova con più
+        punti fino a relocalization_max_points (poi: ambiente nuovo).
+        """
+        reloc = self._relocalization
+        if reloc is None:
+            return
+        
+        task = reloc['task']
+        if task is not None:
+            if not task.done():
+                return
+            reloc['task'] = None
+            try:
+                result = task.result()
+            except Exception as e:
+                self.logger.error(f"Errore relocalizzazione: {e}")
+                result = None
+            if result is not None:
+                self._adopt_library_map(result, reloc['launch_pose'])
+                return
+        
+        if reloc['count'] >= reloc['max_points']:
+            self.logger.info("Nessuna mappa salvata riconosciuta - si parte con una mappa nuova")
+            self._relocalization = None
+            return
+        if task is not None or reloc['count'] < reloc['next_attempt']:
+            return
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        
+        # Punti relativi alla posa attuale: la ricerca trova questa posa nella mappa salvata
+        points = np.concatenate(reloc['points']) - np.asarray(self.robot_position, dtype=np.float64)
+        ranges = np.concatenate(reloc['ranges'])
+        reloc['launch_pose'] = (self.robot_position[0], self.robot_position[1], self.robot_orientation)
+        reloc['next_attempt'] = reloc['count'] + max(1, reloc['count'] // 2)
+        reloc['task'] = loop.run_in_executor(None, self.map_library.relocalize, points, ranges)
+    
+    def _adopt_library_map(self, result: Dict[str, Any], launch_pose: Tuple[float, float, float]):
+        """
+        Riprende una mappa della libreria con la posa allineata.
+        
+        Il match vale per la posa al lancio della ricerca: il movimento fatto
+        nel frattempo viene ruotato nel frame della mappa salvata. Le celle
+        osservate in questa sessione (comprese quelle usate per il match)
+        vengono portate nello stesso frame e scritte sopra la mappa salvata;
+        i listener di relocalizzazione (es. mappa oggetti) ricevono la
+        trasformazione per riproiettare ciò che hanno in coordinate sessione.
+        """
+        data = self.map_library.load(result['map_id'])
+        if data is None:
+            self._relocalization = None
+            return
+        
+        rotation = result['theta']
+        cos_r, sin_r = math.cos(rotation), math.sin(rotation)
+        
+        def to_map(px, py):
+            """Frame della sessione → frame della mappa salvata (scalari o array)."""
+            dx = px - launch_pose[0]
+            dy = py - launch_pose[1]
+            return result['x'] + cos_r * dx - sin_r * dy, result['y'] + sin_r * dx + cos_r * dy
+        
+        x, y = to_map(self.robot_position[0], self.robot_position[1])
+        theta = (self.robot_orientation + rotation + math.pi) % (2 * math.pi) - math.pi
+        
+        merged = data['grid_map'].copy()
+        merged_x, merged_y, session_values = self._session_cells_in_map_frame(to_map, result, launch_pose)
+        library_values = merged[merged_x, merged_y]
+        merged[merged_x, merged_y] = session_values
+        
+        changed_x, changed_y = np.nonzero(self.grid_map != merged)
+        self.grid_map[...] = merged
+        self.frontier_detector.rebuild(self.grid_map)
+        self.distance_field.rebuild(self.grid_map)
+        self.light_map.load_arrays(data)
+        self.visitation_map.load_arrays(data)
+        self.change_map.load_arrays(data)
+        # Celle che oggi contraddicono la mappa salvata = ambiente cambiato
+        for value in (0, 1):
+            observed = session_values == value
+            differs = observed & (library_values != value)
+            self.change_map.record(merged_x[differs], merged_y[differs], library_values[differs], value)
+        if self.map_store is not None:
+            self.map_store.mark_all_dirty()
+        for listener in self._map_listeners:
+            try:
+                listener(self.grid_map, changed_x, changed_y)
+            except Exception as e:
+                self.logger.error(f"Errore map listener: {e}")
+        for listener in self._relocalization_listeners:
+            try:
+                listener(to_map)
+            except Exception as e:
+                self.logger.error(f"Errore relocalization listener: {e}")
+        
+        self.robot_position = [
+            max(0, min(self.map_size[0] - 1, int(round(x)))),
+            max(0, min(self.map_size[1] - 1, int(round(y))))
+        ]
+        self.robot_orientation = theta
+        self._cos_orientation = math.cos(theta)
+        self._sin_orientation = math.sin(theta)
+        self._last_orientation_update = theta
+        self.particle_filter.reset((self.robot_position[0], self.robot_position[1], theta))
+        self.position_history.clear()
+        
+        self.active_map_id = result['map_id']
+        self._relocalization = None
+        self._update_statistics()
+        
+        name = self.map_library.get_metadata(result['map_id'])['name']
+        self.logger.info(f"Relocalizzato su mappa '{name}' - posa {self.robot_position}, "
+                         f"score {result['score']:.2f}")
+    
+    def _session_cells_in_map_frame(self, to_map, result: Dict[str, Any],
+                                    launch_pose: Tuple[float, float, float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Celle note della sessione riportate nel frame della mappa salvata.
+        
+        Trasformazione inversa cella per cella (nearest neighbour) sul
+        riquadro che le contiene: con la rotazione nessun buco tra le celle.
+        
+        Returns:
+            Tuple: (xs, ys) nel frame mappa e valore osservato (0/1)
+        """
+        known_x, known_y = np.nonzero(self.grid_map != -1)
+        empty = np.empty(0, dtype=np.intp)
+        if known_x.size == 0:
+            return empty, empty, np.empty(0, dtype=self.grid_map.dtype)
+        
+        rotation = result['theta']
+        cos_r, sin_r = math.cos(rotation), math.sin(rotation)
+        corners_x = np.array([known_x.min(), known_x.min(), known_x.max(), known_x.max()], dtype=np.float64)
+        corners_y = np.array([known_y.min(), known_y.max(), known_y.min(), known_y.max()], dtype=np.float64)
+        map_x, map_y = to_map(corners_x, corners_y)
+        x0, x1 = max(0, int(math.floor(map_x.min()))), min(self.map_size[0] - 1, int(math.ceil(map_x.max())))
+        y0, y1 = max(0, int(math.floor(map_y.min()))), min(self.map_size[1] - 1, int(math.ceil(map_y.max())))
+        if x0 > x1 or y0 > y1:
+            return empty, empty, np.empty(0, dtype=self.grid_map.dtype)
+        
+        # Per ogni cella del riquadro (frame mappa): cella sessione corrispondente (to_map inversa)
+        grid_x, grid_y = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1), indexing='ij')
+        dx, dy = grid_x - result['x'], grid_y - result['y']
+        session_x = np.rint(launch_pose[0] + cos_r * dx + sin_r * dy).astype(np.intp)
+        session_y = np.rint(launch_pose[1] - sin_r * dx + cos_r * dy).astype(np.intp)
+        inside = ((session_x >= 0) & (session_x < self.map_size[0]) &
+                  (session_y >= 0) & (session_y < self.map_size[1]))
+        values = np.full(grid_x.shape, -1, dtype=self.grid_map.dtype)
+        values[inside] = self.grid_map[session_x[inside], session_y[inside]]
+        observed = values != -1
+        return grid_x[observed], grid_y[observed], values[observed]
+    
+    async def save_to_library(self, name: Optional[str] = None) -> Optional[str]:
+        """
+        Salva la mappa corrente nella libreria (aggiorna quella riconosciuta, se c'è).
+        
+        Returns:
+            str: Id mappa, None se libreria disattivata o mappa vuota
+        """
+        if self.map_library is None or not np.any(self.grid_map != -1):
+            return None
+        
+        pose = (self.robot_position[0], self.robot_position[1], self.robot_orientation)
+        layers = {
+            'position_history': self.position_history.to_array(),
+            **self.light_map.to_arrays(),
+            **self.visitation_map.to_arrays(),
+            **self.change_map.to_arrays()
+        }
+        try:
+            self.active_map_id = await asyncio.get_running_loop().run_in_executor(
+                None, self.map_library.save, self.grid_map.copy(), pose, layers, self.active_map_id, name
+            )
+            return self.active_map_id
+        except Exception as e:
+            self.logger.error(f"Errore salvataggio mappa in libreria: {e}")
+            return None
+    
     async def _simulate_robot_movement(self):
         """Simula movimento casuale del robot per testing."""
         # Movimento simulato: piccoli step casuali
@@ -162,8 +580,8 @@ class SLAMSystem:
         new_x = max(5, min(self.map_size[0] - 5, int(new_x)))
         new_y = max(5, min(self.map_size[1] - 5, int(new_y)))
         
-        # Se c'è un ostacolo nella nuova posizione, gira
-        if self.grid_map[new_x, new_y] == 1:
+        # Se c'è un ostacolo (vero) nella nuova posizione, gira
+        if self.world_map[new_x, new_y] == 1:
             self.robot_orientation += random.uniform(1.0, 2.0)  # Gira 60-120 gradi
         else:
             # Aggiorna posizione
@@ -174,35 +592,227 @@ class SLAMSystem:
             distance_moved = math.sqrt((new_x - old_pos[0])**2 + (new_y - old_pos[1])**2)
             self.stats['distance_traveled'] += distance_moved * self.map_resolution
     
-    def _update_map_with_sensor_data(self, distance_cm: float):
-        """Aggiorna mappa con dati del sensore ultrasonico."""
-        # Converte distanza in pixels
-        distance_pixels = int(distance_cm / 100.0 / self.map_resolution)
-        
-        # Calcola punto dove è l'ostacolo (usa cache trigonometriche)
-        obstacle_x = self.robot_position[0] + distance_pixels * self._cos_orientation
-        obstacle_y = self.robot_position[1] + distance_pixels * self._sin_orientation
-        
-        # Assicura che sia dentro la mappa
-        obstacle_x = max(0, min(self.map_size[0] - 1, int(obstacle_x)))
-        obstacle_y = max(0, min(self.map_size[1] - 1, int(obstacle_y)))
-        
-        # Marca spazio libero tra robot e ostacolo
-        steps = max(1, distance_pixels)
-        for i in range(steps):
-            if i == steps - 1:
-                # Ultimo punto = ostacolo
-                if distance_cm < 300:  # Solo se ostacolo abbastanza vicino
-                    self.grid_map[obstacle_x, obstacle_y] = 1
-            else:
-                # Punti intermedi = spazio libero (usa cache trigonometriche)
-                free_x = self.robot_position[0] + i * self._cos_orientation
-                free_y = self.robot_position[1] + i * self._sin_orientation
-                
-                free_x = max(0, min(self.map_size[0] - 1, int(free_x)))
-                free_y = max(0, min(self.map_size[1] - 1, int(free_y)))
-                
-                self.grid_map[free_x, free_y] = 0  # Spazio libero
+    def apply_odometry(self, translation_cm: float, rotation_rad: float, dt: float):
+        """
+        Propaga la stima di posa con un delta misurato dall'odometria.
+        
+        Args:
+            translation_cm: Traslazione in avanti (cm, negativa = indietro)
+            rotation_rad: Rotazione (radianti, positiva = sinistra)
+            dt: Secondi di moto coperti dal delta
+        """
+        if translation_cm == 0.0 and rotation_rad == 0.0:
+            return
+        self.particle_filter.predict(translation_cm / 100.0 / self.map_resolution, rotation_rad, dt)
+    
+    def _localize(self, distance_cm, relative_angles=None):
+        """Corregge particelle con la lettura (o un ventaglio di letture) e aggiorna la posa stimata."""
+        self.particle_filter.update(self.grid_map, distance_cm, relative_angles)
+        x, y, theta = self.particle_filter.estimate()
+        
+        old_pos = self.robot_position
+        self.robot_position = [
+            max(0, min(self.map_size[0] - 1, int(round(x)))),
+            max(0, min(self.map_size[1] - 1, int(round(y))))
+        ]
+        self.robot_orientation = theta
+        self._cos_orientation = math.cos(theta)
+        self._sin_orientation = math.sin(theta)
+        self._last_orientation_update = theta
+        
+        distance_moved = math.hypot(self.robot_position[0] - old_pos[0], self.robot_position[1] - old_pos[1])
+        self.stats['distance_traveled'] += distance_moved * self.map_resolution
+    
+    def _correct_with_scan(self, distances_cm: np.ndarray, relative_angles: np.ndarray):
+        """Applica a posa e particelle la correzione trovata dallo scan matching."""
+        if self.scan_tracker is None:
+            return
+        
+        pose = (self.robot_position[0], self.robot_position[1], self.robot_orientation)
+        correction = self.scan_tracker.correct(
+            self.grid_map, self.distance_field.distance, pose, distances_cm, relative_angles
+        )
+        if correction is None:
+            return
+        
+        self.particle_filter.apply_correction(correction['dx'], correction['dy'], correction['dtheta'], pose[:2])
+        self.robot_position = [
+            max(0, min(self.map_size[0] - 1, int(round(pose[0] + correction['dx'])))),
+            max(0, min(self.map_size[1] - 1, int(round(pose[1] + correction['dy']))))
+        ]
+        theta = (self.robot_orientation + correction['dtheta'] + math.pi) % (2 * math.pi) - math.pi
+        self.robot_orientation = theta
+        self._cos_orientation = math.cos(theta)
+        self._sin_orientation = math.sin(theta)
+        self._last_orientation_update = theta
+    
+    def _update_map_with_sensor_data(self, distance_cm, relative_angles=None):
+        """
+        Aggiorna mappa con dati del sensore ultrasonico.
+        
+        Args:
+            distance_cm: Distanza (cm) o array di distanze per un ventaglio di raggi
+            relative_angles: Angoli dei raggi rispetto all'orientamento (radianti),
+                             None = singolo raggio frontale
+        """
+        distances = np.atleast_1d(np.asarray(distance_cm, dtype=np.float64))
+        
+        if relative_angles is None:
+            # Raggio frontale: usa cache trigonometriche
+            cos_a = np.full(distances.shape, self._cos_orientation)
+            sin_a = np.full(distances.shape, self._sin_orientation)
+        else:
+            angles = self.robot_orientation + np.atleast_1d(np.asarray(relative_angles, dtype=np.float64))
+            cos_a = np.cos(angles)
+            sin_a = np.sin(angles)
+        
+        # Converte distanze in pixels
+        distance_pixels = (distances / 100.0 / self.map_resolution).astype(int)
+        steps = np.maximum(1, distance_pixels)
+        
+        # Punti intermedi = spazio libero, tutti i raggi insieme (maschera per lunghezze diverse)
+        i = np.arange(steps.max() - 1)
+        inside_ray = i < (steps - 1)[:, None]
+        free_x = (self.robot_position[0] + i * cos_a[:, None])[inside_ray]
+        free_y = (self.robot_position[1] + i * sin_a[:, None])[inside_ray]
+        free_x = np.clip(free_x.astype(int), 0, self.map_size[0] - 1)
+        free_y = np.clip(free_y.astype(int), 0, self.map_size[1] - 1)
+        self._apply_cell_updates(free_x, free_y, 0)
+        
+        # Ultimo punto = ostacolo, solo se abbastanza vicino
+        near = distances < 300
+        if np.any(near):
+            obstacle_x = self.robot_position[0] + distance_pixels[near] * cos_a[near]
+            obstacle_y = self.robot_position[1] + distance_pixels[near] * sin_a[near]
+            
+            # Assicura che sia dentro la mappa
+            obstacle_x = np.clip(obstacle_x.astype(int), 0, self.map_size[0] - 1)
+            obstacle_y = np.clip(obstacle_y.astype(int), 0, self.map_size[1] - 1)
+            
+            self._apply_cell_updates(obstacle_x, obstacle_y, 1)
+    
+    def _apply_cell_updates(self, xs: np.ndarray, ys: np.ndarray, value: int):
+        """
+        Scrive celle nella griglia e propaga solo quelle cambiate agli indici incrementali.
+        
+        Args:
+            xs, ys: Coordinate celle (array di interi)
+            value: Nuovo valore (0=libero, 1=ostacolo)
+        """
+        if len(xs) == 0:
+            return
+        
+        changed = self.grid_map[xs, ys] != value
+        if not np.any(changed):
+            return
+        
+        xs = xs[changed]
+        ys = ys[changed]
+        old_values = self.grid_map[xs, ys]
+        self.grid_map[xs, ys] = value
+        
+        # Libero ↔ ostacolo su celle già note = l'ambiente è cambiato
+        self.change_map.record(xs, ys, old_values, value)
+        
+        if self.map_store is not None:
+            self.map_store.mark_dirty(xs, ys)
+        
+        self.frontier_detector.update_cells(self.grid_map, xs, ys)
+        self.distance_field.update_cells(xs, ys, value == 1)
+        
+        for listener in self._map_listeners:
+            try:
+                listener(self.grid_map, xs, ys)
+            except Exception as e:
+                self.logger.error(f"Errore map listener: {e}")
+    
+    def add_map_listener(self, callback):
+        """Aggiungi callback(grid_map, xs, ys) chiamata con le celle cambiate."""
+        self._map_listeners.append(callback)
+    
+    def add_relocalization_listener(self, callback):
+        """Aggiungi callback(to_map) chiamata quando si adotta una mappa salvata (to_map(x, y): sessione → mappa)."""
+        self._relocalization_listeners.append(callback)
+    
+    def nearest_frontiers(self, k: int = 1) -> List[Dict[str, Any]]:
+        """
+        Frontiere (confine libero/sconosciuto) più vicine al robot.
+        
+        Args:
+            k: Numero di zone da restituire
+            
+        Returns:
+            List[Dict]: Zone di frontiera con goal, centroid, size, distance_pixels
+        """
+        return self.frontier_detector.nearest_frontiers(self.robot_position, k)
+    
+    def get_light_around(self, distance_m: float = 0.5, radius_m: float = 0.4) -> Dict[str, Optional[float]]:
+        """
+        Luce ricordata a sinistra, davanti e a destra del robot.
+        
+        Returns:
+            dict: left/front/right → intensità media (None se zona mai vista)
+        """
+        return self.light_map.side_intensity(self.robot_position, self.robot_orientation, distance_m, radius_m)
+    
+    def get_trajectory(self, seconds: Optional[float] = None) -> np.ndarray:
+        """
+        Traiettoria recente (vista sul ring buffer, nessuna copia).
+        
+        Args:
+            seconds: Finestra temporale, None = tutto lo storico
+            
+        Returns:
+            numpy.ndarray: Array strutturato con campi x, y (pixel), theta, t
+        """
+        if seconds is None:
+            return self.position_history.last()
+        return self.position_history.window(time.time() - seconds)
+    
+    def recent_distance_traveled(self, seconds: float) -> float:
+        """Distanza percorsa (metri) negli ultimi seconds secondi."""
+        return self.position_history.path_length(self.get_trajectory(seconds)) * self.map_resolution
+    
+    def novelty_at(self, position: Optional[Tuple[int, int]] = None) -> float:
+        """
+        Novità di una zona (O(1)).
+        
+        Args:
+            position: (x, y) in pixel, default posizione robot
+            
+        Returns:
+            float: 1.0 = mai visitata, → 0 con molte visite
+        """
+        return self.visitation_map.novelty_at(position if position is not None else self.robot_position)
+    
+    def change_signal(self, position: Optional[Tuple[int, int]] = None, radius_m: float = 1.0) -> float:
+        """
+        Quanto è cambiata di recente la zona (0 = stabile, 1 = molto cambiata).
+        
+        Args:
+            position: Posizione in pixel (default: posizione robot)
+            radius_m: Raggio della zona considerata
+        """
+        if position is None:
+            position = self.robot_position
+        return self.change_map.change_signal(position, radius_m)
+    
+    def top_changed_regions(self, k: int = 5) -> List[Dict[str, Any]]:
+        """Le k zone dove la mappa è cambiata di più (calore decaduto)."""
+        return self.change_map.top_changes(k)
+    
+    def get_clearance(self, position: Optional[Tuple[int, int]] = None) -> float:
+        """
+        Distanza dall'ostacolo più vicino (O(1)).
+        
+        Args:
+            position: (x, y) in pixel, default posizione robot
+            
+        Returns:
+            float: Clearance in metri (saturata a distance_field_max)
+        """
+        x, y = position if position is not None else self.robot_position
+        return self.distance_field.clearance_at(int(x), int(y)) * self.map_resolution
     
     def _update_statistics(self):
         """Aggiorna statistiche della mappa."""
@@ -212,8 +822,8 @@ class SLAMSystem:
         explored_cells = total_cells - unknown_cells
         
         self.stats['explored_area_percent'] = (explored_cells / total_cells) * 100
-        self.stats['total_obstacles'] = np.sum(self.grid_map == 1)
-        self.stats['total_free_space'] = np.sum(self.grid_map == 0)
+        self.stats['total_obstacles'] = int(np.sum(self.grid_map == 1))
+        self.stats['total_free_space'] = int(np.sum(self.grid_map == 0))
         self.stats['last_update_time'] = time.time()
     
     async def get_current_state(self) -> Dict[str, Any]:
@@ -238,7 +848,22 @@ class SLAMSystem:
             'map_resolution': self.map_resolution,
             'simulation_mode': self.simulation_mode,
             'statistics': self.stats.copy(),
-            'position_history_length': len(self.position_history)
+            'position_history_length': len(self.position_history),
+            'localization': self.particle_filter.get_state(),
+            'frontiers': self.frontier_detector.get_state(),
+            'clearance_meters': self.get_clearance(),
+            'distance_field': self.distance_field.get_state(),
+            'light_map': self.light_map.get_state(),
+            'novelty': self.novelty_at(),
+            'visitation': self.visitation_map.get_state(),
+            'map_change': self.change_signal(),
+            'change_map': self.change_map.get_state(),
+            'scan_matching': self.scan_tracker.get_state() if self.scan_tracker is not None else None,
+            'map_library': {
+                'active_map_id': self.active_map_id,
+                'relocalizing': self._relocalization is not None,
+                **(self.map_library.get_state() if self.map_library is not None else {})
+            }
         }
     
     async def save_map(self, filename: str = None) -> bool:
@@ -262,16 +887,19 @@ class SLAMSystem:
             
             filepath = maps_dir / filename
             
-            # Salva mappa e metadata
-            np.savez_compressed(
+            # Salva mappa e metadata (compressione in un thread: non blocca l'event loop)
+            await asyncio.get_running_loop().run_in_executor(None, lambda: np.savez_compressed(
                 filepath,
                 grid_map=self.grid_map,
                 robot_position=self.robot_position,
                 robot_orientation=self.robot_orientation,
-                position_history=np.array(self.position_history) if self.position_history else np.array([]),
+                position_history=self.position_history.to_array(),
                 map_resolution=self.map_resolution,
-                statistics=self.stats
-            )
+                statistics=json.dumps(self.stats),  # JSON: load senza pickle
+                **self.light_map.to_arrays(),
+                **self.visitation_map.to_arrays(),
+                **self.change_map.to_arrays()
+            ))
             
             self.logger.info(f"Mappa salvata: {filepath}")
             return True
@@ -297,18 +925,43 @@ class SLAMSystem:
                 self.logger.error(f"File mappa non trovato: {filepath}")
                 return False
             
-            # Carica dati
+            # Carica dati (solo array: niente pickle)
             data = np.load(filepath)
+            if data['grid_map'].shape != self.grid_map.shape:
+                self.logger.error(f"Mappa {filepath} incompatibile: {data['grid_map'].shape} != {self.grid_map.shape}")
+                return False
             
-            self.grid_map = data['grid_map']
+            # Copia nella griglia esistente: listener, planner e campo distanze
+            # tengono riferimenti a questo array
+            changed_x, changed_y = np.nonzero(self.grid_map != data['grid_map'])
+            self.grid_map[...] = data['grid_map']
             self.robot_position = data['robot_position'].tolist()
             self.robot_orientation = float(data['robot_orientation'])
             
-            if 'position_history' in data and data['position_history'].size > 0:
-                self.position_history = data['position_history'].tolist()
+            if 'position_history' in data:
+                self.position_history.load_array(data['position_history'])
             
             if 'statistics' in data:
-                self.stats = data['statistics'].item()
+                try:
+                    self.stats.update(json.loads(str(data['statistics'])))
+                except ValueError:
+                    self.logger.warning("Statistiche mappa in formato vecchio (pickle) - ignorate")
+            
+            self.frontier_detector.rebuild(self.grid_map)
+            self.distance_field.rebuild(self.grid_map)
+            self.light_map.load_arrays(data)
+            if self.map_store is not None:
+                self.map_store.mark_all_dirty()
+            self.visitation_map.load_arrays(data)
+            self.change_map.load_arrays(data)
+            for listener in self._map_listeners:
+                try:
+                    listener(self.grid_map, changed_x, changed_y)
+                except Exception as e:
+                    self.logger.error(f"Errore map listener: {e}")
+            
+            # Riparti la localizzazione dalla posa salvata
+            self.particle_filter.reset((self.robot_position[0], self.robot_position[1], self.robot_orientation))
             
             self.logger.info(f"Mappa caricata: {filepath}")
             return True
@@ -339,7 +992,15 @@ class SLAMSystem:
     
     async def cleanup(self):
         """Cleanup finale del sistema SLAM."""
-        # Salva mappa finale
+        # Ultimo flush incrementale + mappa finale (anche in libreria per le prossime sessioni)
+        if self._relocalization is not None:
+            # Ambiente non ancora riconosciuto: non aggiungere un duplicato in libreria
+            self.logger.info("Relocalizzazione non conclusa - mappa non salvata in libreria")
+        else:
+            await self.save_to_library()
+        if self.map_store is not None:
+            await self.flush_map()
+            self.map_store.close()
         await self.save_map("final_map.npz")
         self.logger.info("SLAM System cleanup completato")
 
@@ -399,6 +1060,40 @@ async def test_slam_system(duration_seconds: int = 30):
     await slam.save_map("test_slam_map.npz")
     print("Mappa salvata in data/maps/test_slam_map.npz")
     
+    # Ricarica: stessa griglia (riferimenti dei listener validi), niente pickle
+    grid = slam.grid_map
+    saved = grid.copy()
+    grid[...] = -1
+    assert await slam.load_map("test_slam_map.npz")
+    assert slam.grid_map is grid and np.array_equal(grid, saved)
+    
+    # Mappa della libreria adottata: le celle viste in sessione restano (nel frame della mappa)
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        library = MapLibrary({'map_library': {'directory': directory}}, slam.map_size, slam.map_resolution)
+        library_grid = np.full(slam.map_size, -1, dtype=grid.dtype)
+        library_grid[100:300, 100:300] = 0
+        library_grid[100, 100:300] = 1
+        map_id = library.save(library_grid, (200.0, 200.0, 0.0))
+        
+        session = SLAMSystem(test_config, simulation_mode=True)
+        session.map_library = library
+        session.grid_map[...] = -1
+        session.grid_map[50:60, 50:60] = 0
+        session.grid_map[55, 65] = 1
+        session.robot_position = [50, 50]
+        reprojected = []
+        session.add_relocalization_listener(lambda to_map: reprojected.append(to_map(55, 65)))
+        # Posa di lancio (50, 50) = (200, 200) nella mappa salvata, ruotata di 90°
+        session._adopt_library_map({'map_id': map_id, 'x': 200.0, 'y': 200.0, 'theta': math.pi / 2,
+                                    'score': 1.0}, (50, 50, 0.0))
+        obstacle = tuple(int(round(v)) for v in reprojected[0])
+        print(f"Relocalizzazione: ostacolo sessione (55, 65) → {obstacle}, "
+              f"celle cambiate: {session.change_map.stats['active_cells']}")
+        assert obstacle == (185, 205) and session.grid_map[obstacle] == 1
+        assert np.all(session.grid_map[191:201, 200:210] == 0) and session.grid_map[100, 150] == 1
+        assert session.robot_position == [200, 200]
+    
     await slam.cleanup()
     print("Test completato!")
 
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Visitation Map - Robot AI Memory System
+=======================================
+
+Layer della mappa che conta quante volte il robot è passato da ogni zona.
+Serve a capire se un posto è "nuovo" o "già visto" senza scorrere tutto
+lo storico posizioni.
+
+In parole semplici:
+- Griglia grossolana (es. celle da 25cm): ogni volta che il robot entra
+  in una cella nuova, il contatore di quella cella sale di 1
+- novelty_at(pose) = 1/sqrt(1 + visite): 1.0 mai visto, scende con le visite.
+  È una lettura di array: O(1)
+- recently_seen_mask(): celle viste di recente, con memoria che decade
+  nel tempo (calcolata in modo vettorizzato dai timestamp)
+
+Author: Andrea Vavassori
+"""
+
+import logging
+import math
+import time
+from typing import Dict, Tuple, Optional, Any
+import numpy as np
+
+
+class VisitationMap:
+    """
+    Conteggio visite per cella + timestamp ultima visita.
+
+    Coordinate di input in pixel della mappa SLAM.
+    """
+
+    def __init__(self, config: dict, map_size: Tuple[int, int], map_resolution: float):
+        self.logger = logging.getLogger(__name__)
+
+        visit_config = config.get('visitation', {})
+
+        self.resolution = visit_config.get('resolution', 0.25)  # metri per cella
+        self.cell_size = max(1, int(round(self.resolution / map_resolution)))
+        self.recent_time = visit_config.get('recent_time', 120.0)  # secondi (costante di decadimento)
+
+        self.shape = (
+            int(math.ceil(map_size[0] / self.cell_size)),
+            int(math.ceil(map_size[1] / self.cell_size))
+        )
+
+        self.counts = np.zeros(self.shape, dtype=np.uint32)
+        self.last_visit = np.full(self.shape, -np.inf, dtype=np.float64)
+
+        self._current_cell: Optional[Tuple[int, int]] = None
+
+        self.stats = {
+            'visits': 0,
+            'cells_visited': 0
+        }
+
+    def _cell(self, position: Tuple[float, float]) -> Tuple[int, int]:
+        cx = min(max(int(position[0]) // self.cell_size, 0), self.shape[0] - 1)
+        cy = min(max(int(position[1]) // self.cell_size, 0), self.shape[1] - 1)
+        return cx, cy
+
+    def visit(self, position: Tuple[float, float], timestamp: Optional[float] = None):
+        """
+        Registra la posa corrente. Il contatore sale solo entrando in una cella
+        diversa (stare fermi non rende un posto "familiare").
+        """
+        now = time.time() if timestamp is None else timestamp
+        cell = self._cell(position)
+
+        if cell != self._current_cell:
+            if self.counts[cell] == 0:
+                self.stats['cells_visited'] += 1
+            self.counts[cell] += 1
+            self.stats['visits'] += 1
+            self._current_cell = cell
+
+        self.last_visit[cell] = now
+
+    def novelty_at(self, position: Tuple[float, float]) -> float:
+        """Novità della zona (1.0 = mai visitata, → 0 con molte visite). O(1)."""
+        return 1.0 / math.sqrt(1.0 + float(self.counts[self._cell(position)]))
+
+    def novelty_many(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Novità vettorizzata per molti punti (pixel SLAM)."""
+        cx = np.clip(np.asarray(xs, dtype=np.intp) // self.cell_size, 0, self.shape[0] - 1)
+        cy = np.clip(np.asarray(ys, dtype=np.intp) // self.cell_size, 0, self.shape[1] - 1)
+        return 1.0 / np.sqrt(1.0 + self.counts[cx, cy])
+
+    def recency(self, timestamp: Optional[float] = None) -> np.ndarray:
+        """Memoria di visita decaduta per cella: 1.0 appena visto, → 0 nel tempo."""
+        now = time.time() if timestamp is None else timestamp
+        return np.exp(-np.maximum(now - self.last_visit, 0.0) / self.recent_time)
+
+    def recently_seen_mask(self, threshold: float = 0.5, timestamp: Optional[float] = None) -> np.ndarray:
+        """Maschera bool (griglia grossolana) delle celle viste di recente."""
+        return self.recency(timestamp) >= threshold
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Array per salvataggio insieme alla mappa."""
+        return {
+            'visit_counts': self.counts,
+            'visit_last': self.last_visit
+        }
+
+    def load_arrays(self, data) -> bool:
+        """Ripristina il layer da array salvati (se compatibili)."""
+        if 'visit_counts' not in data or data['visit_counts'].shape != self.shape:
+            return False
+        self.counts[...] = data['visit_counts']
+        self.last_visit[...] = data['visit_last']
+        self._current_cell = None
+        self.stats['cells_visited'] = int(np.count_nonzero(self.counts))
+        self.stats['visits'] = int(self.counts.sum())
+        return True
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'shape': self.shape,
+            'resolution': self.resolution,
+            'stats': self.stats.copy()
+        }
+
+
+# Testing functions
+def test_visitation_map():
+    """Test: avanti e indietro su un corridoio, novità che scende."""
+    visits = VisitationMap({}, (2000, 2000), 0.05)
+
+    print("Testing VisitationMap...")
+    now = 0.0
+    for lap in range(4):
+        xs = np.arange(1000, 1100) if lap % 2 == 0 else np.arange(1099, 999, -1)
+        for x in xs:
+            visits.visit((x, 1000), now)
+            now += 0.1
+        print(f"  Giro {lap + 1}: novelty corridoio={visits.novelty_at((1050, 1000)):.2f}, "
+              f"zona nuova={visits.novelty_at((1500, 1500)):.2f}")
+
+    mask = visits.recently_seen_mask(0.5, now)
+    print(f"  Celle viste di recente: {int(mask.sum())}, stats: {visits.stats}")
+
+    start = time.perf_counter()
+    for _ in range(100000):
+        visits.novelty_at((1050, 1000))
+    print(f"  novelty_at: {(time.perf_counter() - start) / 100000 * 1e6:.2f}µs")
+
+
+if __name__ == "__main__":
+    test_visitation_map()
@@ -15,12 +15,16 @@ This module provides a unified interface for all perception capabilities.
 
 from .camera_handler import CameraHandler
 from .sensor_manager import SensorManager  
+from .range_simulator import SimulatedRangeSensor
+from .sonar_sweep import SonarSweep
 # from .vision_processor import VisionProcessor  # TODO: Implementare
 # from .motion_detector import MotionDetector    # TODO: Implementare
 
 __all__ = [
     'CameraHandler',
-    'SensorManager'
+    'SensorManager',
+    'SimulatedRangeSensor',
+    'SonarSweep'
     # 'VisionProcessor',  # TODO: Aggiungere quando implementato
     # 'MotionDetector'    # TODO: Aggiungere quando implementato
 ]
\ No newline at end of file
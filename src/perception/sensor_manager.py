@@ -19,7 +19,7 @@ import asyncio
 import logging
 import random
 import time
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any, Callable, Awaitable
 import statistics
 
 class SensorManager:
@@ -73,8 +73,15 @@ class SensorManager:
         self.sim_distance_base = 150.0  # cm - distanza base simulata
         self.sim_light_base = [500, 480, 520, 490]  # Valori base fotoresistori
         
+        # Sensore simulato su mondo ground truth (injected later)
+        self.range_simulator = None
+        self.pose_provider = None
+        
         # Arduino serial interface (injected later)
         self.arduino_serial = None
+        
+        # Lettura frontale delegata (SonarSweep sull'hardware: il servo non è sempre centrato)
+        self._front_reader: Optional[Callable[[], Awaitable[Optional[float]]]] = None
 
         self.logger.info(f"SensorManager inizializzato - Simulation: {simulation_mode}")
 
@@ -83,6 +90,30 @@ class SensorManager:
         self.arduino_serial = arduino_serial
         self.logger.info("Arduino serial connection configured for hardware sensors")
 
+    def set_front_reader(self, front_reader: Optional[Callable[[], Awaitable[Optional[float]]]]):
+        """
+        Delega read_distance a chi possiede il sensore (None = lettura diretta).
+        
+        Con lo sweep attivo una lettura diretta vedrebbe l'angolo corrente del
+        servo: il safety check e il loop principale la prenderebbero per frontale.
+        """
+        self._front_reader = front_reader
+    
+    def set_simulated_world(self, world_map, map_resolution: float, pose_provider):
+        """
+        Collega il sensore ultrasonico simulato a un mondo ground truth.
+        
+        Args:
+            world_map: Griglia del mondo vero (1=ostacolo)
+            map_resolution: Metri per pixel
+            pose_provider: Callable che restituisce (x, y, theta) del robot
+        """
+        from .range_simulator import SimulatedRangeSensor
+        
+        self.range_simulator = SimulatedRangeSensor({'hardware': self.config}, world_map, map_resolution)
+        self.pose_provider = pose_provider
+        self.logger.info("Sensore distanza simulato collegato al mondo ground truth")
+
     async def initialize(self) -> bool:
         """
         Inizializza interfacce hardware sensori.
@@ -128,6 +159,9 @@ class SensorManager:
             if self.simulation_mode:
                 # Mock data realistico per sviluppo
                 distance = self._generate_mock_distance()
+            elif self._front_reader is not None:
+                # Sweep attivo: lettura all'angolo centrale
+                distance = await self._front_reader()
             else:
                 # Lettura hardware reale
                 distance = await self._read_ultrasonic_hardware()
@@ -153,6 +187,20 @@ class SensorManager:
             self.logger.error(f"Errore lettura distanza: {e}")
             return None
     
+    async def read_ultrasonic(self) -> Optional[float]:
+        """
+        Lettura singola grezza dell'ultrasonico, senza smoothing né delega.
+        
+        Per chi muove il sensore (SonarSweep): letture ad angoli diversi non
+        vanno mediate tra loro.
+        
+        Returns:
+            float: Distanza in cm nella direzione corrente, None se errore
+        """
+        if self.simulation_mode:
+            return self._generate_mock_distance()
+        return await self._read_ultrasonic_hardware()
+    
     async def read_light_sensors(self) -> Optional[List[float]]:
         """
         Legge valori da tutti i fotoresistori.
@@ -193,6 +241,12 @@ class SensorManager:
     
     def _generate_mock_distance(self) -> float:
         """Genera distanza mock realistica per simulation."""
+        # Con un mondo simulato: ray casting dalla posa vera + rumore HC-SR04
+        if self.range_simulator is not None and self.pose_provider is not None:
+            x, y, theta = self.pose_provider()
+            return self.range_simulator.read(x, y, theta)
+        
+        # Senza mondo: distanze casuali attorno a una base
         # Simula movimento in ambiente con ostacoli
         variation = random.gauss(0, 20)  # Variazione ±20cm
         noise = random.gauss(0, 2)       # Noise sensore ±2cm
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Sonar Sweep - Robot AI Perception System
+========================================
+
+Fa ruotare il sensore ultrasonico col servo (MotorController.set_servo_angle,
+comando firmware SERVO:<angolo>)
+e raccoglie un "ventaglio" di letture invece di un solo raggio frontale.
+Ogni ventaglio completo va allo SLAM come un unico update multi-raggio.
+
+Scansione:
+- Ordine a "serpentina" (avanti e indietro): il primo angolo di un ventaglio
+  è l'ultimo del precedente, nessun ritorno a vuoto
+- Attesa di assestamento proporzionale all'ampiezza del movimento
+- Movimento + assestamento + lettura sotto un lock: ogni lettura porta
+  l'angolo a cui il servo era fermo in quel momento
+
+Sull'hardware lo sweep possiede il sensore: SensorManager.read_distance
+(loop principale, safety monitor) riceve l'ultima lettura all'angolo
+centrale se recente (front_max_age), altrimenti lo sweep si ferma tra
+due angoli, centra il servo e legge. Così la distanza "frontale" usata
+per sicurezza e decisioni non è mai un raggio laterale.
+
+In simulation non c'è servo: il ventaglio è calcolato in un solo batch
+dal sensore simulato (SimulatedRangeSensor) sulla posa vera.
+
+Author: Andrea Vavassori
+"""
+
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Any
+import numpy as np
+
+
+class SonarSweep:
+    """
+    Scheduler sweep servo + letture distanza → update SLAM batch.
+    """
+
+    def __init__(self, config: dict, sensor_manager, slam_system):
+        self.logger = logging.getLogger(__name__)
+
+        sweep_config = config.get('hardware', {}).get('ultrasonic', {}).get('sweep', {})
+
+        self.enabled = sweep_config.get('enabled', True)
+        self.angles = [int(a) for a in sweep_config.get('angles', [30, 60, 90, 120, 150])]
+        self.center_angle = sweep_config.get('center_angle', 90)
+        self.servo_direction = sweep_config.get('servo_direction', 1)  # +1: angolo > centro = sinistra
+        self.settle_time = sweep_config.get('settle_time', 0.02)  # secondi dopo ogni movimento
+        self.settle_per_degree = sweep_config.get('settle_per_degree', 0.001)  # secondi per grado
+        self.fan_interval = sweep_config.get('fan_interval', 0.1)  # pausa tra ventagli (simulation)
+        self.command_timeout = sweep_config.get('command_timeout', 1.0)
+        self.front_max_age = sweep_config.get('front_max_age', 0.5)  # secondi di validità lettura centrale
+
+        self.sensor_manager = sensor_manager
+        self.slam_system = slam_system
+
+        # Stato servo e pipeline
+        self.servo_angle = self.center_angle
+        self._reverse = False
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+        self._servo_lock = asyncio.Lock()  # Movimento + lettura atomici (sweep e letture frontali)
+
+        # Ultima lettura all'angolo centrale: distance_cm, servo_angle, timestamp
+        self.front: Optional[Dict[str, Any]] = None
+
+        self.stats = {
+            'fans': 0,
+            'readings': 0,
+            'failed_readings': 0,
+            'servo_errors': 0,
+            'front_reads': 0,  # Letture frontali che hanno dovuto centrare il servo
+            'last_fan_duration': 0.0,
+            'rays_per_second': 0.0
+        }
+
+    @property
+    def current_offset(self) -> float:
+        """Angolo corrente del sensore rispetto all'asse del robot (radianti)."""
+        return self.relative_angles([self.servo_angle])[0]
+
+    def relative_angles(self, servo_angles: List[float]) -> np.ndarray:
+        """Converte angoli servo (gradi) in angoli relativi al robot (radianti)."""
+        return self.servo_direction * np.radians(np.asarray(servo_angles, dtype=np.float64) - self.center_angle)
+
+    def _next_order(self) -> List[int]:
+        """Angoli del prossimo ventaglio, alternando il verso di percorrenza."""
+        order = list(reversed(self.angles)) if self._reverse else list(self.angles)
+        self._reverse = not self._reverse
+        return order
+
+    def _serial(self):
+        return getattr(self.sensor_manager, 'arduino_serial', None)
+
+    def _owns_sensor(self) -> bool:
+        """Sull'hardware servo e sensore sono dello sweep (in simulation no)."""
+        return self._serial() is not None and not self.sensor_manager.simulation_mode
+
+    async def _move_servo(self, angle: int) -> bool:
+        """Comanda il servo e attende conferma + assestamento."""
+        previous = self.servo_angle
+        if not await self._serial().set_servo_angle(angle, timeout=self.command_timeout):
+            self.stats['servo_errors'] += 1
+            self.logger.warning(f"Servo non ha confermato angolo {angle}")
+            return False
+
+        await asyncio.sleep(self.settle_time + self.settle_per_degree * abs(angle - previous))
+        self.servo_angle = angle  # Solo a servo fermo: è l'angolo delle letture
+        return True
+
+    async def _read_at(self, angle: int) -> Optional[float]:
+        """Porta il servo ad angle e legge (atomico rispetto alle altre letture)."""
+        async with self._servo_lock:
+            if angle != self.servo_angle and not await self._move_servo(angle):
+                return None
+            distance = await self.sensor_manager.read_ultrasonic()
+            if distance is not None and self.servo_angle == self.center_angle:
+                self.front = {
+                    'distance_cm': distance,
+                    'servo_angle': self.servo_angle,
+                    'timestamp': time.monotonic()
+                }
+            return distance
+
+    async def read_front(self) -> Optional[float]:
+        """
+        Distanza frontale per SensorManager.read_distance mentre lo sweep è attivo.
+
+        Ultima lettura all'angolo centrale se più recente di front_max_age,
+        altrimenti servo centrato e lettura nuova (lo sweep aspetta).
+        """
+        front = self.front
+        if front is not None and time.monotonic() - front['timestamp'] <= self.front_max_age:
+            return front['distance_cm']
+        self.stats['front_reads'] += 1
+        return await self._read_at(self.center_angle)
+
+    async def scan_fan(self) -> Optional[Dict[str, Any]]:
+        """
+        Esegue un ventaglio completo di letture.
+
+        Returns:
+            dict: servo_angles, relative_angles (rad), distances_cm; None se nessuna lettura
+        """
+        start = time.monotonic()
+
+        if self._owns_sensor():
+            fan = await self._scan_fan_hardware()
+        elif getattr(self.sensor_manager, 'range_simulator', None) is not None:
+            fan = self._scan_fan_simulated()
+        else:
+            self.logger.warning("Sweep non disponibile: né servo né mondo simulato")
+            return None
+
+        if fan is None or len(fan['distances_cm']) == 0:
+            return None
+
+        duration = time.monotonic() - start
+        self.stats['fans'] += 1
+        self.stats['readings'] += len(fan['distances_cm'])
+        self.stats['last_fan_duration'] = duration
+        if duration > 0:
+            self.stats['rays_per_second'] = len(fan['distances_cm']) / duration
+
+        return fan
+
+    async def _scan_fan_hardware(self) -> Optional[Dict[str, Any]]:
+        """Ventaglio reale: per ogni angolo movimento, assestamento e lettura."""
+        servo_angles = []
+        distances = []
+
+        for angle in self._next_order():
+            distance = await self._read_at(angle)
+            if distance is not None:
+                servo_angles.append(angle)
+                distances.append(distance)
+            else:
+                self.stats['failed_readings'] += 1
+
+        if not distances:
+            return None
+
+        return {
+            'servo_angles': servo_angles,
+            'relative_angles': self.relative_angles(servo_angles),
+            'distances_cm': np.asarray(distances, dtype=np.float64)
+        }
+
+    def _scan_fan_simulated(self) -> Dict[str, Any]:
+        """Ventaglio simulato: tutti i raggi in un solo batch vettorizzato."""
+        order = self._next_order()
+        relative = self.relative_angles(order)
+        x, y, theta = self.sensor_manager.pose_provider()
+
+        distances = self.sensor_manager.range_simulator.read_batch(x, y, theta + relative)
+        self.servo_angle = order[-1]
+
+        return {
+            'servo_angles': order,
+            'relative_angles': relative,
+            'distances_cm': distances
+        }
+
+    async def sweep_once(self) -> bool:
+        """Un ventaglio + integrazione batch nello SLAM."""
+        fan = await self.scan_fan()
+        if fan is None:
+            return False
+        return self.slam_system.update_with_scan(fan['distances_cm'], fan['relative_angles'])
+
+    async def _sweep_loop(self):
+        while self._running:
+            try:
+                ok = await self.sweep_once()
+                if not ok or self.sensor_manager.simulation_mode:
+                    await asyncio.sleep(self.fan_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Errore sweep sonar: {e}")
+                await asyncio.sleep(self.fan_interval)
+
+    async def start(self):
+        """Avvia sweep continuo in background."""
+        if not self.enabled or self._running:
+            return
+        if self._serial() is None and getattr(self.sensor_manager, 'range_simulator', None) is None:
+            self.logger.warning("Sonar sweep non avviato: né servo né mondo simulato disponibili")
+            return
+        self._running = True
+        if self._owns_sensor():
+            self.sensor_manager.set_front_reader(self.read_front)
+        self._task = asyncio.create_task(self._sweep_loop())
+        self.logger.info(f"Sonar sweep avviato - angoli: {self.angles}")
+
+    async def stop(self):
+        """Ferma lo sweep e ricentra il servo."""
+        self._running = False
+        if self._owns_sensor():
+            self.sensor_manager.set_front_reader(None)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._owns_sensor() and self.servo_angle != self.center_angle:
+            async with self._servo_lock:
+                await self._move_servo(self.center_angle)
+        self.servo_angle = self.center_angle
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            'running': self._running,
+            'servo_angle': self.servo_angle,
+            'current_offset_degrees': math.degrees(self.current_offset),
+            'front_age': None if self.front is None else time.monotonic() - self.front['timestamp'],
+            'stats': self.stats.copy()
+        }
+
+
+# Testing functions
+async def test_sonar_sweep(fans: int = 50):
+    """Test in simulation: copertura mappa sweep vs singolo raggio."""
+    import sys
+    from pathlib import Path
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from perception.sensor_manager import SensorManager
+    from memory.slam_system import SLAMSystem
+
+    config = {'ai': {'slam': {'map_size': [400, 400]}}, 'hardware': {}}
+
+    results = {}
+    for mode in ('single', 'sweep'):
+        slam = SLAMSystem(config, simulation_mode=True)
+        sensors = SensorManager(config, simulation_mode=True)
+        sensors.set_simulated_world(slam.world_map, slam.map_resolution, slam.get_simulated_pose)
+        sweep = SonarSweep(config, sensors, slam)
+
+        for _ in range(fans):
+            await slam._simulate_robot_movement()
+            if mode == 'single':
+                slam._update_map_with_sensor_data(await sensors.read_distance())
+            else:
+                await sweep.sweep_once()
+
+        slam._update_statistics()
+        results[mode] = slam.stats['explored_area_percent']
+
+    print("Testing SonarSweep (simulation)...")
+    print(f"  Esplorato con raggio singolo: {results['single']:.2f}%")
+    print(f"  Esplorato con sweep {len(sweep.angles)} raggi: {results['sweep']:.2f}%")
+    print(f"  Stato sweep: {sweep.get_state()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(test_sonar_sweep())